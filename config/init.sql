@@ -8,7 +8,8 @@ CREATE TABLE IF NOT EXISTS StoreCategory (
 CREATE TABLE IF NOT EXISTS StoreRegion (
     region_id SERIAL PRIMARY KEY,
     region_name VARCHAR(100) NOT NULL,
-    country VARCHAR(50) DEFAULT 'France'
+    country VARCHAR(50) DEFAULT 'France',
+    UNIQUE (region_name, country)
 );
 
 CREATE TABLE IF NOT EXISTS Store (
@@ -86,10 +87,16 @@ CREATE TABLE IF NOT EXISTS Shift (
     shift_date DATE NOT NULL,
     start_time TIME NOT NULL,
     end_time TIME NOT NULL,
+    -- The shift as a timestamp range, for index-backed interval joins with sales
+    shift_period TSRANGE GENERATED ALWAYS AS (tsrange(shift_date + start_time, shift_date + end_time)) STORED,
     FOREIGN KEY (staff_id) REFERENCES Staff(staff_id),
     FOREIGN KEY (store_id) REFERENCES Store(store_id)
 );
 
+-- btree_gist lets the GiST index combine the staff_id equality with the range containment
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+CREATE INDEX IF NOT EXISTS idx_shift_staff_period ON Shift USING GIST (staff_id, shift_period);
+
 -- Transaction-related tables
 CREATE TABLE IF NOT EXISTS PaymentMethod (
     payment_method_id SERIAL PRIMARY KEY,
@@ -126,6 +133,31 @@ CREATE TABLE IF NOT EXISTS TransactionItem (
     FOREIGN KEY (product_id) REFERENCES Product(product_id)
 );
 
+-- Lookup paths used by incremental loads and daily rollups
+CREATE INDEX IF NOT EXISTS idx_transaction_date_store ON Transaction (transaction_date, store_id);
+CREATE INDEX IF NOT EXISTS idx_transactionitem_transaction ON TransactionItem (transaction_id);
+-- Block-range index for date-range scans, effective once `ontodb layout` has ordered the heap by date
+CREATE INDEX IF NOT EXISTS idx_transaction_date_brin ON Transaction USING BRIN (transaction_date)
+    WITH (pages_per_range = 32, autosummarize = on);
+
+-- Daily per-store rollup, refreshed for the affected days by incremental loads
+CREATE TABLE IF NOT EXISTS DailySalesSummary (
+    store_id VARCHAR(50) NOT NULL,
+    sales_date DATE NOT NULL,
+    transaction_count INT NOT NULL,
+    item_count INT NOT NULL,
+    units_sold INT NOT NULL,
+    total_sales DECIMAL(12,2) NOT NULL,
+    PRIMARY KEY (store_id, sales_date),
+    FOREIGN KEY (store_id) REFERENCES Store(store_id)
+);
+
+-- Generation parameters of the loaded data (scale factor, seed), used to key snapshots
+CREATE TABLE IF NOT EXISTS DatasetInfo (
+    key VARCHAR(50) PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS Supplier (
     supplier_id SERIAL PRIMARY KEY,
     supplier_name VARCHAR(100) NOT NULL UNIQUE,
@@ -144,32 +176,8 @@ CREATE TABLE IF NOT EXISTS ProductSupplier (
 );
 
 
--- Default data
-INSERT INTO Currency (currency_code, currency_name, symbol) 
-VALUES ('EUR', 'Euro', '€'), ('USD', 'US Dollar', '$')
-ON CONFLICT (currency_code) DO NOTHING;
-
-INSERT INTO StoreCategory (category_name, description)
-VALUES ('Bakery', 'Traditional French bakery'),
-       ('Coffee Shop', 'Modern coffee and pastry shop')
-ON CONFLICT (category_name) DO NOTHING;
-
-INSERT INTO ProductCategory (category_name)
-VALUES ('Pastry'), ('Bread'), ('Coffee'), ('Tea'), ('Sandwich'), ('Cake')
-ON CONFLICT (category_name) DO NOTHING;
-
-INSERT INTO PaymentMethod (method_name)
-VALUES ('Cash'), ('Credit Card'), ('Debit Card'), ('Mobile Payment')
-ON CONFLICT (method_name) DO NOTHING;
-
-INSERT INTO StoreRegion (region_name, country)
-VALUES ('Paris', 'France'), ('Lyon', 'France'), ('Marseille', 'France')
-ON CONFLICT DO NOTHING;
-
-INSERT INTO StaffRole (role_name, hourly_rate)
-VALUES ('Cashier', 12.50), ('Barista', 14.00), ('Baker', 15.50), ('Manager', 20.00)
-ON CONFLICT (role_name) DO NOTHING;
-
+-- Lookup tables (Currency, StoreCategory, StoreRegion, ProductCategory, StaffRole,
+-- PaymentMethod) are seeded by src/scripts/data_population/reference_data.py
 INSERT INTO Supplier (name, contact_person, phone_number, street_address, country)
 VALUES
     ('Artisan Bakery Supplies', 'Marie Dupont', '+33123456789', '10 Rue de la Boulangerie, Paris', 'France'),
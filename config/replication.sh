@@ -0,0 +1,5 @@
+#!/bin/bash
+# Let the streaming replica (docker-compose --profile replica) connect for replication.
+# Runs once, when the primary's data directory is initialized.
+set -e
+echo "host replication ${POSTGRES_USER} all ${POSTGRES_HOST_AUTH_METHOD:-scram-sha-256}" >> "$PGDATA/pg_hba.conf"
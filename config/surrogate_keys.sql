@@ -0,0 +1,118 @@
+-- Switch an OntoDb schema created by init.sql to integer surrogate keys.
+--
+-- Store, Product and Transaction get INT/BIGINT keys in their store_id,
+-- product_id and transaction_id columns, and keep their business codes
+-- ('BAK001', 'B001', 'BTX-BAK001-20250301-0001') in store_code, product_code
+-- and transaction_code. Referencing columns keep their names but hold the
+-- integer keys, so joins are written exactly as before.
+--
+-- Keys are numbered in business code order, so converting the same data
+-- always yields the same keys. Applied in one transaction by
+-- `ontodb schema surrogate`.
+
+-- Foreign keys on the text keys
+ALTER TABLE Staff DROP CONSTRAINT IF EXISTS staff_store_id_fkey;
+ALTER TABLE Shift DROP CONSTRAINT IF EXISTS shift_store_id_fkey;
+ALTER TABLE Transaction DROP CONSTRAINT IF EXISTS transaction_store_id_fkey;
+ALTER TABLE DailySalesSummary DROP CONSTRAINT IF EXISTS dailysalessummary_store_id_fkey;
+ALTER TABLE ProductSupplier DROP CONSTRAINT IF EXISTS productsupplier_product_id_fkey;
+ALTER TABLE TransactionItem DROP CONSTRAINT IF EXISTS transactionitem_product_id_fkey;
+ALTER TABLE TransactionItem DROP CONSTRAINT IF EXISTS transactionitem_transaction_id_fkey;
+
+-- Store: store_id VARCHAR -> store_code, new INT store_id
+ALTER TABLE Store DROP CONSTRAINT store_pkey;
+ALTER TABLE Store RENAME COLUMN store_id TO store_code;
+ALTER TABLE Store ADD CONSTRAINT store_store_code_key UNIQUE (store_code);
+ALTER TABLE Store ADD COLUMN store_id INT;
+UPDATE Store s SET store_id = k.n
+FROM (SELECT store_code, row_number() OVER (ORDER BY store_code) AS n FROM Store) k
+WHERE k.store_code = s.store_code;
+ALTER TABLE Store ALTER COLUMN store_id SET NOT NULL;
+ALTER TABLE Store ALTER COLUMN store_id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('store', 'store_id'), COALESCE(MAX(store_id), 0) + 1, false) FROM Store;
+ALTER TABLE Store ADD PRIMARY KEY (store_id);
+
+-- Product: product_id VARCHAR -> product_code, new INT product_id
+ALTER TABLE Product DROP CONSTRAINT product_pkey;
+ALTER TABLE Product RENAME COLUMN product_id TO product_code;
+ALTER TABLE Product ADD CONSTRAINT product_product_code_key UNIQUE (product_code);
+ALTER TABLE Product ADD COLUMN product_id INT;
+UPDATE Product p SET product_id = k.n
+FROM (SELECT product_code, row_number() OVER (ORDER BY product_code) AS n FROM Product) k
+WHERE k.product_code = p.product_code;
+ALTER TABLE Product ALTER COLUMN product_id SET NOT NULL;
+ALTER TABLE Product ALTER COLUMN product_id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('product', 'product_id'), COALESCE(MAX(product_id), 0) + 1, false) FROM Product;
+ALTER TABLE Product ADD PRIMARY KEY (product_id);
+
+-- Transaction: transaction_id VARCHAR -> transaction_code, new BIGINT transaction_id
+ALTER TABLE Transaction DROP CONSTRAINT transaction_pkey;
+ALTER TABLE Transaction RENAME COLUMN transaction_id TO transaction_code;
+ALTER TABLE Transaction ADD CONSTRAINT transaction_transaction_code_key UNIQUE (transaction_code);
+ALTER TABLE Transaction ADD COLUMN transaction_id BIGINT;
+UPDATE Transaction t SET transaction_id = k.n
+FROM (SELECT transaction_code, row_number() OVER (ORDER BY transaction_code) AS n FROM Transaction) k
+WHERE k.transaction_code = t.transaction_code;
+ALTER TABLE Transaction ALTER COLUMN transaction_id SET NOT NULL;
+ALTER TABLE Transaction ALTER COLUMN transaction_id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('transaction', 'transaction_id'), COALESCE(MAX(transaction_id), 0) + 1, false) FROM Transaction;
+ALTER TABLE Transaction ADD PRIMARY KEY (transaction_id);
+
+-- Referencing columns: replace the codes with the integer keys
+ALTER TABLE Staff ADD COLUMN store_key INT;
+UPDATE Staff x SET store_key = s.store_id FROM Store s WHERE s.store_code = x.store_id;
+ALTER TABLE Staff DROP COLUMN store_id;
+ALTER TABLE Staff RENAME COLUMN store_key TO store_id;
+ALTER TABLE Staff ALTER COLUMN store_id SET NOT NULL;
+
+ALTER TABLE Shift ADD COLUMN store_key INT;
+UPDATE Shift x SET store_key = s.store_id FROM Store s WHERE s.store_code = x.store_id;
+ALTER TABLE Shift DROP COLUMN store_id;
+ALTER TABLE Shift RENAME COLUMN store_key TO store_id;
+ALTER TABLE Shift ALTER COLUMN store_id SET NOT NULL;
+
+ALTER TABLE Transaction ADD COLUMN store_key INT;
+UPDATE Transaction x SET store_key = s.store_id FROM Store s WHERE s.store_code = x.store_id;
+ALTER TABLE Transaction DROP COLUMN store_id;
+ALTER TABLE Transaction RENAME COLUMN store_key TO store_id;
+ALTER TABLE Transaction ALTER COLUMN store_id SET NOT NULL;
+
+ALTER TABLE DailySalesSummary ADD COLUMN store_key INT;
+UPDATE DailySalesSummary x SET store_key = s.store_id FROM Store s WHERE s.store_code = x.store_id;
+ALTER TABLE DailySalesSummary DROP COLUMN store_id;
+ALTER TABLE DailySalesSummary RENAME COLUMN store_key TO store_id;
+ALTER TABLE DailySalesSummary ALTER COLUMN store_id SET NOT NULL;
+ALTER TABLE DailySalesSummary ADD PRIMARY KEY (store_id, sales_date);
+
+ALTER TABLE ProductSupplier ADD COLUMN product_key INT;
+UPDATE ProductSupplier x SET product_key = p.product_id FROM Product p WHERE p.product_code = x.product_id;
+ALTER TABLE ProductSupplier DROP COLUMN product_id;
+ALTER TABLE ProductSupplier RENAME COLUMN product_key TO product_id;
+ALTER TABLE ProductSupplier ALTER COLUMN product_id SET NOT NULL;
+ALTER TABLE ProductSupplier ADD PRIMARY KEY (product_id, supplier_id);
+
+ALTER TABLE TransactionItem ADD COLUMN product_key INT, ADD COLUMN transaction_key BIGINT;
+UPDATE TransactionItem x SET product_key = p.product_id, transaction_key = t.transaction_id
+FROM Product p, Transaction t
+WHERE p.product_code = x.product_id AND t.transaction_code = x.transaction_id;
+ALTER TABLE TransactionItem DROP COLUMN product_id, DROP COLUMN transaction_id;
+ALTER TABLE TransactionItem RENAME COLUMN product_key TO product_id;
+ALTER TABLE TransactionItem RENAME COLUMN transaction_key TO transaction_id;
+ALTER TABLE TransactionItem ALTER COLUMN product_id SET NOT NULL, ALTER COLUMN transaction_id SET NOT NULL;
+ALTER TABLE TransactionItem ALTER COLUMN item_id TYPE BIGINT;
+ALTER SEQUENCE transactionitem_item_id_seq AS BIGINT;
+
+-- Foreign keys and lookup paths on the integer keys
+ALTER TABLE Staff ADD CONSTRAINT staff_store_id_fkey FOREIGN KEY (store_id) REFERENCES Store(store_id);
+ALTER TABLE Shift ADD CONSTRAINT shift_store_id_fkey FOREIGN KEY (store_id) REFERENCES Store(store_id);
+ALTER TABLE Transaction ADD CONSTRAINT transaction_store_id_fkey FOREIGN KEY (store_id) REFERENCES Store(store_id);
+ALTER TABLE DailySalesSummary ADD CONSTRAINT dailysalessummary_store_id_fkey FOREIGN KEY (store_id) REFERENCES Store(store_id);
+ALTER TABLE ProductSupplier ADD CONSTRAINT productsupplier_product_id_fkey FOREIGN KEY (product_id) REFERENCES Product(product_id);
+ALTER TABLE TransactionItem ADD CONSTRAINT transactionitem_product_id_fkey FOREIGN KEY (product_id) REFERENCES Product(product_id);
+ALTER TABLE TransactionItem ADD CONSTRAINT transactionitem_transaction_id_fkey FOREIGN KEY (transaction_id) REFERENCES Transaction(transaction_id);
+
+CREATE INDEX IF NOT EXISTS idx_transaction_date_store ON Transaction (transaction_date, store_id);
+CREATE INDEX IF NOT EXISTS idx_transactionitem_transaction ON TransactionItem (transaction_id);
+
+INSERT INTO DatasetInfo (key, value) VALUES ('schema_mode', 'surrogate')
+ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
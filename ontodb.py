@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Single entry point for the OntoDb tooling.
+
+Subcommands are resolved lazily: only the module implementing the chosen
+command is imported, so ``ontodb --help`` and light commands never pay for
+pandas, numpy, tqdm or psycopg2.
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(ROOT_DIR, 'src', 'scripts')
+
+# Command name -> (module, function, help). Each function takes the remaining argv.
+COMMANDS = {
+    'setup': ('setup_database', 'main', 'Start the PostgreSQL container and wait until it is ready'),
+    'reset': ('reset_database', 'main', 'Recreate the database container with an empty database'),
+    'populate': ('data_population.run_population', 'main', 'Populate the tables with generated sample data'),
+    'ingest': ('data_population.incremental_load', 'main', 'Incrementally load new sales (CSV files or generated days)'),
+    'parse': ('raw_parser', 'main', 'Parse the raw bakery sales CSV into typed values, with a reject file'),
+    'query': ('run_queries', 'main', 'Show table contents and run the analytical queries'),
+    'search': ('product_search', 'main', 'Find products by partial or misspelt names'),
+    'productivity': ('staff_productivity', 'main', 'Sales per staff-hour from shifts and transactions'),
+    'offline': ('offline', 'main', 'Run the reports and ad-hoc SQL in DuckDB over a local Parquet snapshot'),
+    'perf': ('perf_report', 'main', 'Report slow statements, unused indexes, cache hit ratios and slow plans'),
+    'serve': ('api_server', 'main', 'Serve the reports and sales metrics as a JSON HTTP API'),
+    'basket': ('basket_analysis', 'main', 'Product associations (support, confidence, lift) from basket co-occurrence'),
+    'export': ('export_data', 'main', 'Export tables to CSV files'),
+    'conform': ('conformance', 'main', 'Check the data against the domains and ranges declared in mapping.ttl'),
+    'schema': ('schema_mode', 'main', 'Show or switch the key schema mode (natural or integer surrogate keys)'),
+    'layout': ('maintenance.layout', 'main', 'Order the fact tables by date and store, maintain BRIN indexes, VACUUM ANALYZE'),
+    'archive': ('maintenance.archive', 'main', 'Move old months of sales to compressed Parquet and query hot and archived sales'),
+    'snapshot': ('maintenance.snapshot', 'main', 'Save or restore populated database snapshots'),
+    'bench': ('benchmark', 'main', 'Run benchmarks'),
+}
+
+# Modules whose presence after a run is worth pointing out in --profile-imports
+HEAVY_MODULES = ('pandas', 'numpy', 'tqdm', 'psycopg2', 'tabulate')
+
+def build_parser():
+    """Build the top-level parser; subcommand options are parsed by the subcommand itself"""
+    width = max(len(name) for name in COMMANDS)
+    parser = argparse.ArgumentParser(
+        prog='ontodb',
+        description='OntoDb database tooling',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join(f"  {name:<{width}}  {help_text}"
+                                          for name, (_, _, help_text) in COMMANDS.items())
+               + "\n\nRun 'ontodb <command> --help' for the options of a command.",
+    )
+    parser.add_argument('--profile-imports', action='store_true',
+                        help='Run the command with -X importtime and summarize import costs')
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help='Command to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return parser
+
+def profile_imports(argv, top=15):
+    """Re-run this entry point under -X importtime and print the most expensive imports"""
+    import subprocess
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), *argv],
+                            stderr=subprocess.PIPE, text=True)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            sys.stderr.write(line + '\n')
+            continue
+        if 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    # Top-level imports are the ones without nesting indentation
+    top_level = sorted((i for i in imports if not i[2].startswith('  ')), key=lambda i: i[1], reverse=True)
+    loaded = {name.strip().split('.')[0] for _, _, name in imports}
+
+    print("\n===== Import profile =====", file=sys.stderr)
+    print(f"Wall time: {elapsed_ms:.1f} ms, {len(imports)} modules imported, "
+          f"{sum(i[0] for i in imports) / 1000:.1f} ms spent importing", file=sys.stderr)
+    print(f"Heavy modules loaded: {', '.join(m for m in HEAVY_MODULES if m in loaded) or 'none'}", file=sys.stderr)
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module", file=sys.stderr)
+    for self_us, cumulative_us, name in top_level[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name.strip()}", file=sys.stderr)
+    return result.returncode
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+
+    if args.profile_imports:
+        # Only the top-level flag is dropped; the subcommand's own arguments pass through unchanged
+        return profile_imports([args.command, *args.args])
+
+    for path in (SCRIPTS_DIR, ROOT_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    # Subcommand parsers derive their usage line from argv[0]
+    sys.argv[0] = f"ontodb {args.command}"
+    module_name, function_name, _ = COMMANDS[args.command]
+    function = getattr(importlib.import_module(module_name), function_name)
+    return function(args.args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
+import argparse
 import os
 import sys
 import subprocess
 import time
-import psycopg2
 
 def check_docker_running():
     """Check if Docker is running on the system"""
@@ -68,6 +68,8 @@ def reset_database():
 
 def wait_for_db(host, dbname, user, password, port=5432, max_attempts=30):
     """Wait for database to be available"""
+    import psycopg2
+
     print(f"Waiting for PostgreSQL to be ready at {host}:{port}...")
     
     for attempt in range(1, max_attempts + 1):
@@ -89,7 +91,12 @@ def wait_for_db(host, dbname, user, password, port=5432, max_attempts=30):
     print("Database connection failed after multiple attempts.")
     return False
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recreate the OntoDb PostgreSQL container with an empty database')
+    parser.add_argument('--yes', action='store_true',
+                        help='Do not ask for confirmation before deleting all data')
+    args = parser.parse_args(argv)
+    
     # Check if Docker is running
     if not check_docker_running():
         print("Error: Docker does not appear to be running.")
@@ -97,10 +104,11 @@ def main():
         return
     
     # Confirm reset
-    response = input("This will reset your database and DELETE ALL DATA. Continue? (y/N): ")
-    if response.lower() != 'y':
-        print("Operation cancelled.")
-        return
+    if not args.yes:
+        response = input("This will reset your database and DELETE ALL DATA. Continue? (y/N): ")
+        if response.lower() != 'y':
+            print("Operation cancelled.")
+            return
     
     # Reset the database
     if not reset_database():
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
+import argparse
 import os
 import sys
 import subprocess
 import time
-import psycopg2
 
 def check_docker_running():
     """Check if Docker is running on the system"""
@@ -49,6 +49,8 @@ def start_database():
 
 def wait_for_db(host, dbname, user, password, port=5432, max_attempts=30):
     """Wait for database to be available"""
+    import psycopg2
+
     print(f"Waiting for PostgreSQL to be ready at {host}:{port}...")
     
     for attempt in range(1, max_attempts + 1):
@@ -70,7 +72,10 @@ def wait_for_db(host, dbname, user, password, port=5432, max_attempts=30):
     print("Database connection failed after multiple attempts.")
     return False
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Start the OntoDb PostgreSQL container and wait until it accepts connections')
+    args = parser.parse_args(argv)
+    
     # Check if Docker is running
     if not check_docker_running():
         print("Error: Docker does not appear to be running.")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Small asyncio HTTP API over the OntoDb reports and sales metrics.
+
+Endpoints (GET, JSON):
+
+    /health                     liveness
+    /reports                    names of the analytical reports
+    /reports/<name>             one report of reports.py
+    /sales?start=&end=&group=   sales metrics between two dates, grouped by
+                                day, store or source
+
+The server is a plain asyncio stream server with HTTP/1.1 keep-alive. Queries
+run on a psycopg2 connection pool through a thread pool executor, so the event
+loop never blocks on the database. Responses are cached in memory for --ttl
+seconds; concurrent requests for the same uncached URL share one query, and
+every response carries an ETag so clients can revalidate with If-None-Match.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import add_db_arguments, params_from_args, read_params
+from query_cache import MemoryCache
+from reports import REPORTS
+from schema_mode import code_column, detect_schema_mode
+
+DEFAULT_PORT = 8080
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TTL = 5.0
+# Seconds between checks of which server (replica or primary) the pool should read from
+REPLICA_CHECK_SECONDS = 5.0
+
+# group -> grouping column of the sales metrics
+SALES_GROUPS = {
+    'day': 't.transaction_date',
+    'store': 's.{store_code}',
+    'source': 't.data_source',
+}
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+def json_default(value):
+    """Amounts become JSON numbers, dates and times ISO strings"""
+    return float(value) if isinstance(value, Decimal) else str(value)
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def sales_query(mode, group):
+    """Return the date-bounded sales metrics query grouped by day, store or source"""
+    column = SALES_GROUPS[group].format(store_code=code_column(mode, 'Store'))
+    return f"""
+        SELECT {column} AS {group}, COUNT(*) AS transactions, SUM(t.total_amount) AS sales,
+               ROUND(AVG(t.total_amount), 2) AS average_ticket
+        FROM Transaction t
+        JOIN Store s ON s.store_id = t.store_id
+        WHERE t.transaction_date BETWEEN %(start)s AND %(end)s
+        GROUP BY {column}
+        ORDER BY {column}
+    """
+
+class Api:
+    """Request routing, the connection pool and the response cache"""
+
+    def __init__(self, params, pool_size=DEFAULT_POOL_SIZE, ttl=DEFAULT_TTL, cache_entries=1024):
+        self.params = params
+        self.pool_size = pool_size
+        # One pool per server read from; queries use the replica's while it is fresh, else the primary's
+        self.pools = {}
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.next_check = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        self.ttl = ttl
+        self.cache = MemoryCache(cache_entries)
+        self.inflight = {}
+        self.mode = self.run_sync(detect_schema_mode)
+
+    def run_sync(self, work):
+        """Run work(cursor) on a pooled connection (blocking; called on the executor)
+
+        A connection broken by a database restart is dropped from the pool, and
+        the work, which only reads, is retried once on a new connection.
+        """
+        import psycopg2
+
+        pool = self.current_pool()
+        for attempt in range(2):
+            conn = pool.getconn()
+            broken = False
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    return work(cursor)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                if attempt or not conn.closed:
+                    raise
+            finally:
+                pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def current_pool(self):
+        """Return the pool to read from, re-checking the replica's lag every REPLICA_CHECK_SECONDS"""
+        if time.monotonic() < self.next_check:
+            return self.pool
+        with self.pool_lock:
+            if time.monotonic() >= self.next_check:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                target = read_params(self.params)
+                key = (target['host'], target['port'])
+                if key not in self.pools:
+                    self.pools[key] = ThreadedConnectionPool(1, self.pool_size, **target)
+                if self.pool is not None and self.pool is not self.pools[key]:
+                    print(f"Reading from {key[0]}:{key[1]}", file=sys.stderr)
+                self.pool = self.pools[key]
+                self.next_check = time.monotonic() + REPLICA_CHECK_SECONDS
+        return self.pool
+
+    async def query(self, sql, params=None):
+        def work(cursor):
+            cursor.execute(sql, params)
+            return [d[0] for d in cursor.description], cursor.fetchall()
+        loop = asyncio.get_running_loop()
+        columns, rows = await loop.run_in_executor(self.executor, self.run_sync, work)
+        return {'columns': columns, 'rows': rows}
+
+    async def handle(self, path, query):
+        """Return the JSON-serializable result for a path"""
+        if path == '/health':
+            return {'status': 'ok'}
+        if path == '/reports':
+            return {'reports': list(REPORTS)}
+        if path.startswith('/reports/'):
+            name = path[len('/reports/'):]
+            if name not in REPORTS:
+                raise ApiError(404, f"unknown report '{name}'")
+            return await self.query(REPORTS[name][1](self.mode))
+        if path == '/sales':
+            group = query.get('group', 'day')
+            if group not in SALES_GROUPS:
+                raise ApiError(400, f"group must be one of {', '.join(SALES_GROUPS)}")
+            try:
+                bounds = {'start': date.fromisoformat(query.get('start', date.min.isoformat())),
+                          'end': date.fromisoformat(query.get('end', date.max.isoformat()))}
+            except ValueError:
+                raise ApiError(400, "start and end must be YYYY-MM-DD dates")
+            return await self.query(sales_query(self.mode, group), bounds)
+        raise ApiError(404, f"no endpoint {path}")
+
+    async def cached_response(self, target):
+        """Return (status, body, etag) for a request target, from the cache when fresh"""
+        entry = self.cache.get(target)
+        if entry is not None and entry['expires'] > time.monotonic():
+            return entry['status'], entry['body'], entry['etag']
+
+        # Concurrent misses for the same target wait for the first one
+        while target in self.inflight:
+            leader = self.inflight[target]
+            try:
+                return await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                # The first request was cancelled (its client went away): take over
+                if not leader.cancelled():
+                    raise
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[target] = future
+        try:
+            url = urlsplit(target)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, payload = 200, await self.handle(url.path, query)
+            except ApiError as e:
+                status, payload = e.status, {'error': str(e)}
+            body = json.dumps(payload, default=json_default).encode('utf-8')
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            if status == 200 and self.ttl > 0:
+                self.cache.put(target, {'status': status, 'body': body, 'etag': etag,
+                                        'expires': time.monotonic() + self.ttl})
+            future.set_result((status, body, etag))
+            return status, body, etag
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+        finally:
+            # CancelledError is not an Exception: wake the waiters instead of leaving them hanging
+            if not future.done():
+                future.cancel()
+            del self.inflight[target]
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    break
+                # Bodies are not used, but must be consumed to keep the connection in sync
+                if length:
+                    await reader.readexactly(length)
+
+                if method != 'GET':
+                    status, body, etag = 405, b'{"error": "only GET is supported"}', None
+                else:
+                    try:
+                        status, body, etag = await self.cached_response(target)
+                    except Exception as e:
+                        status, body, etag = 500, json.dumps({'error': str(e)}).encode('utf-8'), None
+                if etag and status == 200 and headers.get('if-none-match') == etag:
+                    status, body = 304, b''
+
+                # A chunked body cannot be skipped without decoding it, so the connection ends here
+                keep_alive = (headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                              and 'transfer-encoding' not in headers)
+                head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(body)}",
+                        f"Cache-Control: max-age={int(self.ttl)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                if etag:
+                    head.append(f"ETag: {etag}")
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.executor.shutdown()
+        for pool in self.pools.values():
+            pool.closeall()
+
+async def serve(api, host, port):
+    server = await asyncio.start_server(api.serve_connection, host, port, backlog=1024)
+    print(f"Serving the OntoDb API on http://{host}:{port} (ttl {api.ttl:g}s)")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the OntoDb reports and sales metrics over HTTP')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--listen-port', type=int, default=DEFAULT_PORT,
+                        help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help=f'Database connections (default: {DEFAULT_POOL_SIZE})')
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL,
+                        help=f'Seconds responses are cached, 0 to disable (default: {DEFAULT_TTL:g})')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        api = Api(params_from_args(args), args.pool_size, args.ttl)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+    try:
+        asyncio.run(serve(api, args.bind, args.listen_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+    return 0
+
+async def load_client(host, port, targets, offset, deadline, latencies, errors):
+    """One keep-alive client requesting targets round-robin, starting at offset, until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            target = targets[i % len(targets)]
+            i += 1
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+def bench(argv=None):
+    """Run the API in a subprocess and measure sustained requests/s and tail latency"""
+    import subprocess
+    import urllib.request
+    from pos_simulator import percentile
+
+    parser = argparse.ArgumentParser(prog='ontodb bench api', description='Load test of the HTTP API')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent keep-alive connections (default: 32)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load (default: 10)')
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL, help=f'Server response TTL (default: {DEFAULT_TTL:g}, 0 disables caching)')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help=f'Server connections (default: {DEFAULT_POOL_SIZE})')
+    parser.add_argument('--listen-port', type=int, default=DEFAULT_PORT + 1, help=f'Port of the server under test (default: {DEFAULT_PORT + 1})')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    db_args = [f"--{name}={value}" for name in ('host', 'port', 'dbname', 'user', 'password')
+               if (value := getattr(args, name)) is not None]
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--listen-port', str(args.listen_port),
+                               '--ttl', str(args.ttl), '--pool-size', str(args.pool_size), *db_args],
+                              stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{args.listen_port}"
+    try:
+        for _ in range(100):
+            try:
+                with urllib.request.urlopen(base + '/health', timeout=1):
+                    break
+            except OSError:
+                if server.poll() is not None:
+                    print("Error: the API server exited during startup")
+                    return 1
+                time.sleep(0.1)
+
+        with urllib.request.urlopen(base + '/sales?group=day', timeout=30) as response:
+            days = [row[0] for row in json.load(response)['rows']]
+        targets = [f"/reports/{name}" for name in REPORTS] + ['/sales?group=store', '/sales?group=source']
+        # Rolling one-week windows, as a dashboard would request them
+        targets += [f"/sales?start={days[i]}&end={days[min(i + 6, len(days) - 1)]}&group=store"
+                    for i in range(0, len(days), 7)]
+
+        latencies, errors = [], []
+        async def run():
+            deadline = time.perf_counter() + args.duration
+            await asyncio.gather(*(load_client('127.0.0.1', args.listen_port, targets, i, deadline, latencies, errors)
+                                   for i in range(args.clients)))
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    ms = [latency * 1000 for latency in latencies]
+    print(f"{len(latencies)} requests over {len(targets)} URLs in {elapsed:.1f}s with {args.clients} clients "
+          f"(ttl {args.ttl:g}s): {len(latencies) / elapsed:,.0f} requests/s")
+    print(f"latency ms: p50 {percentile(ms, 0.50):.2f}, p95 {percentile(ms, 0.95):.2f}, "
+          f"p99 {percentile(ms, 0.99):.2f}, max {max(ms, default=0):.2f}")
+    if errors:
+        print(f"{len(errors)} non-200 responses")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Approximate answers for exploratory reports on large fact tables.
+
+Sums, counts and averages are estimated from a TABLESAMPLE of the fact table.
+SYSTEM sampling reads a fraction of the table's pages, BERNOULLI reads every
+page and keeps a fraction of the rows. Totals are scaled by 1/p
+(Horvitz-Thompson). Their 95% confidence intervals come from the variance
+across the sampling units: the sampled pages for SYSTEM, the rows for
+BERNOULLI. Averages are ratio estimates, with the linearized variance of the
+ratio.
+
+Distinct tickets and products per store come from HyperLogLog sketches kept
+in SalesSketch, one per store, day and metric. The registers are computed in
+SQL from 64-bit hashtextextended() values and stored as bytea. Merging the
+days of a period is an element-wise max, so any date range is answered from
+the per-day sketches without rescanning the facts. New days are sketched
+lazily, on the first approximate query after they are loaded.
+"""
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from schema_mode import code_column
+
+SAMPLING_METHODS = ['system', 'bernoulli']
+
+Z_95 = 1.96
+
+# HyperLogLog precision: 2^12 one-byte registers (4 KiB) per sketch, standard error 1.04 / sqrt(2^12) = 1.6%
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_RELATIVE_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+
+# Metric -> SELECT of (store code, day, value to count) over the fact tables
+SKETCH_METRICS = {
+    'tickets': """
+        SELECT s.{store_code}, t.transaction_date, t.transaction_id::text
+        FROM Transaction t JOIN Store s ON s.store_id = t.store_id
+        WHERE t.transaction_date >= %(start)s
+    """,
+    'products': """
+        SELECT s.{store_code}, t.transaction_date, i.product_id::text
+        FROM TransactionItem i
+        JOIN Transaction t ON t.transaction_id = i.transaction_id
+        JOIN Store s ON s.store_id = t.store_id
+        WHERE t.transaction_date >= %(start)s
+    """,
+}
+
+# Keyed by the store code so the sketches survive a switch of schema mode
+CREATE_SKETCH_TABLE = """
+    CREATE TABLE IF NOT EXISTS SalesSketch (
+        store_code VARCHAR(50) NOT NULL,
+        sales_date DATE NOT NULL,
+        metric VARCHAR(20) NOT NULL,
+        registers BYTEA NOT NULL,
+        PRIMARY KEY (store_code, sales_date, metric)
+    )
+"""
+
+def sample_clause(method, percent, seed=None):
+    repeatable = f" REPEATABLE ({int(seed)})" if seed is not None else ''
+    return f"TABLESAMPLE {method.upper()} ({float(percent)}){repeatable}"
+
+def sampled_totals_sql(source, alias, group, value, method):
+    """Return the per-group sample sums (n, y, sum n^2, sum y^2, sum y*n) over the sampling units"""
+    # A SYSTEM sample draws whole pages, so the page is the sampling unit
+    unit = f"({alias}.ctid::text::point)[0]" if method == 'system' else f"{alias}.ctid"
+    return f"""
+        WITH units AS (
+            SELECT {group} AS grp, {unit} AS unit, COUNT(*) AS n, SUM({value}) AS y
+            FROM {source}
+            GROUP BY 1, 2
+        )
+        SELECT grp, SUM(n), SUM(y), SUM(n * n), SUM(y * y), SUM(y * n)
+        FROM units GROUP BY grp ORDER BY grp
+    """
+
+def estimate(n, y, nn, yy, yn, fraction):
+    """Return ((count, ci), (total, ci), (mean, ci)) for a sample drawn with inclusion probability fraction"""
+    n, y, nn, yy, yn = (float(v) for v in (n, y, nn, yy, yn))
+    scale = (1 - fraction) / fraction ** 2
+    count = n / fraction
+    mean = y / n
+    mean_variance = scale * max(yy - 2 * mean * yn + mean * mean * nn, 0.0) / (count * count)
+    return ((count, Z_95 * math.sqrt(scale * nn)),
+            (y / fraction, Z_95 * math.sqrt(scale * yy)),
+            (mean, Z_95 * math.sqrt(mean_variance)))
+
+def run_sampled_report(cursor, build, mode, method, percent, seed=None):
+    """Run a SAMPLED_REPORTS builder, returning (columns, rows) of labelled estimates"""
+    source, alias, group, value, labels = build(mode)
+    cursor.execute(sampled_totals_sql(source.format(sample=sample_clause(method, percent, seed)),
+                                      alias, group, value, method))
+    columns = ['group'] + [f"~{label} (±95%)" for label in labels]
+    rows = []
+    for grp, *sums in cursor.fetchall():
+        rows.append([grp] + [f"~{value:,.2f} ± {ci:,.2f}" for value, ci in estimate(*sums, percent / 100)])
+    return columns, rows
+
+def sketch_sql(mode, metric):
+    """Return the statement upserting the per-day HyperLogLog registers of one metric"""
+    source = SKETCH_METRICS[metric].format(store_code=code_column(mode, 'Store'))
+    # The low bits pick the register, the position of the first 1 in the remaining 52 bits is its rank
+    return f"""
+        WITH hashed AS (
+            SELECT store_code, day, hashtextextended(value, 0) AS h
+            FROM ({source}) src (store_code, day, value)
+        ), buckets AS (
+            SELECT store_code, day, (h & {HLL_REGISTERS - 1})::int AS bucket,
+                   MAX(COALESCE(NULLIF(position(B'1' IN (h >> {HLL_PRECISION})::bit({64 - HLL_PRECISION})), 0),
+                                {64 - HLL_PRECISION + 1})) AS rank
+            FROM hashed GROUP BY 1, 2, 3
+        ), runs AS (
+            -- Hex of each register preceded by zeros for the empty registers before it
+            SELECT store_code, day, bucket,
+                   repeat('00', bucket - COALESCE(lag(bucket) OVER w, -1) - 1) || lpad(to_hex(rank), 2, '0') AS hex
+            FROM buckets
+            WINDOW w AS (PARTITION BY store_code, day ORDER BY bucket)
+        )
+        INSERT INTO SalesSketch (store_code, sales_date, metric, registers)
+        SELECT store_code, day, %(metric)s,
+               decode(rpad(string_agg(hex, '' ORDER BY bucket), {2 * HLL_REGISTERS}, '0'), 'hex')
+        FROM runs GROUP BY store_code, day
+        ON CONFLICT (store_code, sales_date, metric) DO UPDATE SET registers = EXCLUDED.registers
+    """
+
+def refresh_sketches(cursor, mode, full=False):
+    """Sketch the days loaded since the latest sketched day (which may have been partial), or every day"""
+    cursor.execute(CREATE_SKETCH_TABLE)
+    if full:
+        cursor.execute("TRUNCATE SalesSketch")
+    cursor.execute("SELECT COALESCE(MAX(sales_date), '-infinity'::date) FROM SalesSketch")
+    start = cursor.fetchone()[0]
+    sketched = 0
+    for metric in SKETCH_METRICS:
+        cursor.execute(sketch_sql(mode, metric), {'start': start, 'metric': metric})
+        sketched += cursor.rowcount
+    return sketched
+
+def merge_registers(sketches):
+    """Merge sketches (bytes) into one register array"""
+    import numpy as np
+
+    merged = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+    for registers in sketches:
+        np.maximum(merged, np.frombuffer(registers, dtype=np.uint8), out=merged)
+    return merged
+
+def hll_estimate(registers):
+    """Estimate the number of distinct values of merged HyperLogLog registers"""
+    import numpy as np
+
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int32))))
+    empty = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * m and empty:
+        # Linear counting is more accurate while many registers are empty
+        return m * math.log(m / empty)
+    return raw
+
+def distinct_counts(cursor, start=None, end=None):
+    """Return (columns, rows) of estimated distinct tickets and products per store over [start, end]"""
+    cursor.execute("""
+        SELECT store_code, metric, registers FROM SalesSketch
+        WHERE sales_date >= COALESCE(%s, '-infinity'::date) AND sales_date <= COALESCE(%s, 'infinity'::date)
+    """, (start, end))
+    sketches = {}
+    for store, metric, registers in cursor.fetchall():
+        sketches.setdefault((store, metric), []).append(bytes(registers))
+        sketches.setdefault(('All stores', metric), []).append(bytes(registers))
+    merged = {key: merge_registers(registers) for key, registers in sketches.items()}
+    stores = sorted({store for store, _ in merged} - {'All stores'}) + ['All stores']
+    ci = f"±{Z_95 * HLL_RELATIVE_ERROR:.1%}"
+    columns = ['store'] + [f"~distinct {metric} ({ci})" for metric in SKETCH_METRICS]
+    rows = [[store] + [f"~{hll_estimate(merged[store, metric]):,.0f}" if (store, metric) in merged else '-'
+                       for metric in SKETCH_METRICS]
+            for store in stores if any((store, metric) in merged for metric in SKETCH_METRICS)]
+    return columns, rows
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Market-basket associations between products, from sparse co-occurrence matrices.
+
+Sale lines are streamed one window of days at a time. A transaction never
+spans two days, so every window holds whole baskets. Each window is fetched
+as one compact "row column" text: the row is the basket's rank in the window
+and the column is the product, offset by the basket's segment (store or data
+source). The text is parsed with NumPy into a sparse basket-by-product
+indicator matrix X. Then X^T X adds the window's pair co-occurrence counts
+(off-diagonal) and the per-product basket counts (diagonal) to a running
+sparse total.
+
+Segments get disjoint column blocks, so one matrix product counts every
+segment at once. Windows are sized from the per-day transaction counts so
+that no window exceeds the memory budget, whatever the history length.
+
+Support, confidence and lift of every directed pair (antecedent ->
+consequent) seen in at least --min-count baskets are written to
+ProductAssociation.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import add_db_arguments, connect, copy_rows, params_from_args, resolve_db_params
+from schema_mode import code_column, detect_schema_mode
+
+# Segment -> (SQL expression on Transaction t, query of (segment value, label) pairs)
+SEGMENTS = {
+    'all': ("'all'", "SELECT 'all', 'all'"),
+    'store': ("t.store_id", "SELECT store_id, {store_code} FROM Store ORDER BY 2"),
+    'data_source': ("t.data_source", "SELECT DISTINCT data_source, data_source FROM Store ORDER BY 1"),
+}
+
+# Rough client memory per sale line of a window: its text, the parsed arrays and the sparse matrix
+BYTES_PER_LINE = 80
+DEFAULT_MEMORY_MB = 256
+DEFAULT_MIN_COUNT = 5
+
+ASSOCIATION_COLUMNS = ['segment_type', 'segment', 'antecedent', 'consequent',
+                       'pair_count', 'support', 'confidence', 'lift']
+
+# Keyed by business codes so the results survive a switch of schema mode
+CREATE_ASSOCIATION_TABLE = """
+    CREATE TABLE IF NOT EXISTS ProductAssociation (
+        segment_type VARCHAR(20) NOT NULL,
+        segment VARCHAR(50) NOT NULL,
+        antecedent VARCHAR(50) NOT NULL,
+        consequent VARCHAR(50) NOT NULL,
+        pair_count INT NOT NULL,
+        support DOUBLE PRECISION NOT NULL,
+        confidence DOUBLE PRECISION NOT NULL,
+        lift DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (segment_type, segment, antecedent, consequent)
+    )
+"""
+
+def values_cte(cursor, name, columns, rows):
+    """Return a `name (columns) AS (VALUES ...)` CTE of literal rows"""
+    values = ', '.join(cursor.mogrify('(%s, %s)', row).decode() for row in rows)
+    return f"{name} ({', '.join(columns)}) AS (VALUES {values})"
+
+def window_sql(cursor, segment, product_ids, segment_values):
+    """Return the query of one window's (count, 'row column ...') text"""
+    products = values_cte(cursor, 'cols', ['product_id', 'col'], [(p, i) for i, p in enumerate(product_ids)])
+    segments = values_cte(cursor, 'segs', ['segment', 'seg'], [(s, i) for i, s in enumerate(segment_values)])
+    return f"""
+        WITH {products}, {segments},
+        lines AS (
+            SELECT dense_rank() OVER (ORDER BY i.transaction_id) - 1 AS row,
+                   g.seg * {len(product_ids)} + c.col AS col
+            FROM TransactionItem i
+            JOIN Transaction t ON t.transaction_id = i.transaction_id
+            JOIN cols c ON c.product_id = i.product_id
+            JOIN segs g ON g.segment = {SEGMENTS[segment][0]}
+            WHERE t.transaction_date >= %(start)s AND t.transaction_date < %(end)s
+        )
+        SELECT COUNT(*), COALESCE(string_agg(row || ' ' || col, ' '), '') FROM lines
+    """
+
+def plan_windows(cursor, start, end, max_lines):
+    """Split [start, end] into runs of whole days of at most about max_lines sale lines each"""
+    cursor.execute("""
+        SELECT (SELECT GREATEST(reltuples, 1) FROM pg_class WHERE oid = 'transactionitem'::regclass)
+             / (SELECT GREATEST(reltuples, 1) FROM pg_class WHERE oid = 'transaction'::regclass)
+    """)
+    lines_per_transaction = max(float(cursor.fetchone()[0]), 1.0)
+    cursor.execute("""
+        SELECT transaction_date, COUNT(*) FROM Transaction
+        WHERE transaction_date BETWEEN %s AND %s
+        GROUP BY 1 ORDER BY 1
+    """, (start, end))
+    windows, first, lines = [], None, 0.0
+    for day, transactions in cursor.fetchall():
+        estimate = transactions * lines_per_transaction
+        if first is not None and lines + estimate > max_lines:
+            windows.append((first, day))
+            first, lines = None, 0.0
+        if first is None:
+            first = day
+        lines += estimate
+        last = day
+    if first is not None:
+        windows.append((first, last + timedelta(days=1)))
+    return windows
+
+def count_window(text, n_columns):
+    """Return (X^T X, line rows, line columns) of one window's text"""
+    import numpy as np
+    from scipy import sparse
+
+    pairs = np.fromstring(text, dtype=np.int64, sep=' ').reshape(-1, 2)
+    rows, cols = pairs[:, 0], pairs[:, 1]
+    n_rows = int(rows.max()) + 1
+    x = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(n_rows, n_columns))
+    # A product listed twice in a basket still counts once
+    x.sum_duplicates()
+    x.data[:] = 1
+    return (x.T @ x).tocsr(), rows, cols
+
+def associations(counts, transactions, n_products, products, segment_labels, segment, min_count):
+    """Yield ASSOCIATION_COLUMNS rows of every directed pair seen in at least min_count baskets"""
+    import numpy as np
+
+    diagonal = counts.diagonal()
+    pairs = counts.tocoo()
+    keep = (pairs.row != pairs.col) & (pairs.data >= min_count)
+    a, b, n_ab = pairs.row[keep], pairs.col[keep], pairs.data[keep].astype(np.float64)
+    n = transactions[a // n_products].astype(np.float64)
+    n_a, n_b = diagonal[a].astype(np.float64), diagonal[b].astype(np.float64)
+    support, confidence, lift = n_ab / n, n_ab / n_a, n_ab * n / (n_a * n_b)
+    for i in np.lexsort((b, a)):
+        yield (segment, segment_labels[a[i] // n_products], products[a[i] % n_products],
+               products[b[i] % n_products], int(n_ab[i]), float(support[i]), float(confidence[i]), float(lift[i]))
+
+def peak_memory_mb():
+    """Return the peak resident memory of this process in MB, or None where resource is unavailable (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Product associations (support, confidence, lift) from co-occurrence in baskets')
+    parser.add_argument('--by', choices=SEGMENTS, default='all',
+                        help='Compute associations over all sales, per store or per data source (default: all)')
+    parser.add_argument('--start', type=date.fromisoformat, default=date.min,
+                        help='First day, YYYY-MM-DD (default: all history)')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.max,
+                        help='Last day, YYYY-MM-DD (default: all history)')
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT,
+                        help=f'Baskets a pair must appear in to be kept (default: {DEFAULT_MIN_COUNT})')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'Client memory budget per window of days (default: {DEFAULT_MEMORY_MB})')
+    parser.add_argument('--product', default=None,
+                        help='Show what sells with products whose name contains this text, e.g. croissant')
+    parser.add_argument('--top', type=int, default=10, help='Associations shown per segment (default: 10)')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        import scipy  # noqa: F401
+    except ImportError:
+        print("Basket analysis requires scipy (pip install scipy)")
+        return 1
+    import numpy as np
+
+    params = resolve_db_params(params_from_args(args))
+    if params is None:
+        return 1
+
+    start = time.perf_counter()
+    conn = connect(params, role='read')
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    cursor.execute(f"SELECT product_id, {code_column(mode, 'Product')}, product_name FROM Product ORDER BY 2")
+    product_ids, products, names = zip(*cursor.fetchall())
+    cursor.execute(SEGMENTS[args.by][1].format(store_code=code_column(mode, 'Store')))
+    segment_values, segment_labels = zip(*cursor.fetchall())
+    n_products = len(products)
+    n_columns = n_products * len(segment_values)
+
+    windows = plan_windows(cursor, args.start, args.end, args.memory_mb * 2 ** 20 // BYTES_PER_LINE)
+    query = window_sql(cursor, args.by, product_ids, segment_values)
+    counts = None
+    transactions = np.zeros(len(segment_values), dtype=np.int64)
+    total_lines = 0
+    for window_start, window_end in windows:
+        cursor.execute(query, {'start': window_start, 'end': window_end})
+        lines, text = cursor.fetchone()
+        if not lines:
+            continue
+        window_counts, rows, cols = count_window(text, n_columns)
+        del text
+        # Every line of a basket is in the basket's segment block
+        row_segments = np.zeros(int(rows.max()) + 1, dtype=np.int64)
+        row_segments[rows] = cols // n_products
+        transactions += np.bincount(row_segments, minlength=len(segment_values))
+        counts = window_counts if counts is None else counts + window_counts
+        total_lines += lines
+    cursor.close()
+    conn.close()
+    elapsed = time.perf_counter() - start
+    peak_mb = peak_memory_mb()
+    print(f"Counted {total_lines:,} sale lines in {len(windows)} windows in {elapsed:.2f}s "
+          f"({total_lines / max(elapsed, 1e-9):,.0f} lines/s)"
+          + (f", peak memory {peak_mb:.0f} MB" if peak_mb is not None else ""))
+    if counts is None:
+        print("No sales in the selected period")
+        return 0
+
+    rows = list(associations(counts, transactions, n_products, products, segment_labels, args.by, args.min_count))
+    conn = connect(params, autocommit=False)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(CREATE_ASSOCIATION_TABLE)
+        cursor.execute("DELETE FROM ProductAssociation WHERE segment_type = %s", (args.by,))
+        copy_rows(cursor, 'ProductAssociation', ASSOCIATION_COLUMNS, rows)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error: {str(e)}")
+        return 1
+    finally:
+        cursor.close()
+        conn.close()
+    print(f"Wrote {len(rows)} associations (pairs in at least {args.min_count} baskets) to ProductAssociation")
+
+    from tabulate import tabulate
+
+    name_of = dict(zip(products, names))
+    wanted = None
+    if args.product:
+        wanted = {code for code, name in name_of.items() if args.product.lower() in name.lower()}
+        if not wanted:
+            print(f"No product name contains '{args.product}'")
+            return 0
+    for label in segment_labels:
+        rules = sorted((r for r in rows if r[1] == label and (wanted is None or r[2] in wanted)),
+                       key=lambda r: r[7], reverse=True)[:args.top]
+        if not rules:
+            continue
+        print(f"\nTop associations by lift ({args.by}: {label})")
+        print(tabulate([(f"{name_of[a]} ({a})", f"{name_of[b]} ({b})", n, f"{s:.4f}", f"{c:.3f}", f"{l:.2f}")
+                        for _, _, a, b, n, s, c, l in rules],
+                       headers=['antecedent', 'consequent', 'baskets', 'support', 'confidence', 'lift'],
+                       tablefmt="pretty"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import importlib
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Benchmark name -> (module, function, description). Modules are imported on demand.
+BENCHMARKS = {
+    'startup': ('benchmark', 'bench_startup', 'Wall-clock startup time of the ontodb CLI'),
+    'pos': ('pos_simulator', 'main', 'Concurrent point-of-sale write simulator (TPS, commit latency, lock waits)'),
+    'load': ('benchmark', 'bench_load', 'Default vs bulk-load transaction loading (replaces the loaded sales)'),
+    'api': ('api_server', 'bench', 'Load test of the HTTP API (requests/s and tail latency)'),
+    'parse': ('raw_parser', 'bench', 'Per-column throughput of the raw bakery CSV parser'),
+    'search': ('product_search', 'bench', 'Product lookup latency of the in-process index and PostgreSQL'),
+    'isolation': ('benchmark', 'bench_isolation', 'Loader TPS and report latency with reports on the primary vs the replica'),
+}
+
+# Commands that must stay cheap enough for cron jobs and healthchecks
+STARTUP_COMMANDS = [
+    ['--help'],
+    ['setup', '--help'],
+    ['reset', '--help'],
+    ['populate', '--help'],
+    ['export', '--help'],
+]
+
+def bench_startup(argv=None):
+    """Time light ontodb invocations in fresh interpreters"""
+    parser = argparse.ArgumentParser(prog='ontodb bench startup', description=BENCHMARKS['startup'][2])
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per command (default: 10)')
+    parser.add_argument('--target-ms', type=float, default=100.0, help='Startup budget in ms (default: 100)')
+    args = parser.parse_args(argv)
+
+    entry_point = os.path.join(ROOT_DIR, 'ontodb.py')
+    failures = 0
+    print(f"{'command':<28} {'min ms':>8} {'median ms':>10}  status")
+    for command in STARTUP_COMMANDS:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, entry_point, *command],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            timings.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(timings)
+        status = 'ok' if median <= args.target_ms else 'SLOW'
+        failures += status != 'ok'
+        print(f"{' '.join(command):<28} {min(timings):>8.1f} {median:>10.1f}  {status}")
+    return 1 if failures else 0
+
+def bench_load(argv=None):
+    """Load the same transactions with the default and the bulk-load path and report the speedup"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_population'))
+    from db import add_db_arguments, connect, params_from_args, read_dataset_info
+    from populate_transaction_data import populate_transaction_data
+    from schema_mode import detect_schema_mode, select_products_sql, select_stores_sql
+
+    parser = argparse.ArgumentParser(prog='ontodb bench load', description=BENCHMARKS['load'][2])
+    parser.add_argument('--scale-factor', type=float, default=10.0, help='Scale factor to load (default: 10)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--writers', type=int, default=2, help='Writer threads (default: 2)')
+    parser.add_argument('--yes', action='store_true', help='Do not ask before deleting the loaded transactions')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    params = params_from_args(args)
+    if not args.yes:
+        response = input(f"This deletes all transactions in '{params['dbname']}'. Continue? (y/N): ")
+        if response.lower() != 'y':
+            print("Operation cancelled.")
+            return 1
+
+    conn = connect(params)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(select_stores_sql(detect_schema_mode(cursor)))
+        stores = cursor.fetchall()
+        cursor.execute(select_products_sql(detect_schema_mode(cursor)))
+        products = cursor.fetchall()
+        if not stores or not products:
+            print("No stores or products found. Please run the population scripts first.")
+            return 1
+        end_date = read_dataset_info(cursor).get('end_date')
+        end_date = datetime.date.fromisoformat(end_date) if end_date else None
+
+        timings = {}
+        for mode in ('default', 'bulk'):
+            cursor.execute("TRUNCATE TransactionItem, Transaction")
+            cursor.execute("CHECKPOINT")
+            start = time.perf_counter()
+            populate_transaction_data(cursor, stores, products, scale_factor=args.scale_factor, seed=args.seed,
+                                      end_date=end_date, params=params, writers=args.writers, bulk=mode == 'bulk')
+            timings[mode] = time.perf_counter() - start
+    finally:
+        cursor.close()
+        conn.close()
+
+    print(f"\n{'mode':<10} {'seconds':>8}")
+    for mode, seconds in timings.items():
+        print(f"{mode:<10} {seconds:>8.2f}")
+    print(f"Bulk-load speedup: {timings['default'] / timings['bulk']:.2f}x")
+    return 0
+
+def report_reader(params, queries, stop, latencies, lags):
+    """Run the report queries in a loop on one connection until stop is set"""
+    import psycopg2
+    from db import replica_lag
+
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    while not stop.is_set():
+        for query in queries:
+            start = time.perf_counter()
+            cursor.execute(query)
+            cursor.fetchall()
+            latencies.append(time.perf_counter() - start)
+        lag = replica_lag(cursor)
+        if lag is not None:
+            lags.append(lag)
+    conn.close()
+
+def bench_isolation(argv=None):
+    """Run the POS write load alone, with reports on the primary, then with reports on the replica"""
+    from db import add_db_arguments, connect, params_from_args, replica_params
+    from pos_simulator import percentile
+    from reports import REPORTS
+    from schema_mode import detect_schema_mode
+    from export_data import month_bounds, sales_lines_query
+
+    parser = argparse.ArgumentParser(prog='ontodb bench isolation', description=BENCHMARKS['isolation'][2])
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per phase (default: 10)')
+    parser.add_argument('--clients', type=int, default=8, help='POS tills writing as fast as possible (default: 8)')
+    parser.add_argument('--readers', type=int, default=2, help='Concurrent report connections (default: 2)')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    params = params_from_args(args)
+    replica = replica_params(params)
+    conn = connect(params)
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    cursor.execute("SELECT to_char(MAX(transaction_date), 'YYYY-MM') FROM Transaction")
+    month = cursor.fetchone()[0]
+    if month is None:
+        print("No transactions loaded. Please run the population scripts first.")
+        return 1
+    # The analytical reports and the sales-line export of the latest month
+    queries = [build(mode) for _, build, _ in REPORTS.values()]
+    queries.append(cursor.mogrify(sales_lines_query(mode), month_bounds(month)).decode())
+    conn.close()
+
+    phases = [('loader only', None), ('reports on primary', params)]
+    if replica is not None:
+        phases.append(('reports on replica', replica))
+    else:
+        print("No replica configured (DB_REPLICA_HOST); skipping the replica phase")
+
+    db_args = [f"--{name}={value}" for name in ('host', 'port', 'dbname', 'user', 'password')
+               if (value := getattr(args, name)) is not None]
+    results = []
+    for label, reader_params in phases:
+        print(f"Running {label} for {args.duration:g}s...")
+        loader = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'ontodb.py'), 'bench', 'pos',
+                                   '--rate', '0', '--clients', str(args.clients), '--duration', str(args.duration),
+                                   *db_args], stdout=subprocess.PIPE, text=True)
+        stop = threading.Event()
+        latencies, lags = [], []
+        readers = [threading.Thread(target=report_reader, args=(reader_params, queries, stop, latencies, lags))
+                   for _ in range(args.readers if reader_params else 0)]
+        for reader in readers:
+            reader.start()
+        output, _ = loader.communicate()
+        stop.set()
+        for reader in readers:
+            reader.join()
+        match = re.search(r"Committed (\d+) sales in [\d.]+s: ([\d.]+) TPS", output)
+        if match is None:
+            print(output)
+            print(f"Error: the POS simulator failed during '{label}'")
+            return 1
+        results.append((label, float(match[2]), [l * 1000 for l in latencies], lags))
+
+    print(f"\n{'phase':<20} {'loader TPS':>10} {'reports':>8} {'p50 ms':>8} {'p95 ms':>8} {'max lag s':>10}")
+    for label, tps, ms, lags in results:
+        if ms:
+            print(f"{label:<20} {tps:>10.1f} {len(ms):>8} {percentile(ms, 0.5):>8.1f} {percentile(ms, 0.95):>8.1f} "
+                  f"{max(lags, default=0):>10.2f}")
+        else:
+            print(f"{label:<20} {tps:>10.1f} {'-':>8} {'-':>8} {'-':>8} {'-':>10}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ontodb bench', description='Run OntoDb benchmarks',
+                                     epilog='Benchmarks: ' + ', '.join(
+                                         f"{name} ({desc})" for name, (_, _, desc) in BENCHMARKS.items()))
+    parser.add_argument('benchmark', choices=BENCHMARKS, help='Benchmark to run')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Options passed to the benchmark')
+    args = parser.parse_args(argv)
+
+    module_name, function_name, _ = BENCHMARKS[args.benchmark]
+    function = getattr(importlib.import_module(module_name), function_name)
+    return function(args.args)
+
+if __name__ == "__main__":
+    sys.exit(main())
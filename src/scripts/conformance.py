@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""Conformance of the OntoDb data to the ontology in mapping.ttl.
+
+Every rdfs:domain/rdfs:range pair of a property declaration is an axiom. It
+is compiled into conditions on the column of the property in the table of
+its domain class:
+
+type       - the values lie in the value space of the declared XSD datatype
+reference  - the values of an object range are keys of the range class's table
+missing    - the property has a value (the column is not NULL)
+
+Conditions that a column type, a NOT NULL or a validated foreign key already
+guarantee are not scanned for. A column that cannot hold the declared
+datatype at all, or a property without a column, is a schema finding. The
+remaining conditions of a table are counted in a single scan, with the
+referenced tables hash joined in, and tables are checked in parallel on
+their own connections. Sample rows are then fetched for the failed checks.
+
+mapping.ttl was edited by hand, so it is read by a tolerant tokenizer rather
+than a Turtle parser: some names lack their ':' prefix, one range is written
+xsd:range, the ontology header never ends with '.', and some classes
+(Region, ProductT) and properties (details, store_category) don't match the
+schema's names. Names are resolved to the closest table and column, and the
+axioms that still don't map to the schema are listed.
+"""
+import argparse
+import difflib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import ONTODB_TABLES, add_db_arguments, connect, params_from_args, resolve_db_params
+from schema_mode import CODE_COLUMNS, KEY_COLUMNS, SURROGATE, detect_schema_mode
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MAPPING_FILE = os.path.join(ROOT_DIR, 'mapping.ttl')
+
+XSD_NAMESPACE = 'http://www.w3.org/2001/XMLSchema#'
+
+TOKEN_RE = re.compile(r'''
+      (?P<string>"(?:[^"\\\n]|\\.)*"(?:@[\w-]+|\^\^\S+)?)
+    | (?P<iri><[^<>\s]*>)
+    | (?P<comment>\#[^\n]*)
+    | (?P<punctuation>[;,\[\]()]|\.(?=\s|$))
+    | (?P<name>[^\s;,\[\]()"<>]+?)(?=\.?(?:\s|$)|[;,\[\]()])
+''', re.VERBOSE)
+
+PROPERTY_KINDS = {'DatatypeProperty': 'datatype', 'ObjectProperty': 'object'}
+
+# PostgreSQL data type -> family used by the datatype checks
+TYPE_FAMILIES = {
+    'character varying': 'text', 'character': 'text', 'text': 'text',
+    'smallint': 'integer', 'integer': 'integer', 'bigint': 'integer',
+    'numeric': 'numeric', 'real': 'float', 'double precision': 'float',
+    'date': 'date', 'time without time zone': 'time', 'time with time zone': 'time',
+    'timestamp without time zone': 'timestamp', 'timestamp with time zone': 'timestamp',
+    'boolean': 'boolean',
+}
+
+# XSD datatype -> {column family: SQL condition on the value {v} that breaks it, None when none can}
+XSD_VALUES = {
+    # Control characters are not XML characters (PostgreSQL text cannot hold NUL)
+    'string': {'text': r"{v} ~ '[\x01-\x08\x0b\x0c\x0e-\x1f]'"},
+    'boolean': {'boolean': None, 'integer': "{v} NOT IN (0, 1)"},
+    'integer': {'integer': None, 'numeric': "{v} = 'NaN' OR {v} <> trunc({v})"},
+    'decimal': {'integer': None, 'numeric': "{v} = 'NaN'", 'float': "{v} IN ('NaN', 'Infinity', '-Infinity')"},
+    'float': {'integer': None, 'float': None, 'numeric': "{v} <> 'NaN' AND abs({v}) > 3.4028235e38"},
+    'double': {'integer': None, 'float': None, 'numeric': "{v} <> 'NaN' AND abs({v}) > 1.7976931348623157e308"},
+    'date': {'date': "NOT isfinite({v})"},
+    'dateTime': {'timestamp': "NOT isfinite({v})"},
+    'time': {'time': None},
+}
+XSD_ALIASES = {'int': 'integer', 'long': 'integer', 'short': 'integer', 'nonNegativeInteger': 'integer',
+               'positiveInteger': 'integer', 'normalizedString': 'string', 'token': 'string'}
+
+# Lexical forms of the XSD datatypes, checked on text columns
+XSD_LEXICAL = {
+    'boolean': r'^(true|false|1|0)$',
+    'integer': r'^[+-]?[0-9]+$',
+    'decimal': r'^[+-]?([0-9]+(\.[0-9]*)?|\.[0-9]+)$',
+    'float': r'^([+-]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?|[+-]?INF|NaN)$',
+    'double': r'^([+-]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?|[+-]?INF|NaN)$',
+    'date': r'^-?[0-9]{4,}-[0-9]{2}-[0-9]{2}(Z|[+-][0-9]{2}:[0-9]{2})?$',
+    'time': r'^[0-9]{2}:[0-9]{2}:[0-9]{2}(\.[0-9]+)?(Z|[+-][0-9]{2}:[0-9]{2})?$',
+    'dateTime': r'^-?[0-9]{4,}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(\.[0-9]+)?(Z|[+-][0-9]{2}:[0-9]{2})?$',
+}
+
+DEFAULT_SAMPLES = 3
+
+def tokenize(text):
+    """Yield (line, token) of a Turtle document, without comments"""
+    line, position = 1, 0
+    for match in TOKEN_RE.finditer(text):
+        line += text.count('\n', position, match.start())
+        position = match.start()
+        if match.lastgroup != 'comment':
+            yield line, match.group()
+
+def skip_nested(tokens, i):
+    """Return the index after the blank node or collection opening at tokens[i]"""
+    depth = 0
+    while i < len(tokens):
+        if tokens[i][1] in ('[', '('):
+            depth += 1
+        elif tokens[i][1] in (']', ')'):
+            depth -= 1
+        i += 1
+        if depth == 0:
+            break
+    return i
+
+def parse_statements(text):
+    """Yield (line, subject, [(predicate, [objects])]) of the statements of a Turtle document"""
+    tokens = list(tokenize(text))
+    i = 0
+    while i < len(tokens):
+        line, subject = tokens[i]
+        i += 1
+        if subject.startswith('@') or subject.upper() in ('PREFIX', 'BASE'):
+            while i < len(tokens) and tokens[i][1] != '.':
+                i += 1
+            i += 1
+            continue
+        if subject in (';', ',', '.', ']', ')'):
+            continue
+        pairs = []
+        while i < len(tokens) and tokens[i][1] != '.':
+            predicate, objects = tokens[i][1], []
+            i += 1
+            while i < len(tokens) and tokens[i][1] not in (';', '.'):
+                token = tokens[i][1]
+                if token in ('[', '('):
+                    i = skip_nested(tokens, i)
+                    continue
+                if token != ',':
+                    objects.append(token)
+                i += 1
+            pairs.append((predicate, objects))
+            if i < len(tokens) and tokens[i][1] == ';':
+                i += 1
+                # A ';' left at the end of a statement: the next subject is followed by rdf:type
+                if i + 1 < len(tokens) and tokens[i + 1][1] in ('a', 'rdf:type'):
+                    break
+        if i < len(tokens) and tokens[i][1] == '.':
+            i += 1
+        yield line, subject, pairs
+
+def local_name(term):
+    """Return (prefix, local name) of a prefixed name, a name without prefix or an IRI"""
+    if term == 'a':
+        return 'rdf', 'type'
+    if term.startswith('<'):
+        iri = term[1:-1]
+        if iri.startswith(XSD_NAMESPACE):
+            return 'xsd', iri[len(XSD_NAMESPACE):]
+        return '', re.split('[/#]', iri)[-1]
+    prefix, _, name = term.rpartition(':')
+    return prefix, name
+
+def parse_mapping(path=MAPPING_FILE):
+    """Return the axioms of the property declarations of an ontology, as dicts.
+
+    Keys: line, property, kind ('datatype' or 'object'), domain and range
+    (local names, range None when undeclared) and datatype (True when the
+    range is an XSD datatype).
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    axioms = []
+    for line, subject, pairs in parse_statements(text):
+        values = {}
+        for predicate, objects in pairs:
+            # rdfs:domain, rdfs:range and their misspelt prefixes (xsd:range)
+            values.setdefault(local_name(predicate)[1], []).extend(objects)
+        kinds = [PROPERTY_KINDS[local_name(o)[1]] for o in values.get('type', [])
+                 if local_name(o)[1] in PROPERTY_KINDS]
+        if not kinds:
+            continue
+        for domain in values.get('domain', [None]):
+            for value in values.get('range', [None]):
+                prefix, name = local_name(value) if value else ('', None)
+                axioms.append({'line': line, 'property': local_name(subject)[1], 'kind': kinds[0],
+                               'domain': domain and local_name(domain)[1], 'range': name,
+                               'datatype': prefix == 'xsd'})
+    return axioms
+
+def resolve_table(name, tables):
+    """Return the table of a class: same name, the one table ending with it (Region -> StoreRegion), or the closest"""
+    by_lower = {table.lower(): table for table in tables}
+    name = name.lower()
+    if name in by_lower:
+        return by_lower[name]
+    suffixed = [table for lower, table in by_lower.items() if lower.endswith(name)]
+    if len(suffixed) == 1:
+        return suffixed[0]
+    close = difflib.get_close_matches(name, by_lower, n=1, cutoff=0.8)
+    return by_lower[close[0]] if close else None
+
+def resolve_column(name, columns):
+    """Return the column of a property: same name, with an _id suffix, or the closest (details -> detail)"""
+    by_lower = {column.lower(): column for column in columns}
+    name = name.lower()
+    for candidate in (name, f"{name}_id"):
+        if candidate in by_lower:
+            return by_lower[candidate]
+    close = difflib.get_close_matches(name, by_lower, n=1, cutoff=0.85)
+    return by_lower[close[0]] if close else None
+
+def reference_column(table, target, schema):
+    """Return the column of table referring to target: by foreign key, or named after target's key"""
+    columns, keys, references = schema['columns'][table], schema['keys'], schema['references']
+    for column in columns:
+        if references.get((table, column)) == target:
+            return column
+    key = keys.get(target)
+    if not key or len(key) != 1:
+        return None
+    named = [column for column in columns if column == key[0] or column.endswith(f"_{key[0]}")]
+    return named[0] if len(named) == 1 else None
+
+def load_schema(cursor):
+    """Return the columns, primary keys, NOT NULL columns and validated single-column foreign keys of the tables"""
+    names = {table.lower(): table for table in ONTODB_TABLES}
+    schema = {'columns': {table: {} for table in ONTODB_TABLES}, 'keys': {}, 'not_null': set(), 'references': {}}
+    cursor.execute("""
+        SELECT table_name, column_name, data_type, numeric_precision, numeric_scale, is_nullable = 'NO'
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position
+    """)
+    for table, column, data_type, precision, scale, not_null in cursor.fetchall():
+        if data_type == 'numeric' and precision is not None:
+            data_type = f"numeric({precision},{scale})"
+        if table in names:
+            schema['columns'][names[table]][column] = data_type
+            if not_null:
+                schema['not_null'].add((names[table], column))
+    cursor.execute("""
+        SELECT c.relname, a.attname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indisprimary AND c.relnamespace = current_schema()::regnamespace
+        ORDER BY c.relname, array_position(i.indkey::int2[], a.attnum)
+    """)
+    for table, column in cursor.fetchall():
+        if table in names:
+            schema['keys'].setdefault(names[table], []).append(column)
+    # NOT VALID foreign keys (left by bulk loads until validated) guarantee nothing about older rows
+    cursor.execute("""
+        SELECT c.relname, a.attname, r.relname FROM pg_constraint k
+        JOIN pg_class c ON c.oid = k.conrelid
+        JOIN pg_class r ON r.oid = k.confrelid
+        JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = k.conkey[1]
+        WHERE k.contype = 'f' AND k.convalidated AND array_length(k.conkey, 1) = 1
+          AND c.relnamespace = current_schema()::regnamespace
+    """)
+    for table, column, target in cursor.fetchall():
+        if table in names and target in names:
+            schema['references'][(names[table], column)] = names[target]
+    return schema
+
+def datatype_condition(xsd, data_type):
+    """Return (condition on {v} or None, problem or None) of a value of a column type against an XSD datatype"""
+    xsd = XSD_ALIASES.get(xsd, xsd)
+    family = TYPE_FAMILIES.get(data_type.split('(')[0])
+    if xsd not in XSD_VALUES:
+        return None, f"unsupported datatype xsd:{xsd}"
+    if family == 'numeric' and '(' in data_type and xsd in ('float', 'double'):
+        # numeric(p, s) with p < 39 digits stays within the float range, and NaN is a float
+        if int(data_type[len('numeric('):].split(',')[0]) < 39:
+            return None, None
+    if family in XSD_VALUES[xsd]:
+        return XSD_VALUES[xsd][family], None
+    if family == 'text' and xsd in XSD_LEXICAL:
+        return f"{{v}} !~ '{XSD_LEXICAL[xsd]}'", None
+    return None, f"{data_type} column cannot hold xsd:{xsd}"
+
+def compile_checks(axioms, schema, mode, recheck=False):
+    """Compile axioms into (checks, findings, unmapped, number of checks the schema guarantees).
+
+    checks   - {table: [check]} of the conditions to count, each a dict with the
+               property, kind, line, column, condition on alias x and the join it needs
+    findings - [(table, property, kind, line, problem)] found from the schema alone
+    unmapped - [(line, property, reason)] of the axioms with no table or column
+    """
+    tables = list(schema['columns'])
+    checks, findings, unmapped, guaranteed, seen = {}, [], [], 0, {}
+
+    def add(table, prop, kind, line, column, condition, join=None):
+        key = (table, kind, column, condition, join)
+        if key in seen:
+            if prop not in seen[key]['property'].split(', '):
+                seen[key]['property'] += f", {prop}"
+            return
+        if join:
+            alias = f"r{sum(1 for check in checks.get(table, []) if check['join']) + 1}"
+            condition, join = condition.replace('{r}', alias), join.replace('{r}', alias)
+        check = {'property': prop, 'kind': kind, 'line': line, 'column': column, 'condition': condition, 'join': join}
+        seen[key] = check
+        checks.setdefault(table, []).append(check)
+
+    for axiom in axioms:
+        prop, line = axiom['property'], axiom['line']
+        table = axiom['domain'] and resolve_table(axiom['domain'], tables)
+        if table is None:
+            unmapped.append((line, prop, f"no table for class {axiom['domain']}" if axiom['domain'] else "no domain"))
+            continue
+        target = None
+        if axiom['range'] and not axiom['datatype']:
+            target = resolve_table(axiom['range'], tables)
+            if target is None:
+                unmapped.append((line, prop, f"no table for class {axiom['range']}"))
+                continue
+        column = resolve_column(prop, schema['columns'][table]) if axiom['kind'] == 'datatype' else None
+        inverse = False
+        if column is None and target:
+            column = reference_column(table, target, schema)
+            # An inverse property (Staff worksInShift Shift) is the reference of the range to the domain
+            if column is None and reference_column(target, table, schema):
+                table, target, column, inverse = target, table, reference_column(target, table, schema), True
+        if column is None:
+            if axiom['kind'] == 'object':
+                unmapped.append((line, prop, f"no column of {table} or {target} refers to the other"))
+            else:
+                findings.append((table, prop, 'missing', line, f"{table} has no column for {prop}"))
+            continue
+        # In surrogate mode the ontology's string identifiers are the business codes
+        if mode == SURROGATE and axiom['datatype'] and KEY_COLUMNS.get(table) == column:
+            column = CODE_COLUMNS[table]
+        value = f"x.{column}"
+
+        if inverse:
+            # Nothing requires every individual of the range to be related
+            pass
+        elif (table, column) in schema['not_null'] and not recheck:
+            guaranteed += 1
+        else:
+            add(table, prop, 'missing', line, column, f"{value} IS NULL")
+
+        if axiom['datatype']:
+            condition, problem = datatype_condition(axiom['range'], schema['columns'][table][column])
+            if problem:
+                findings.append((table, prop, 'type', line, problem))
+            elif condition:
+                add(table, prop, 'type', line, column, condition.replace('{v}', value))
+            else:
+                guaranteed += 1
+        elif target:
+            key = schema['keys'].get(target)
+            if not key or len(key) != 1:
+                unmapped.append((line, prop, f"{target} has no single-column primary key"))
+            elif schema['references'].get((table, column)) == target and not recheck:
+                guaranteed += 1
+            else:
+                left, right = f"{{r}}.{key[0]}", value
+                if schema['columns'][target][key[0]] != schema['columns'][table][column]:
+                    left, right = f"{left}::text", f"{right}::text"
+                add(table, prop, 'reference', line, column, f"{value} IS NOT NULL AND {{r}}.{key[0]} IS NULL",
+                    join=f"\n        LEFT JOIN {target} {{r}} ON {left} = {right}")
+    return checks, findings, unmapped, guaranteed
+
+def table_sql(table, checks):
+    """Return the query counting, in one scan, the rows of a table and those failing each check"""
+    joins = ''.join(check['join'] for check in checks if check['join'])
+    counts = ',\n           '.join(f"COUNT(*) FILTER (WHERE {check['condition']})" for check in checks)
+    return f"SELECT COUNT(*),\n           {counts}\n    FROM {table} x{joins}"
+
+def sample_sql(table, key, check, limit):
+    """Return the query of a few rows failing a check, as (row key..., value)"""
+    keys = ', '.join(f"x.{column}" for column in key) if key else 'x.ctid'
+    return (f"SELECT {keys}, x.{check['column']}::text FROM {table} x{check['join'] or ''}\n"
+            f"    WHERE {check['condition']} LIMIT {int(limit)}")
+
+def check_table(params, table, key, checks, samples):
+    """Run the checks of one table on its own connection; return (rows, [(check, violations, sample rows)], seconds)"""
+    start = time.perf_counter()
+    conn = connect(params, role='read')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(table_sql(table, checks))
+        rows, *counts = cursor.fetchone()
+        results = []
+        for check, violations in zip(checks, counts):
+            sample = []
+            if violations and samples:
+                cursor.execute(sample_sql(table, key, check, samples))
+                sample = cursor.fetchall()
+            results.append((check, violations, sample))
+        return rows, results, time.perf_counter() - start
+    finally:
+        cursor.close()
+        conn.close()
+
+def printable(text):
+    return ''.join(c if c.isprintable() else repr(c)[1:-1] for c in str(text))
+
+def format_sample(rows):
+    return '; '.join(f"{'/'.join(printable(v) for v in row[:-1])}: {printable(row[-1])}" for row in rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the data against the domains and ranges declared in mapping.ttl')
+    parser.add_argument('--mapping', default=MAPPING_FILE, help='Ontology file (default: mapping.ttl)')
+    parser.add_argument('--tables', nargs='+', choices=ONTODB_TABLES, default=None,
+                        help='Only check these tables (default: every table with axioms)')
+    parser.add_argument('--workers', type=int, default=4, help='Tables checked in parallel (default: 4)')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                        help=f'Sample rows shown per failed check (default: {DEFAULT_SAMPLES})')
+    parser.add_argument('--recheck-constraints', action='store_true',
+                        help='Also scan for what NOT NULL and validated foreign keys already guarantee')
+    parser.add_argument('--show-sql', action='store_true', help='Print the compiled queries without running them')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    axioms = parse_mapping(args.mapping)
+    params = resolve_db_params(params_from_args(args))
+    if params is None:
+        return 1
+    conn = connect(params, role='read')
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    schema = load_schema(cursor)
+    # Biggest tables first, so they don't start last
+    cursor.execute("SELECT relname, reltuples FROM pg_class WHERE relnamespace = current_schema()::regnamespace")
+    sizes = dict(cursor.fetchall())
+    cursor.close()
+    conn.close()
+
+    checks, findings, unmapped, guaranteed = compile_checks(axioms, schema, mode, args.recheck_constraints)
+    if args.tables:
+        checks = {table: table_checks for table, table_checks in checks.items() if table in args.tables}
+        findings = [finding for finding in findings if finding[0] in args.tables]
+    print(f"{len(axioms)} axioms in {os.path.basename(args.mapping)}: {sum(map(len, checks.values()))} checks "
+          f"on {len(checks)} tables, {guaranteed} guaranteed by the schema, {len(findings)} schema findings, "
+          f"{len(unmapped)} not mapped")
+    if args.show_sql:
+        for table, table_checks in checks.items():
+            described = '; '.join(f"{check['kind']} {check['property']}" for check in table_checks)
+            print(f"\n-- {table}: {described}")
+            print(table_sql(table, table_checks) + ';')
+        return 0
+
+    start = time.perf_counter()
+    rows = [(table, prop, kind, line, 'schema', problem) for table, prop, kind, line, problem in findings]
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {table: pool.submit(check_table, params, table, schema['keys'].get(table), table_checks, args.samples)
+                   for table, table_checks in sorted(checks.items(), key=lambda item: -sizes.get(item[0].lower(), 0))}
+        for table, future in futures.items():
+            scanned, results, seconds = future.result()
+            print(f"Checked {scanned:,} rows of {table} against {len(results)} conditions in {seconds:.2f}s")
+            rows.extend((table, check['property'], check['kind'], check['line'], violations, format_sample(sample))
+                        for check, violations, sample in results if violations)
+    elapsed = time.perf_counter() - start
+
+    from tabulate import tabulate
+
+    if unmapped:
+        print("\nAxioms not mapped to the schema")
+        print(tabulate(sorted(unmapped), headers=['line', 'property', 'reason'], tablefmt="pretty"))
+    if not rows:
+        print(f"\nThe data conforms to the ontology ({elapsed:.2f}s)")
+        return 0
+    print(f"\nViolations ({elapsed:.2f}s)")
+    print(tabulate(sorted(rows, key=lambda row: (row[0], row[3])),
+                   headers=['table', 'property', 'check', 'line', 'violations', 'sample'], tablefmt="pretty"))
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Bulk-load session profile for large transaction loads.
+
+The default path inserts into the fact tables directly, so every row is
+WAL-logged, checked against the foreign keys of Transaction and
+TransactionItem as it arrives, and flushed on each commit. In bulk-load mode:
+
+1. batches are copied into UNLOGGED staging tables with synchronous_commit off,
+2. the foreign keys of the fact tables are dropped and the staging rows are
+   inserted in one set-based statement per table,
+3. the foreign keys are re-added as NOT VALID, and
+4. validated with one VALIDATE CONSTRAINT pass each, which checks every row
+   with a single join instead of one lookup per inserted row.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema_mode import create_fact_staging, detect_schema_mode, insert_staged_items_sql, insert_staged_transactions_sql
+
+BULK_TRANSACTION = 'bulk_transaction'
+BULK_TRANSACTION_ITEM = 'bulk_transaction_item'
+
+# Fact tables whose foreign keys are deferred, children first
+FACT_TABLES = ['TransactionItem', 'Transaction']
+
+def create_bulk_staging(cursor):
+    """Create the unlogged staging tables shared by the pipeline writers"""
+    drop_bulk_staging(cursor)
+    create_fact_staging(cursor, BULK_TRANSACTION, BULK_TRANSACTION_ITEM, kind='UNLOGGED')
+    return BULK_TRANSACTION, BULK_TRANSACTION_ITEM
+
+def drop_bulk_staging(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {BULK_TRANSACTION}, {BULK_TRANSACTION_ITEM}")
+
+def foreign_keys(cursor, table):
+    """Return [(constraint_name, definition)] of the foreign keys declared on table"""
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        ORDER BY conname
+    """, (table.lower(),))
+    return cursor.fetchall()
+
+def publish_staging(conn, transaction_columns, item_columns):
+    """Move the staged rows into the fact tables and validate their foreign keys.
+
+    Returns {phase: seconds} for the insert and validate phases.
+    """
+    cursor = conn.cursor()
+    timings = {}
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        start = time.perf_counter()
+        cursor.execute("SET LOCAL synchronous_commit = off")
+        deferred = []
+        for table in FACT_TABLES:
+            for name, definition in foreign_keys(cursor, table):
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+                deferred.append((table, name, definition))
+
+        mode = detect_schema_mode(cursor)
+        cursor.execute(insert_staged_transactions_sql(mode, BULK_TRANSACTION, transaction_columns))
+        cursor.execute(insert_staged_items_sql(mode, BULK_TRANSACTION_ITEM, item_columns))
+
+        # NOT VALID skips the check of existing rows; new rows are still checked
+        for table, name, definition in deferred:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID")
+        conn.commit()
+        timings['insert'] = time.perf_counter() - start
+
+        # VALIDATE only takes a SHARE UPDATE EXCLUSIVE lock, so it does not block writers
+        start = time.perf_counter()
+        for table, name, _ in deferred:
+            cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+            conn.commit()
+        timings['validate'] = time.perf_counter() - start
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
+        cursor.close()
+    return timings
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Skewed, seasonal demand model for the transaction generator.
+
+Real sales are far from uniform: a handful of products make most of the
+volume, weekends and holidays are busier than a Tuesday in August, and a
+flagship store sells more than a small one. The model combines
+
+- Zipf product popularity per data source (a few hot products, a long tail),
+- weekday and monthly (seasonal) volume curves per data source,
+- a per-store size factor,
+- a boost for is_seasonal products during the winter holiday season,
+
+and precomputes Vose alias tables so that every weighted draw in the
+generator's inner loop costs O(1) regardless of the catalog size.
+"""
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from seeding import rng_for
+
+DEFAULT_ZIPF_EXPONENT = 1.1
+
+# Relative volume by weekday (Monday first); each curve averages to 1
+WEEKDAY_FACTORS = {
+    'bakery': [0.85, 0.85, 0.9, 0.9, 1.0, 1.35, 1.15],
+    'coffee_shop': [1.1, 1.1, 1.1, 1.1, 1.05, 0.85, 0.7],
+}
+
+# Relative volume by month (January first); each curve averages to 1
+MONTHLY_FACTORS = {
+    'bakery': [1.15, 0.95, 0.95, 1.0, 1.0, 0.95, 0.9, 0.8, 0.95, 1.0, 1.05, 1.3],
+    'coffee_shop': [1.1, 1.05, 1.0, 1.0, 0.95, 0.9, 0.85, 0.8, 1.0, 1.05, 1.1, 1.2],
+}
+
+# Months in which is_seasonal products (galettes, bûches, ...) sell, and how much
+# more or less popular they are in and out of season
+SEASON_MONTHS = {11, 12, 1}
+IN_SEASON_BOOST = 3.0
+OFF_SEASON_FACTOR = 0.2
+
+BASKET_SIZE_WEIGHTS = {
+    'bakery': {1: 0.35, 2: 0.3, 3: 0.2, 4: 0.15},
+    'coffee_shop': {1: 0.5, 2: 0.3, 3: 0.15, 4: 0.05},
+}
+QUANTITY_WEIGHTS = {1: 0.7, 2: 0.2, 3: 0.1}
+PAYMENT_WEIGHTS = {'Cash': 0.35, 'Credit Card': 0.30, 'Debit Card': 0.25, 'Mobile Payment': 0.10}
+
+class AliasTable:
+    """Vose alias table: O(n) to build, O(1) per weighted draw"""
+
+    def __init__(self, items, weights):
+        if not items or len(items) != len(weights):
+            raise ValueError("AliasTable needs one positive weight per item")
+        total = float(sum(weights))
+        n = len(weights)
+        scaled = [w * n / total for w in weights]
+        self.items = list(items)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def sample(self, rng):
+        """Draw one item"""
+        i = int(rng.random() * len(self.prob))
+        return self.items[i if rng.random() < self.prob[i] else self.alias[i]]
+
+def zipf_weights(n, exponent=DEFAULT_ZIPF_EXPONENT):
+    """Return Zipf weights 1/rank^exponent for ranks 1..n"""
+    return [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+
+class DemandModel:
+    """Precomputed sampling tables for one generation run.
+
+    products are Product tuples (product_id, ..., is_seasonal, is_active, data_source);
+    hour_weights_for returns the 24 hourly weights of a store_id.
+    """
+
+    def __init__(self, stores, products, hour_weights_for, seed=None, zipf_exponent=DEFAULT_ZIPF_EXPONENT):
+        self.seed = seed
+        self.store_size = {}
+        self.hour_tables = {}
+        for store_id, *_ in stores:
+            # Log-normal spread: most stores near 1, a few flagships well above
+            self.store_size[store_id] = rng_for(seed, 'store_size', store_id).lognormvariate(0, 0.3)
+            self.hour_tables[store_id] = AliasTable(range(24), hour_weights_for(store_id))
+
+        self.product_tables = {}
+        for source in ('bakery', 'coffee_shop'):
+            source_products = [p for p in products if p[8] == source and p[7]]
+            if not source_products:
+                continue
+            # Popularity rank is a seeded permutation of the catalog
+            ranked = list(source_products)
+            rng_for(seed, 'popularity', source).shuffle(ranked)
+            popularity = zipf_weights(len(ranked), zipf_exponent)
+            for in_season in (True, False):
+                weights = [
+                    w * ((IN_SEASON_BOOST if in_season else OFF_SEASON_FACTOR) if p[6] else 1.0)
+                    for p, w in zip(ranked, popularity)
+                ]
+                self.product_tables[source, in_season] = AliasTable(ranked, weights)
+
+        self.basket_tables = {source: AliasTable(list(w), list(w.values())) for source, w in BASKET_SIZE_WEIGHTS.items()}
+        self.quantity_table = AliasTable(list(QUANTITY_WEIGHTS), list(QUANTITY_WEIGHTS.values()))
+
+    def day_factor(self, store_id, source, day):
+        """Volume multiplier of a store on a day ('YYYY-MM-DD' or date)"""
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        return (self.store_size.get(store_id, 1.0)
+                * WEEKDAY_FACTORS[source][day.weekday()]
+                * MONTHLY_FACTORS[source][day.month - 1])
+
+    def payment_table(self, payment_method_ids):
+        """Build the payment method table for a {method_name: payment_method_id} map"""
+        names = [name for name in payment_method_ids if name in PAYMENT_WEIGHTS] or list(payment_method_ids)
+        return AliasTable([payment_method_ids[n] for n in names], [PAYMENT_WEIGHTS.get(n, 0.1) for n in names])
+
+    def sample_hour(self, rng, store_id):
+        return self.hour_tables[store_id].sample(rng)
+
+    def sample_quantity(self, rng):
+        return self.quantity_table.sample(rng)
+
+    def sample_basket(self, rng, source, month):
+        """Draw a basket of distinct products for a transaction in the given month"""
+        table = self.product_tables[source, month in SEASON_MONTHS]
+        size = min(self.basket_tables[source].sample(rng), len(table.items))
+        basket = []
+        # Rejection of duplicates is cheap: baskets are tiny compared to the catalog
+        while len(basket) < size:
+            product = table.sample(rng)
+            if product not in basket:
+                basket.append(product)
+        return basket
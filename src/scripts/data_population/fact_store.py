@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Columnar in-memory store for generated transactions.
+
+Generated sales are held in NumPy structured arrays instead of tuples of
+Python objects. Stores and products are integer indexes into FactCodes, dates
+are days since 1970-01-01, times are seconds since midnight and amounts are
+integer cents, so a sale line costs a few dozen bytes instead of several
+hundred. Transaction and sale IDs are not stored at all: they are derived from
+(store, date, number) and the line number when the batch is encoded for COPY.
+
+A FactBatch is passed between the generator and writer threads by reference;
+strings are only produced once, in encode_copy().
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+TRANSACTION_DTYPE = np.dtype([
+    ('store', 'u2'),              # index into FactCodes.stores
+    ('day', 'i4'),                # days since 1970-01-01
+    ('number', 'u4'),             # sequence number within the store-day
+    ('time', 'i4'),               # seconds since midnight
+    ('payment_method_id', 'i2'),
+    ('staff_id', 'i4'),
+    ('total_cents', 'i4'),
+    ('currency_id', 'i2'),
+    ('source', 'u1'),             # index into SOURCES
+])
+
+ITEM_DTYPE = np.dtype([
+    ('transaction', 'i4'),        # row of the transaction in the same batch
+    ('product', 'u4'),            # index into FactCodes.products
+    ('quantity', 'u2'),
+    ('unit_cents', 'i4'),
+    ('discount_percent', 'u1'),
+    ('total_cents', 'i4'),
+    ('line', 'u1'),               # 1-based position in the basket
+])
+
+SOURCES = ['bakery', 'coffee_shop']
+
+EPOCH = date(1970, 1, 1)
+
+# transaction_id holds the sequence number as 4 digits
+MAX_DAY_TRANSACTIONS = 9999
+
+def day_number(day):
+    """Encode a 'YYYY-MM-DD' date as days since 1970-01-01"""
+    return (date.fromisoformat(day) - EPOCH).days
+
+def day_string(number):
+    return (EPOCH + timedelta(days=int(number))).isoformat()
+
+def to_cents(amount):
+    return int(round(float(amount) * 100))
+
+def cents_string(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+def transaction_id_for(store_id, day, number):
+    """Build the transaction_id of the number-th transaction of a store on a day, e.g. BTX-BAK001-20250301-0001"""
+    return f"{'B' if 'BAK' in store_id else 'C'}TX-{store_id}-{day.replace('-', '')}-{number:04d}"
+
+class FactCodes:
+    """Integer encoding of the store and product codes of a run"""
+
+    def __init__(self, stores, products):
+        self.stores = [s[0] for s in stores]
+        self.products = [p[0] for p in products]
+        self.store_index = {code: i for i, code in enumerate(self.stores)}
+        self.product_index = {code: i for i, code in enumerate(self.products)}
+        # The part of transaction_id_for() that only depends on the store
+        self.id_prefixes = [f"{'B' if 'BAK' in code else 'C'}TX-{code}-" for code in self.stores]
+
+class FactBatch:
+    """Transactions and items of one or more store-days as structured arrays"""
+
+    def __init__(self, codes, transactions, items):
+        self.codes = codes
+        self.transactions = transactions
+        self.items = items
+
+    @classmethod
+    def from_records(cls, codes, transactions, items):
+        """Build a batch from lists of tuples in TRANSACTION_DTYPE and ITEM_DTYPE field order"""
+        return cls(codes, np.array(transactions, dtype=TRANSACTION_DTYPE), np.array(items, dtype=ITEM_DTYPE))
+
+    @classmethod
+    def concat(cls, codes, batches):
+        """Concatenate batches, re-pointing items at their transaction's new row"""
+        items = []
+        offset = 0
+        for batch in batches:
+            shifted = batch.items.copy()
+            shifted['transaction'] += offset
+            items.append(shifted)
+            offset += len(batch.transactions)
+        return cls(codes,
+                   np.concatenate([b.transactions for b in batches] or [np.empty(0, TRANSACTION_DTYPE)]),
+                   np.concatenate(items or [np.empty(0, ITEM_DTYPE)]))
+
+    @property
+    def nbytes(self):
+        return self.transactions.nbytes + self.items.nbytes
+
+    def transaction_ids(self):
+        """Return the transaction_id strings, one per transaction"""
+        t = self.transactions
+        days = {d: day_string(d).replace('-', '') for d in np.unique(t['day']).tolist()}
+        prefixes = self.codes.id_prefixes
+        return [f"{prefixes[s]}{days[d]}-{n:04d}"
+                for s, d, n in zip(t['store'].tolist(), t['day'].tolist(), t['number'].tolist())]
+
+    def transaction_rows(self, ids=None):
+        """Yield tuples in TRANSACTION_COLUMNS order"""
+        t = self.transactions
+        ids = ids or self.transaction_ids()
+        days = {d: day_string(d) for d in np.unique(t['day']).tolist()}
+        stores = self.codes.stores
+        for row in zip(ids, t['store'].tolist(), t['day'].tolist(), t['time'].tolist(),
+                       t['payment_method_id'].tolist(), t['staff_id'].tolist(), t['total_cents'].tolist(),
+                       t['currency_id'].tolist(), t['source'].tolist()):
+            transaction_id, store, day, seconds, payment, staff, cents, currency, source = row
+            yield (transaction_id, stores[store], days[day],
+                   f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}",
+                   payment, staff, cents_string(cents), currency, SOURCES[source])
+
+    def item_rows(self, ids=None):
+        """Yield tuples in TRANSACTION_ITEM_COLUMNS order"""
+        i = self.items
+        ids = ids or self.transaction_ids()
+        products = self.codes.products
+        for transaction, product, quantity, unit, discount, total, line in zip(
+                i['transaction'].tolist(), i['product'].tolist(), i['quantity'].tolist(),
+                i['unit_cents'].tolist(), i['discount_percent'].tolist(), i['total_cents'].tolist(),
+                i['line'].tolist()):
+            transaction_id = ids[transaction]
+            yield (transaction_id, products[product], quantity, cents_string(unit), discount,
+                   cents_string(total), f"{transaction_id}_{line}")
+
+    def encode_copy(self):
+        """Return the (transaction, item) COPY text payloads; values never need escaping"""
+        ids = self.transaction_ids()
+        return (''.join('\t'.join(map(str, row)) + '\n' for row in self.transaction_rows(ids)),
+                ''.join('\t'.join(map(str, row)) + '\n' for row in self.item_rows(ids)))
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Incremental (delta) loading of new sales into an existing database.
+
+New rows are bulk-copied into temporary staging tables, and only the rows whose
+transaction_id / sale_id keys are not loaded yet are inserted. The daily rollup
+is refreshed for the (store, day) slices that received new rows only, so a daily
+load costs time proportional to that day's data rather than the whole history.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+# Import modules with explicit paths to avoid relative import issues
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import (
+    add_db_arguments,
+    bump_data_version,
+    connect,
+    copy_encoded,
+    params_from_args,
+    read_dataset_info,
+    resolve_db_params,
+)
+from populate_transaction_data import (
+    TRANSACTION_COLUMNS,
+    TRANSACTION_ITEM_COLUMNS,
+    daily_transaction_means,
+    ensure_payment_methods,
+    generate_transactions,
+    get_store_staff,
+)
+from populate_staff_data import ensure_shifts, load_store_shifts
+from schema_mode import (
+    code_column,
+    create_fact_staging,
+    detect_schema_mode,
+    insert_staged_items_sql,
+    insert_staged_transactions_sql,
+    select_products_sql,
+    select_stores_sql,
+)
+
+STAGING_TRANSACTION = 'staging_transaction'
+STAGING_TRANSACTION_ITEM = 'staging_transaction_item'
+
+def create_staging_tables(cursor):
+    """Create session-local staging tables for coded fact rows, without constraints"""
+    create_fact_staging(cursor, STAGING_TRANSACTION, STAGING_TRANSACTION_ITEM, on_commit='ON COMMIT DROP')
+    # affected_days holds store keys, which are integers in surrogate mode
+    cursor.execute("""
+        CREATE TEMP TABLE affected_days ON COMMIT DROP AS
+        SELECT store_id, transaction_date AS sales_date, 0 AS new_transactions, 0 AS new_items
+        FROM Transaction WITH NO DATA
+    """)
+    cursor.execute("""
+        ALTER TABLE affected_days
+            ALTER COLUMN new_transactions SET DEFAULT 0,
+            ALTER COLUMN new_items SET DEFAULT 0
+    """)
+
+def stage_csv(cursor, staging_table, path):
+    """COPY a CSV file with a header row into a staging table, returning the number of rows"""
+    with open(path, encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f))
+        cursor.execute(f"SELECT * FROM {staging_table} LIMIT 0")
+        known = {desc[0] for desc in cursor.description}
+        unknown = [c for c in header if c.lower() not in known]
+        if unknown:
+            raise ValueError(f"{path}: unknown columns {', '.join(unknown)}")
+        f.seek(0)
+        cursor.copy_expert(
+            f"COPY {staging_table} ({', '.join(header)}) FROM STDIN WITH (FORMAT csv, HEADER true)", f
+        )
+    cursor.execute(f"SELECT COUNT(*) FROM {staging_table}")
+    return cursor.fetchone()[0]
+
+def merge_staged_rows(cursor):
+    """Insert staged rows whose keys are not loaded yet; return (transactions, items, orphan items)"""
+    mode = detect_schema_mode(cursor)
+    cursor.execute(f"""
+        WITH new_transactions AS (
+            {insert_staged_transactions_sql(mode, STAGING_TRANSACTION, TRANSACTION_COLUMNS,
+                                            returning='RETURNING store_id, transaction_date')}
+        )
+        INSERT INTO affected_days (store_id, sales_date, new_transactions)
+        SELECT store_id, transaction_date, COUNT(*) FROM new_transactions GROUP BY 1, 2
+    """)
+
+    cursor.execute(f"""
+        WITH new_items AS (
+            {insert_staged_items_sql(mode, STAGING_TRANSACTION_ITEM, TRANSACTION_ITEM_COLUMNS,
+                                     returning='RETURNING transaction_id')}
+        )
+        INSERT INTO affected_days (store_id, sales_date, new_items)
+        SELECT t.store_id, t.transaction_date, COUNT(*)
+        FROM new_items n
+        JOIN Transaction t ON t.transaction_id = n.transaction_id
+        GROUP BY 1, 2
+    """)
+
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM {STAGING_TRANSACTION_ITEM} s
+        WHERE NOT EXISTS (SELECT 1 FROM Transaction t WHERE t.{code_column(mode, 'Transaction')} = s.transaction_id)
+    """)
+    orphans = cursor.fetchone()[0]
+
+    cursor.execute("SELECT COALESCE(SUM(new_transactions), 0), COALESCE(SUM(new_items), 0) FROM affected_days")
+    new_transactions, new_items = cursor.fetchone()
+    return new_transactions, new_items, orphans
+
+def refresh_daily_summary(cursor, full=False):
+    """Recompute DailySalesSummary for the affected (store, day) slices, or for every day if full"""
+    # Slices emptied by --replace have no Transaction rows to upsert from, so
+    # their old summary rows are deleted first rather than left stale
+    if full:
+        cursor.execute("DELETE FROM DailySalesSummary")
+        cursor.execute("""
+            INSERT INTO affected_days (store_id, sales_date)
+            SELECT DISTINCT store_id, transaction_date FROM Transaction
+        """)
+    else:
+        cursor.execute("""
+            DELETE FROM DailySalesSummary s USING affected_days a
+            WHERE s.store_id = a.store_id AND s.sales_date = a.sales_date
+        """)
+    cursor.execute("""
+        INSERT INTO DailySalesSummary
+            (store_id, sales_date, transaction_count, item_count, units_sold, total_sales)
+        SELECT t.store_id, t.transaction_date, COUNT(*),
+               COALESCE(SUM(i.item_count), 0), COALESCE(SUM(i.units_sold), 0),
+               COALESCE(SUM(t.total_amount), 0)
+        FROM (SELECT DISTINCT store_id, sales_date FROM affected_days) a
+        JOIN Transaction t ON t.transaction_date = a.sales_date AND t.store_id = a.store_id
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS item_count, SUM(quantity) AS units_sold
+            FROM TransactionItem ti
+            WHERE ti.transaction_id = t.transaction_id
+        ) i ON TRUE
+        GROUP BY t.store_id, t.transaction_date
+        ON CONFLICT (store_id, sales_date) DO UPDATE SET
+            transaction_count = EXCLUDED.transaction_count,
+            item_count = EXCLUDED.item_count,
+            units_sold = EXCLUDED.units_sold,
+            total_sales = EXCLUDED.total_sales
+    """)
+    return cursor.rowcount
+
+def replace_slices(cursor, store_ids, dates):
+    """Delete the loaded rows of the given (store, date) slices so they can be regenerated"""
+    # store_ids are business codes; the fact tables hold the store keys
+    cursor.execute(f"SELECT store_id FROM Store WHERE {code_column(detect_schema_mode(cursor), 'Store')} = ANY(%s)",
+                   (store_ids,))
+    store_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        INSERT INTO affected_days (store_id, sales_date)
+        SELECT DISTINCT store_id, transaction_date FROM Transaction
+        WHERE store_id = ANY(%s) AND transaction_date = ANY(%s::date[])
+    """, (store_ids, dates))
+    cursor.execute("""
+        DELETE FROM TransactionItem i USING Transaction t
+        WHERE i.transaction_id = t.transaction_id
+          AND t.store_id = ANY(%s) AND t.transaction_date = ANY(%s::date[])
+    """, (store_ids, dates))
+    cursor.execute("""
+        DELETE FROM Transaction
+        WHERE store_id = ANY(%s) AND transaction_date = ANY(%s::date[])
+    """, (store_ids, dates))
+    print(f"Deleted {cursor.rowcount} transactions to regenerate")
+
+def generate_slices(cursor, dates, store_ids=None, seed=42, scale_factor=1.0):
+    """Generate the transactions of the given dates for the given stores (default: all stores) as a FactBatch"""
+    cursor.execute(select_stores_sql(detect_schema_mode(cursor)))
+    stores = [s for s in cursor.fetchall() if store_ids is None or s[0] in store_ids]
+    cursor.execute(select_products_sql(detect_schema_mode(cursor)))
+    products = cursor.fetchall()
+    if not stores or not products:
+        raise RuntimeError("No stores or products found. Please run the population scripts first.")
+
+    payment_method_ids = ensure_payment_methods(cursor)
+    cursor.execute("SELECT currency_id FROM Currency WHERE currency_code = 'EUR'")
+    eur_currency_id = cursor.fetchone()[0]
+    store_staff = get_store_staff(cursor, stores)
+    # Sales are assigned to staff on shift, so new days need their shifts too
+    new_shifts = ensure_shifts(cursor, store_staff, dates, seed)
+    if new_shifts:
+        print(f"Generated {new_shifts} shifts for the new days")
+
+    # Transaction IDs are derived from (store, date), so regenerated slices
+    # never collide with other slices and re-loading a slice is a no-op
+    facts = generate_transactions(
+        stores, products, store_staff, load_store_shifts(cursor, dates), payment_method_ids, eur_currency_id,
+        dates, daily_transaction_means(scale_factor), seed=seed
+    )
+    print(f"Generated {len(facts.transactions)} transactions for {len(stores)} stores "
+          f"from {min(dates)} to {max(dates)}")
+    return facts
+
+def next_dates(cursor, days):
+    """Return the days following the latest loaded day"""
+    cursor.execute("SELECT MAX(transaction_date) FROM Transaction")
+    latest = cursor.fetchone()[0] or (date.today() - timedelta(days=days))
+    return [(latest + timedelta(days=d)).strftime("%Y-%m-%d") for d in range(1, days + 1)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incrementally load new sales into an existing database')
+    parser.add_argument('--transactions-csv', help='CSV file of new Transaction rows (with header)')
+    parser.add_argument('--items-csv', help='CSV file of new TransactionItem rows (with header)')
+    parser.add_argument('--days', type=int, default=0,
+                        help='Generate this many new days after the latest loaded day')
+    parser.add_argument('--dates', nargs='+', type=date.fromisoformat, default=[],
+                        help='Generate these days (YYYY-MM-DD), e.g. to regenerate single partitions')
+    parser.add_argument('--stores', nargs='+', default=None,
+                        help='Only generate data for these store IDs (default: all stores)')
+    parser.add_argument('--replace', action='store_true',
+                        help='Delete the loaded rows of the generated (store, date) slices first')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for generated data (default: the seed recorded by populate, else 42)')
+    parser.add_argument('--scale-factor', type=float, default=None,
+                        help='Scale factor for generated data (default: the one recorded by populate, else 1)')
+    parser.add_argument('--rebuild-summary', action='store_true',
+                        help='Recompute DailySalesSummary for every day, not only the affected ones')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not (args.transactions_csv or args.items_csv or args.days or args.dates or args.rebuild_summary):
+        parser.error('nothing to load: pass --transactions-csv/--items-csv, --days, --dates or --rebuild-summary')
+
+    params = resolve_db_params(params_from_args(args))
+    if params is None:
+        return 1
+
+    # The whole delta is applied in one database transaction
+    conn = connect(params, autocommit=False)
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    try:
+        create_staging_tables(cursor)
+        if args.transactions_csv:
+            print(f"Staged {stage_csv(cursor, STAGING_TRANSACTION, args.transactions_csv)} transactions")
+        if args.items_csv:
+            print(f"Staged {stage_csv(cursor, STAGING_TRANSACTION_ITEM, args.items_csv)} transaction items")
+        if args.days or args.dates:
+            info = read_dataset_info(cursor)
+            seed = args.seed if args.seed is not None else int(info.get('seed', 42))
+            scale_factor = args.scale_factor if args.scale_factor is not None else float(info.get('scale_factor', 1))
+            dates = [d.strftime("%Y-%m-%d") for d in args.dates] + next_dates(cursor, args.days)
+            if args.replace:
+                cursor.execute(f"SELECT {code_column(detect_schema_mode(cursor), 'Store')} FROM Store")
+                replace_slices(cursor, args.stores or [s[0] for s in cursor.fetchall()], dates)
+            facts = generate_slices(cursor, dates, args.stores, seed, scale_factor)
+            transaction_payload, item_payload = facts.encode_copy()
+            copy_encoded(cursor, STAGING_TRANSACTION, TRANSACTION_COLUMNS, transaction_payload)
+            copy_encoded(cursor, STAGING_TRANSACTION_ITEM, TRANSACTION_ITEM_COLUMNS, item_payload)
+
+        new_transactions, new_items, orphans = merge_staged_rows(cursor)
+        summary_rows = refresh_daily_summary(cursor, full=args.rebuild_summary)
+        cursor.execute("SELECT DISTINCT to_char(sales_date, 'YYYY-MM') FROM affected_days")
+        bump_data_version(cursor, [row[0] for row in cursor.fetchall()])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error during incremental load: {str(e)}")
+        return 1
+
+    # Refresh planner statistics; ANALYZE samples, so its cost does not grow with history
+    conn.autocommit = True
+    cursor.execute("ANALYZE Transaction, TransactionItem, DailySalesSummary")
+    cursor.close()
+    conn.close()
+
+    print(f"Loaded {new_transactions} new transactions and {new_items} new items "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(f"Refreshed {summary_rows} daily summary rows")
+    if orphans:
+        print(f"Skipped {orphans} staged items whose transaction does not exist")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Overlapped generate/write pipeline for loading transactions.
+
+Generator threads turn batches of (store, date) slices into columnar
+FactBatches (see fact_store.py) and push them into a bounded queue; writer
+threads, each holding a pooled connection, drain the queue, encode the batches
+for COPY and load them concurrently. The
+bounded queue provides backpressure, so memory stays at roughly queue_size
+batches, and because psycopg2 releases the GIL while PostgreSQL works,
+generation and writing overlap: total load time approaches
+max(generation, write) instead of their sum.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import copy_encoded
+from demand_model import DemandModel
+from fact_store import FactBatch, FactCodes
+from schema_mode import create_fact_staging, detect_schema_mode, insert_staged_items_sql, insert_staged_transactions_sql
+from populate_transaction_data import (
+    TRANSACTION_COLUMNS,
+    TRANSACTION_ITEM_COLUMNS,
+    generate_store_day,
+    hour_weights_for,
+)
+
+DEFAULT_GENERATORS = 2
+DEFAULT_WRITERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_BATCH_DAYS = 7
+
+# Poll interval used so blocked threads notice a failure elsewhere in the pipeline
+POLL_SECONDS = 0.5
+
+class PipelineStats:
+    """Counters and timings collected while the pipeline runs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.transactions = 0
+        self.items = 0
+        self.generate_seconds = 0.0
+        self.write_seconds = 0.0
+        # Time generators spent blocked on a full queue (writers are the bottleneck)
+        self.producer_stall_seconds = 0.0
+        # Time writers spent waiting on an empty queue (generators are the bottleneck)
+        self.writer_stall_seconds = 0.0
+        self.queue_depth_samples = 0
+        self.queue_depth_total = 0
+        self.max_queue_depth = 0
+        self.elapsed_seconds = 0.0
+
+    def add(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def sample_depth(self, depth):
+        with self.lock:
+            self.queue_depth_samples += 1
+            self.queue_depth_total += depth
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def report(self):
+        """Return a human readable summary"""
+        mean_depth = self.queue_depth_total / self.queue_depth_samples if self.queue_depth_samples else 0
+        serial = self.generate_seconds + self.write_seconds
+        return (
+            f"Pipeline: {self.batches} batches, {self.transactions} transactions, {self.items} items "
+            f"in {self.elapsed_seconds:.2f}s\n"
+            f"  generate {self.generate_seconds:.2f}s, write {self.write_seconds:.2f}s "
+            f"(thread time; serial would be ~{serial:.2f}s)\n"
+            f"  queue depth mean {mean_depth:.1f}, max {self.max_queue_depth}; "
+            f"producer stalls {self.producer_stall_seconds:.2f}s, writer stalls {self.writer_stall_seconds:.2f}s"
+        )
+
+def slice_batches(stores, store_staff, dates, batch_days=DEFAULT_BATCH_DAYS):
+    """Split the (store, date) slices into batches of up to batch_days dates of one store"""
+    batches = []
+    for store_id, *_ in stores:
+        if not store_staff.get(store_id):
+            continue  # Skip if no staff
+        for i in range(0, len(dates), batch_days):
+            batches.append((store_id, dates[i:i + batch_days]))
+    return batches
+
+def _put(out_queue, item, stats, failed):
+    """Put with backpressure, giving up when another thread failed"""
+    start = time.perf_counter()
+    while not failed.is_set():
+        try:
+            out_queue.put(item, timeout=POLL_SECONDS)
+            break
+        except queue.Full:
+            continue
+    stats.add(producer_stall_seconds=time.perf_counter() - start)
+    stats.sample_depth(out_queue.qsize())
+
+def _generator(tasks, out_queue, model, codes, store_staff, store_shifts, payment_table, currency_id, daily_means, seed,
+               stats, failed, errors):
+    try:
+        while not failed.is_set():
+            try:
+                store_id, dates = tasks.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            source = 'bakery' if 'BAK' in store_id else 'coffee_shop'
+            facts = FactBatch.concat(codes, [
+                generate_store_day(store_id, day, model, codes, store_staff[store_id],
+                                   store_shifts.get((store_id, day), []), payment_table,
+                                   currency_id, daily_means[source], seed)
+                for day in dates
+            ])
+            batch = (len(dates), facts)
+            stats.add(generate_seconds=time.perf_counter() - start)
+            _put(out_queue, batch, stats, failed)
+    except Exception as e:
+        errors.append(e)
+        failed.set()
+
+def _writer(in_queue, pool, stats, failed, errors, progress, bulk_tables=None):
+    conn = pool.getconn()
+    cursor = conn.cursor()
+    try:
+        if bulk_tables:
+            # Bulk-load mode: copy straight into the unlogged staging tables and
+            # do not wait for WAL flushes on commit (see bulk_load.py)
+            cursor.execute("SET synchronous_commit = off")
+            transaction_table, item_table = bulk_tables
+        else:
+            # Batches are staged first so re-loading existing rows is skipped, as with ON CONFLICT inserts
+            transaction_table, item_table = 'pipeline_transaction', 'pipeline_transaction_item'
+            create_fact_staging(cursor, transaction_table, item_table, on_commit='ON COMMIT DELETE ROWS')
+            mode = detect_schema_mode(cursor)
+            insert_transactions = insert_staged_transactions_sql(mode, transaction_table, TRANSACTION_COLUMNS)
+            insert_items = insert_staged_items_sql(mode, item_table, TRANSACTION_ITEM_COLUMNS)
+        conn.commit()
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = in_queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                stats.add(writer_stall_seconds=time.perf_counter() - start)
+                if failed.is_set():
+                    return
+                continue
+            stats.add(writer_stall_seconds=time.perf_counter() - start)
+            if batch is None:
+                return
+            slices, facts = batch
+
+            start = time.perf_counter()
+            transaction_payload, item_payload = facts.encode_copy()
+            copy_encoded(cursor, transaction_table, TRANSACTION_COLUMNS, transaction_payload)
+            copy_encoded(cursor, item_table, TRANSACTION_ITEM_COLUMNS, item_payload)
+            if not bulk_tables:
+                cursor.execute(insert_transactions)
+                cursor.execute(insert_items)
+            conn.commit()
+            stats.add(write_seconds=time.perf_counter() - start, batches=1,
+                      transactions=len(facts.transactions), items=len(facts.items))
+            if progress is not None:
+                progress.update(slices)
+    except Exception as e:
+        conn.rollback()
+        errors.append(e)
+        failed.set()
+    finally:
+        if not bulk_tables:
+            cursor.execute("DROP TABLE IF EXISTS pipeline_transaction, pipeline_transaction_item")
+            conn.commit()
+        cursor.close()
+        pool.putconn(conn)
+
+def load_transactions_pipelined(params, stores, products, store_staff, store_shifts, payment_method_ids, currency_id,
+                                dates, daily_means, seed=None, generators=DEFAULT_GENERATORS,
+                                writers=DEFAULT_WRITERS, queue_size=DEFAULT_QUEUE_SIZE,
+                                batch_days=DEFAULT_BATCH_DAYS, progress=None, bulk_tables=None):
+    """Generate and load the transactions of every (store, date) slice, returning PipelineStats.
+
+    Takes the same inputs as generate_transactions(), plus connection parameters
+    for the writers' connection pool. Each batch is committed on its own. With
+    bulk_tables=(transaction_table, item_table) the batches are copied as-is into
+    those staging tables instead of the fact tables.
+    """
+    from psycopg2.pool import ThreadedConnectionPool
+
+    model = DemandModel(stores, products, hour_weights_for, seed=seed)
+    payment_table = model.payment_table(payment_method_ids)
+    codes = FactCodes(stores, products)
+
+    tasks = queue.Queue()
+    for batch in slice_batches(stores, store_staff, dates, batch_days):
+        tasks.put(batch)
+    batches = queue.Queue(maxsize=queue_size)
+    stats = PipelineStats()
+    failed = threading.Event()
+    errors = []
+
+    pool = ThreadedConnectionPool(writers, writers, **params)
+    start = time.perf_counter()
+    try:
+        writer_threads = [
+            threading.Thread(target=_writer, args=(batches, pool, stats, failed, errors, progress, bulk_tables),
+                             daemon=True)
+            for _ in range(writers)
+        ]
+        generator_threads = [
+            threading.Thread(target=_generator, args=(tasks, batches, model, codes, store_staff, store_shifts, payment_table,
+                                                      currency_id, daily_means, seed, stats, failed, errors),
+                             daemon=True)
+            for _ in range(generators)
+        ]
+        for thread in writer_threads + generator_threads:
+            thread.start()
+        for thread in generator_threads:
+            thread.join()
+        # One end-of-stream marker per writer
+        for _ in writer_threads:
+            _put(batches, None, stats, failed)
+        for thread in writer_threads:
+            thread.join()
+    finally:
+        pool.closeall()
+    stats.elapsed_seconds = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+    return stats
@@ -1,44 +1,21 @@
-import pandas as pd
-import random
-import psycopg2
 import os
 import sys
 
-def populate_product_data(cursor):
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seeding import rng_for
+from reference_data import REFERENCE_DATA, sync_reference_data
+from schema_mode import code_column, detect_schema_mode
+
+def populate_product_data(cursor, seed=None):
     """Populate Product, ProductCategory, ProductType and Currency tables"""
     print("Populating product data...")
+    rng = rng_for(seed, 'products')
     
-    currencies = [
-        ('EUR', 'Euro', '€'),
-        ('USD', 'US Dollar', '$')
-    ]
-    
-    for code, name, symbol in currencies:
-        cursor.execute(
-            "INSERT INTO Currency (currency_code, currency_name, symbol) VALUES (%s, %s, %s) ON CONFLICT (currency_code) DO NOTHING",
-            (code, name, symbol)
-        )
-    
-    cursor.execute("SELECT currency_id FROM Currency WHERE currency_code = 'EUR'")
-    eur_currency_id = cursor.fetchone()[0]
-    
-    categories = [
-        ('Pastry', 'Sweet and savory pastry products'),
-        ('Bread', 'Traditional and artisanal breads'),
-        ('Coffee', 'Coffee beverages and espresso-based drinks'),
-        ('Tea', 'Hot and cold tea beverages'),
-        ('Sandwich', 'Fresh made sandwiches'),
-        ('Cake', 'Cakes and desserts')
-    ]
-    
-    for name, description in categories:
-        cursor.execute(
-            "INSERT INTO ProductCategory (category_name, description) VALUES (%s, %s) ON CONFLICT (category_name) DO NOTHING",
-            (name, description)
-        )
-    
-    cursor.execute("SELECT category_id, category_name FROM ProductCategory")
-    product_categories = {name: cat_id for cat_id, name in cursor.fetchall()}
+    reference = sync_reference_data(cursor, ['Currency', 'ProductCategory'])
+    currencies = REFERENCE_DATA['Currency'].rows
+    eur_currency_id = reference['Currency']['EUR']
+    product_categories = reference['ProductCategory']
     
     product_types = {
         product_categories['Pastry']: [
@@ -95,6 +72,7 @@ def populate_product_data(cursor):
         SELECT t.type_id, t.type_name, c.category_name 
         FROM ProductType t 
         JOIN ProductCategory c ON t.category_id = c.category_id
+        ORDER BY t.type_id
     """)
     db_product_types = cursor.fetchall()
     
@@ -108,7 +86,7 @@ def populate_product_data(cursor):
         for j in range(1, 4):  # 3 products per type
             product_id = f"B{i*3+j:03d}"
             detail = f"{type_name} Variety {j}"
-            price = round(random.uniform(1.5, 8.0), 2)
+            price = round(rng.uniform(1.5, 8.0), 2)
             
             products.append((
                 product_id,
@@ -117,7 +95,7 @@ def populate_product_data(cursor):
                 detail,
                 price,
                 eur_currency_id,
-                random.choice([True, False]) if random.random() < 0.2 else False,  # 20% chance of seasonal
+                rng.choice([True, False]) if rng.random() < 0.2 else False,  # 20% chance of seasonal
                 True,
                 'bakery'
             ))
@@ -132,7 +110,7 @@ def populate_product_data(cursor):
             product_id = f"C{i*3+j+1:03d}"
             detail = f"{size} {type_name}" if size else type_name
             # Price increases with size
-            base_price = random.uniform(2.0, 3.5)
+            base_price = rng.uniform(2.0, 3.5)
             price = round(base_price * (1 + j * 0.25), 2)  # 25% price increase per size
             
             products.append((
@@ -142,18 +120,19 @@ def populate_product_data(cursor):
                 detail,
                 price,
                 eur_currency_id,
-                random.choice([True, False]) if random.random() < 0.2 else False,  # 20% chance of seasonal
+                rng.choice([True, False]) if rng.random() < 0.2 else False,  # 20% chance of seasonal
                 True,
                 'coffee_shop'
             ))
     
     # Insert products
+    code = code_column(detect_schema_mode(cursor), 'Product')
     for product in products:
         cursor.execute(
-            """INSERT INTO Product 
-               (product_id, product_name, type_id, detail, base_price, currency_id, is_seasonal, is_active, data_source)
+            f"""INSERT INTO Product 
+               ({code}, product_name, type_id, detail, base_price, currency_id, is_seasonal, is_active, data_source)
                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-               ON CONFLICT (product_id) DO NOTHING""",
+               ON CONFLICT ({code}) DO NOTHING""",
             product
         )
     
@@ -161,6 +140,8 @@ def populate_product_data(cursor):
     return currencies, product_categories, db_product_types, products
 
 if __name__ == "__main__":
+    import psycopg2
+
     host = os.environ.get('DB_HOST', 'localhost')
     port = int(os.environ.get('DB_PORT', '5432'))
     dbname = os.environ.get('DB_NAME', 'OntoDb')
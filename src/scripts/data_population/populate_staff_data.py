@@ -1,132 +1,224 @@
 #!/usr/bin/env python3
-import random
+from bisect import bisect_right
 from datetime import datetime, timedelta
-import psycopg2
 import os
 import sys
 
-def populate_staff_data(cursor, stores):
-    """Populate Staff, StaffRole and Shift tables"""
-    print("Populating staff data...")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seeding import rng_for
+from reference_data import REFERENCE_DATA, sync_reference_data
+from schema_mode import code_column, detect_schema_mode, key_for_code, select_stores_sql
+
+FRENCH_FIRST_NAMES = [
+    "Alexandre", "Antoine", "Aurélie", "Camille", "Charlotte", "Claire", "Emma", "Etienne", 
+    "François", "Gabriel", "Hugo", "Isabelle", "Jean", "Julien", "Léa", "Lucas", "Lucie", 
+    "Marie", "Mathieu", "Nathalie", "Nicolas", "Olivier", "Philippe", "Pierre", "Sophie", 
+    "Sylvie", "Théo", "Thomas", "Valentine", "Zoé"
+]
+
+FRENCH_LAST_NAMES = [
+    "Bernard", "Blanc", "Bonnet", "Boucher", "Caron", "Charpentier", "Chevalier", "Dubois", 
+    "Dupont", "Durand", "Fabre", "Fontaine", "Fournier", "Garnier", "Girard", "Laurent", 
+    "Lefebvre", "Leroy", "Martin", "Mercier", "Michel", "Moreau", "Petit", "Richard", 
+    "Robert", "Roux", "Simon", "Thomas", "Vincent", "Lambert"
+]
+
+ROLES = REFERENCE_DATA['StaffRole'].rows
+
+# Number of days, ending at end_date, for which shifts are generated; matches
+# HISTORY_DAYS of the transaction history so every sale falls on a staffed day
+SHIFT_DAYS = 30
+
+def generate_store_staff(store_id, role_ids, seed=None, end_date=None):
+    """Generate the staff of one store as (first_name, last_name, role_id, store_id, hire_date) tuples"""
+    rng = rng_for(seed, 'staff', store_id)
+    end_date = end_date or datetime.now().date()
     
-    french_first_names = [
-        "Alexandre", "Antoine", "Aurélie", "Camille", "Charlotte", "Claire", "Emma", "Etienne", 
-        "François", "Gabriel", "Hugo", "Isabelle", "Jean", "Julien", "Léa", "Lucas", "Lucie", 
-        "Marie", "Mathieu", "Nathalie", "Nicolas", "Olivier", "Philippe", "Pierre", "Sophie", 
-        "Sylvie", "Théo", "Thomas", "Valentine", "Zoé"
-    ]
+    # Determine mix of staff based on store category
+    if 'BAK' in store_id:  # Bakery
+        role_distribution = {
+            'Cashier': rng.randint(2, 3),
+            'Baker': rng.randint(2, 4),
+            'Manager': 1
+        }
+    else:  # Coffee shop
+        role_distribution = {
+            'Cashier': rng.randint(1, 2),
+            'Barista': rng.randint(2, 4),
+            'Manager': 1,
+            'Assistant Manager': rng.randint(0, 1)
+        }
     
-    french_last_names = [
-        "Bernard", "Blanc", "Bonnet", "Boucher", "Caron", "Charpentier", "Chevalier", "Dubois", 
-        "Dupont", "Durand", "Fabre", "Fontaine", "Fournier", "Garnier", "Girard", "Laurent", 
-        "Lefebvre", "Leroy", "Martin", "Mercier", "Michel", "Moreau", "Petit", "Richard", 
-        "Robert", "Roux", "Simon", "Thomas", "Vincent", "Lambert"
-    ]
+    # Track used names to avoid duplicates within the store
+    used_names = set()
     
-    roles = [
-        ('Cashier', 12.50),
-        ('Barista', 14.00),
-        ('Baker', 15.50),
-        ('Manager', 20.00),
-        ('Assistant Manager', 18.00)
-    ]
+    def generate_unique_name():
+        while True:
+            first_name = rng.choice(FRENCH_FIRST_NAMES)
+            last_name = rng.choice(FRENCH_LAST_NAMES)
+            name_pair = (first_name, last_name)
+            if name_pair not in used_names:
+                used_names.add(name_pair)
+                return first_name, last_name
     
-    for name, rate in roles:
+    staff_members = []
+    for role, count in role_distribution.items():
+        for _ in range(count):
+            first_name, last_name = generate_unique_name()
+            
+            # Random hire date in the two years before end_date
+            hire_date = end_date - timedelta(days=rng.randint(30, 730))
+            
+            staff_members.append((
+                first_name,
+                last_name,
+                role_ids[role],
+                store_id,
+                hire_date.strftime("%Y-%m-%d")
+            ))
+    return staff_members
+
+def generate_shifts(store_id, day, staff_ids, seed=None):
+    """Generate the shifts of a store's staff on one day as (staff_id, store_id, shift_date, start, end) tuples"""
+    rng = rng_for(seed, 'shifts', store_id, day)
+    shifts = []
+    for staff_id in staff_ids:
+        # Not every staff works every day
+        if rng.random() < 0.7:  # 70% chance of working
+            # Coffee shops and bakeries typically open early
+            start_hour = rng.randint(6, 10)
+            shift_duration = rng.randint(6, 9)  # 6-9 hour shifts
+            
+            shifts.append((
+                staff_id,
+                store_id,
+                day,
+                f"{start_hour:02d}:00:00",
+                f"{(start_hour + shift_duration):02d}:00:00"
+            ))
+    return shifts
+
+def time_to_seconds(value):
+    """Convert 'HH:MM:SS' to seconds since midnight"""
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+class OnDutyIndex:
+    """Interval index of the staff on duty during one store-day.
+
+    The day is cut at every shift start and end into segments with a constant
+    set of on-duty staff, so staff_at() is a binary search. Segments nobody
+    covers (before opening, after closing, gaps between shifts) take the staff
+    of the nearest covered segment, see covers(); a day without shifts falls
+    back to every staff member.
+    """
+
+    def __init__(self, shifts, staff_ids):
+        intervals = [(time_to_seconds(start), time_to_seconds(end), staff_id)
+                     for staff_id, _, _, start, end in shifts]
+        self.bounds = sorted({t for start, end, _ in intervals for t in (start, end)}) or [0]
+        on_duty = [tuple(staff_id for start, end, staff_id in intervals if start <= t < end)
+                   for t in self.bounds]
+
+        covered = [i for i, staff in enumerate(on_duty) if staff]
+        self.covered = [bool(staff) for staff in on_duty]
+        if not covered:
+            on_duty = [tuple(staff_ids)] * len(self.bounds)
+        else:
+            on_duty = [staff or on_duty[min(covered, key=lambda c: abs(c - i))]
+                       for i, staff in enumerate(on_duty)]
+        self.on_duty = on_duty
+
+    def covers(self, seconds):
+        """Whether someone is on shift at a time of day, given in seconds since midnight"""
+        i = bisect_right(self.bounds, seconds) - 1
+        return i >= 0 and self.covered[i]
+
+    def staff_at(self, seconds):
+        """Return the staff_ids on duty at a time of day, given in seconds since midnight"""
+        return self.on_duty[max(bisect_right(self.bounds, seconds) - 1, 0)]
+
+def insert_shifts(cursor, shifts):
+    """Insert (staff_id, store_id, shift_date, start, end) tuples, store_id being the store code"""
+    store_key = key_for_code(detect_schema_mode(cursor), 'Store', '%s')
+    for shift in shifts:
         cursor.execute(
-            "INSERT INTO StaffRole (role_name, hourly_rate) VALUES (%s, %s) ON CONFLICT (role_name) DO NOTHING",
-            (name, rate)
+            f"""INSERT INTO Shift
+               (staff_id, store_id, shift_date, start_time, end_time)
+               VALUES (%s, {store_key}, %s, %s, %s)""",
+            shift
         )
+
+def load_store_shifts(cursor, dates):
+    """Return {(store_id, 'YYYY-MM-DD'): [shift tuple]} of the stored shifts of the given dates, store_id being the store code"""
+    cursor.execute(f"""
+        SELECT sh.staff_id, s.{code_column(detect_schema_mode(cursor), 'Store')}, to_char(sh.shift_date, 'YYYY-MM-DD'),
+               to_char(sh.start_time, 'HH24:MI:SS'), to_char(sh.end_time, 'HH24:MI:SS')
+        FROM Shift sh
+        JOIN Store s ON s.store_id = sh.store_id
+        WHERE sh.shift_date = ANY(%s::date[])
+        ORDER BY sh.shift_id
+    """, (list(dates),))
+    store_shifts = {}
+    for shift in cursor.fetchall():
+        store_shifts.setdefault((shift[1], shift[2]), []).append(shift)
+    return store_shifts
+
+def ensure_shifts(cursor, store_staff, dates, seed=None):
+    """Generate the shifts of the (store, date) slices that have none yet, e.g. for newly ingested days"""
+    store_key = key_for_code(detect_schema_mode(cursor), 'Store', '%s')
+    missing = []
+    for store_id, staff_ids in store_staff.items():
+        for day in dates:
+            cursor.execute(f"SELECT 1 FROM Shift WHERE store_id = {store_key} AND shift_date = %s LIMIT 1",
+                           (store_id, day))
+            if cursor.fetchone() is None:
+                missing.extend(generate_shifts(store_id, day, staff_ids, seed))
+    insert_shifts(cursor, missing)
+    return len(missing)
+
+def populate_staff_data(cursor, stores, seed=None, end_date=None):
+    """Populate Staff, StaffRole and Shift tables"""
+    print("Populating staff data...")
     
-    # Get role IDs
-    cursor.execute("SELECT role_id, role_name FROM StaffRole")
-    role_ids = {name: role_id for role_id, name in cursor.fetchall()}
+    role_ids = sync_reference_data(cursor, ['StaffRole'])['StaffRole']
     
-    # Track used names to avoid duplicates
-    used_names = set()
+    end_date = end_date or datetime.now().date()
+    shift_dates = [(end_date - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(SHIFT_DAYS)]
+    
+    # Staff and shifts reference the store key, looked up from the code in surrogate mode
+    store_key = key_for_code(detect_schema_mode(cursor), 'Store', '%s')
     
     # Create staff for each store
     staff_members = []
-    for store_id, store_name, category_id, region_id, *_ in stores:
-        # Determine mix of staff based on store category
-        if 'BAK' in store_id:  # Bakery
-            role_distribution = {
-                'Cashier': random.randint(2, 3),
-                'Baker': random.randint(2, 4),
-                'Manager': 1
-            }
-        else:  # Coffee shop
-            role_distribution = {
-                'Cashier': random.randint(1, 2),
-                'Barista': random.randint(2, 4),
-                'Manager': 1,
-                'Assistant Manager': random.randint(0, 1)
-            }
-        
-        # Generate a unique name function
-        def generate_unique_name():
-            while True:
-                first_name = random.choice(french_first_names)
-                last_name = random.choice(french_last_names)
-                name_pair = (first_name, last_name)
-                if name_pair not in used_names:
-                    used_names.add(name_pair)
-                    return first_name, last_name
-        
-        # Create staff with the determined distribution
-        for role, count in role_distribution.items():
-            for _ in range(count):
-                first_name, last_name = generate_unique_name()
-                
-                # Random hire date between store opening (let's assume 2 years ago for all) and now
-                hire_date = datetime.now() - timedelta(days=random.randint(30, 730))
-                hire_date_str = hire_date.strftime("%Y-%m-%d")
-                
-                staff_members.append((
-                    first_name,
-                    last_name,
-                    role_ids[role],
-                    store_id,
-                    hire_date_str
-                ))
-    
-    # Insert staff
-    for staff in staff_members:
-        cursor.execute(
-            """INSERT INTO Staff 
-               (first_name, last_name, role_id, store_id, hire_date)
-               VALUES (%s, %s, %s, %s, %s)
-               RETURNING staff_id""",
-            staff
-        )
+    for store_id, *_ in stores:
+        store_staff = generate_store_staff(store_id, role_ids, seed, end_date)
         
-        staff_id = cursor.fetchone()[0]
+        # Insert staff
+        staff_ids = []
+        for staff in store_staff:
+            cursor.execute(
+                f"""INSERT INTO Staff 
+                   (first_name, last_name, role_id, store_id, hire_date)
+                   VALUES (%s, %s, %s, {store_key}, %s)
+                   RETURNING staff_id""",
+                staff
+            )
+            staff_ids.append(cursor.fetchone()[0])
+        staff_members.extend(store_staff)
         
-        # Generate shifts for the past week for each staff member
-        today = datetime.now().date()
-        for day_offset in range(7):
-            shift_date = (today - timedelta(days=day_offset)).strftime("%Y-%m-%d")
-            
-            # Not every staff works every day
-            if random.random() < 0.7:  # 70% chance of working
-                # Coffee shops and bakeries typically open early
-                start_hour = random.randint(6, 10)
-                shift_duration = random.randint(6, 9)  # 6-9 hour shifts
-                
-                start_time = f"{start_hour:02d}:00:00"
-                end_time = f"{(start_hour + shift_duration):02d}:00:00"
-                
-                cursor.execute(
-                    """INSERT INTO Shift
-                       (staff_id, store_id, shift_date, start_time, end_time)
-                       VALUES (%s, %s, %s, %s, %s)""",
-                    (staff_id, staff[3], shift_date, start_time, end_time)
-                )
+        # Generate shifts over the history window for each staff member
+        for shift_date in shift_dates:
+            insert_shifts(cursor, generate_shifts(store_id, shift_date, staff_ids, seed))
     
     print(f"Populated data for {len(staff_members)} staff members with shifts")
-    return roles, staff_members
+    return ROLES, staff_members
 
 # Add this to enable running the script directly
 if __name__ == "__main__":
+    import psycopg2
+
     # Connection parameters
     host = os.environ.get('DB_HOST', 'localhost')
     port = int(os.environ.get('DB_PORT', '5432'))
@@ -147,7 +239,7 @@ if __name__ == "__main__":
     
     try:
         # First get store data
-        cursor.execute("SELECT store_id, store_name, store_category_id, region_id, address, phone, opening_date, data_source FROM Store")
+        cursor.execute(select_stores_sql(detect_schema_mode(cursor)))
         stores = cursor.fetchall()
         
         if not stores:
@@ -1,76 +1,49 @@
 #!/usr/bin/env python3
-import pandas as pd
-import random
 from datetime import datetime, timedelta
-import psycopg2
 import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reference_data import sync_reference_data
+from schema_mode import code_column, detect_schema_mode
+
 def populate_store_data(cursor):
     """Populate Store, StoreCategory, and StoreRegion tables"""
     print("Populating store data...")
     
-    # Ensure store categories exist
-    categories = [
-        ('Bakery', 'Traditional French bakery'),
-        ('Coffee Shop', 'Modern coffee and pastry shop')
-    ]
-    
-    for name, description in categories:
-        cursor.execute(
-            "INSERT INTO StoreCategory (category_name, description) VALUES (%s, %s) ON CONFLICT (category_name) DO NOTHING",
-            (name, description)
-        )
-    
-    # Get category IDs
-    cursor.execute("SELECT category_id, category_name FROM StoreCategory")
-    store_categories = cursor.fetchall()
-    bakery_id = next(cat_id for cat_id, name in store_categories if name.lower() == 'bakery')
-    coffee_id = next(cat_id for cat_id, name in store_categories if name.lower() == 'coffee shop')
-    
-    # Ensure regions exist
-    regions = [
-        ('Paris', 'France'),
-        ('Lyon', 'France'),
-        ('Marseille', 'France'),
-        ('Toulouse', 'France'),
-        ('Nice', 'France')
-    ]
-    
-    for name, country in regions:
-        cursor.execute(
-            "INSERT INTO StoreRegion (region_name, country) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-            (name, country)
-        )
-    
-    # Get region IDs
-    cursor.execute("SELECT region_id, region_name FROM StoreRegion")
-    regions = cursor.fetchall()
+    reference = sync_reference_data(cursor, ['StoreCategory', 'StoreRegion'])
+    bakery_id = reference['StoreCategory']['Bakery']
+    coffee_id = reference['StoreCategory']['Coffee Shop']
+    region_ids = {name: region_id for (name, country), region_id in reference['StoreRegion'].items()}
+    store_categories = sorted((cat_id, name) for name, cat_id in reference['StoreCategory'].items())
+    regions = sorted((region_id, name) for name, region_id in region_ids.items())
     
     # Create stores with more realistic data
     stores = [
         # Bakery stores
-        ('BAK001', 'Le Pain Quotidien', bakery_id, regions[0][0], '23 Rue Saint-Michel', '+33145789012', '2018-05-12', 'bakery'),
-        ('BAK002', 'Boulangerie Moderne', bakery_id, regions[1][0], '45 Avenue Victor Hugo', '+33478123456', '2019-03-22', 'bakery'),
-        ('BAK003', 'La Mie Dorée', bakery_id, regions[2][0], '12 Rue de la République', '+33491234567', '2017-11-08', 'bakery'),
-        ('BAK004', 'Aux Délices du Pain', bakery_id, regions[3][0], '78 Rue Alsace-Lorraine', '+33561234567', '2020-02-15', 'bakery'),
-        ('BAK005', 'Maison du Boulanger', bakery_id, regions[4][0], '34 Avenue Jean Médecin', '+33493456789', '2019-08-30', 'bakery'),
+        ('BAK001', 'Le Pain Quotidien', bakery_id, region_ids['Paris'], '23 Rue Saint-Michel', '+33145789012', '2018-05-12', 'bakery'),
+        ('BAK002', 'Boulangerie Moderne', bakery_id, region_ids['Lyon'], '45 Avenue Victor Hugo', '+33478123456', '2019-03-22', 'bakery'),
+        ('BAK003', 'La Mie Dorée', bakery_id, region_ids['Marseille'], '12 Rue de la République', '+33491234567', '2017-11-08', 'bakery'),
+        ('BAK004', 'Aux Délices du Pain', bakery_id, region_ids['Toulouse'], '78 Rue Alsace-Lorraine', '+33561234567', '2020-02-15', 'bakery'),
+        ('BAK005', 'Maison du Boulanger', bakery_id, region_ids['Nice'], '34 Avenue Jean Médecin', '+33493456789', '2019-08-30', 'bakery'),
         
         # Coffee shops
-        ('COF001', 'Café Express', coffee_id, regions[0][0], '78 Boulevard Haussmann', '+33142567890', '2020-01-15', 'coffee_shop'),
-        ('COF002', 'Le Petit Café', coffee_id, regions[1][0], '34 Rue Garibaldi', '+33472345678', '2019-07-19', 'coffee_shop'),
-        ('COF003', 'Arômes & Saveurs', coffee_id, regions[2][0], '56 La Canebière', '+33496789012', '2021-02-28', 'coffee_shop'),
-        ('COF004', 'Café de la Place', coffee_id, regions[3][0], '22 Place du Capitole', '+33567890123', '2018-11-05', 'coffee_shop'),
-        ('COF005', 'Le Café Azur', coffee_id, regions[4][0], '15 Promenade des Anglais', '+33498765432', '2021-04-10', 'coffee_shop')
+        ('COF001', 'Café Express', coffee_id, region_ids['Paris'], '78 Boulevard Haussmann', '+33142567890', '2020-01-15', 'coffee_shop'),
+        ('COF002', 'Le Petit Café', coffee_id, region_ids['Lyon'], '34 Rue Garibaldi', '+33472345678', '2019-07-19', 'coffee_shop'),
+        ('COF003', 'Arômes & Saveurs', coffee_id, region_ids['Marseille'], '56 La Canebière', '+33496789012', '2021-02-28', 'coffee_shop'),
+        ('COF004', 'Café de la Place', coffee_id, region_ids['Toulouse'], '22 Place du Capitole', '+33567890123', '2018-11-05', 'coffee_shop'),
+        ('COF005', 'Le Café Azur', coffee_id, region_ids['Nice'], '15 Promenade des Anglais', '+33498765432', '2021-04-10', 'coffee_shop')
     ]
     
     # Insert stores with ON CONFLICT DO NOTHING to avoid duplicates
+    code = code_column(detect_schema_mode(cursor), 'Store')
     for store in stores:
         cursor.execute(
-            """INSERT INTO Store 
-               (store_id, store_name, store_category_id, region_id, address, phone, opening_date, data_source) 
+            f"""INSERT INTO Store 
+               ({code}, store_name, store_category_id, region_id, address, phone, opening_date, data_source) 
                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-               ON CONFLICT (store_id) DO NOTHING""",
+               ON CONFLICT ({code}) DO NOTHING""",
             store
         )
     
@@ -88,6 +61,8 @@ stores = None
 
 # Add this to enable running the script directly
 if __name__ == "__main__":
+    import psycopg2
+
     # Connection parameters
     host = os.environ.get('DB_HOST', 'localhost')
     port = int(os.environ.get('DB_PORT', '5432'))
@@ -1,193 +1,261 @@
 #!/usr/bin/env python3
-import random
 from datetime import datetime, timedelta
-from tqdm import tqdm
-import psycopg2
 import os
 import sys
 
-def populate_transaction_data(cursor, stores, products):
-    """Populate Transaction, TransactionItem and PaymentMethod tables"""
-    print("Populating transaction data...")
-    
-    # Ensure payment methods exist
-    payment_methods = [
-        ('Cash', 'Physical currency'),
-        ('Credit Card', 'Visa, MasterCard, Amex, etc.'),
-        ('Debit Card', 'Bank cards that deduct directly from accounts'),
-        ('Mobile Payment', 'Apple Pay, Google Pay, etc.')
-    ]
-    
-    for name, description in payment_methods:
-        cursor.execute(
-            "INSERT INTO PaymentMethod (method_name, description) VALUES (%s, %s) ON CONFLICT (method_name) DO NOTHING",
-            (name, description)
-        )
-    
-    # Get payment method IDs
-    cursor.execute("SELECT payment_method_id, method_name FROM PaymentMethod")
-    payment_method_ids = {name: pm_id for pm_id, name in cursor.fetchall()}
-    
-    # Get EUR currency ID
-    cursor.execute("SELECT currency_id FROM Currency WHERE currency_code = 'EUR'")
-    eur_currency_id = cursor.fetchone()[0]
-    
-    # Group products by data source
-    bakery_products = [p for p in products if p[8] == 'bakery']
-    coffee_products = [p for p in products if p[8] == 'coffee_shop']
-    
-    # Get staff for each store
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seeding import rng_for
+from reference_data import REFERENCE_DATA, sync_reference_data
+from demand_model import DemandModel
+from populate_staff_data import OnDutyIndex, load_store_shifts
+from schema_mode import detect_schema_mode, key_for_code, select_products_sql, select_stores_sql
+
+# Transactions generated per store over the default history window (scale factor 1)
+TRANSACTIONS_PER_STORE = {'bakery': 100, 'coffee_shop': 150}
+HISTORY_DAYS = 30
+
+# Column order of the rows encoded from generated FactBatches
+TRANSACTION_COLUMNS = ['transaction_id', 'store_id', 'transaction_date', 'transaction_time',
+                       'payment_method_id', 'staff_id', 'total_amount', 'currency_id', 'data_source']
+TRANSACTION_ITEM_COLUMNS = ['transaction_id', 'product_id', 'quantity', 'unit_price',
+                            'discount_percent', 'item_total', 'sale_id']
+
+# Draws of a sale time before accepting one when no staff member is on shift
+UNSTAFFED_TIME_RETRIES = 4
+
+PAYMENT_METHODS = REFERENCE_DATA['PaymentMethod'].rows
+
+def ensure_payment_methods(cursor):
+    """Make sure the payment methods exist and return a {method_name: payment_method_id} map"""
+    return sync_reference_data(cursor, ['PaymentMethod'])['PaymentMethod']
+
+def get_store_staff(cursor, stores):
+    """Return a {store_id: [staff_id, ...]} map for stores that have staff"""
     store_staff = {}
+    store_key = key_for_code(detect_schema_mode(cursor), 'Store', '%s')
     for store_id, *_ in stores:
-        cursor.execute("SELECT staff_id FROM Staff WHERE store_id = %s", (store_id,))
+        cursor.execute(f"SELECT staff_id FROM Staff WHERE store_id = {store_key} ORDER BY staff_id", (store_id,))
         staff = [s[0] for s in cursor.fetchall()]
         if staff:
             store_staff[store_id] = staff
+    return store_staff
+
+def history_dates(end_date=None, days=HISTORY_DAYS):
+    """Return the 'YYYY-MM-DD' dates of the history window ending at end_date (default: today)"""
+    end_date = end_date or datetime.now().date()
+    return [(end_date - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(days)]
+
+def daily_transaction_means(scale_factor=1):
+    """Return the mean number of transactions per store and day for each data source"""
+    return {source: count * scale_factor / HISTORY_DAYS for source, count in TRANSACTIONS_PER_STORE.items()}
+
+def hour_weights_for(store_id):
+    """Return the 24 hourly weights of the store's business hours"""
+    hour_weights = [1] * 24  # Initialize weights
+    # Bakeries are busier in morning, coffee shops throughout day
+    for h in range(24):
+        if 'BAK' in store_id:
+            if 6 <= h <= 10:  # Morning rush for bakeries
+                hour_weights[h] = 10
+            elif 11 <= h <= 14:  # Lunch
+                hour_weights[h] = 7
+            elif h < 6 or h > 19:  # Closed hours
+                hour_weights[h] = 0
+        else:  # Coffee shop
+            if 7 <= h <= 11:  # Morning coffee
+                hour_weights[h] = 9
+            elif 12 <= h <= 15:  # Lunch hour
+                hour_weights[h] = 7
+            elif 16 <= h <= 18:  # Afternoon
+                hour_weights[h] = 5
+            elif h < 6 or h > 20:  # Closed hours
+                hour_weights[h] = 0
+    return hour_weights
+
+def generate_store_day(store_id, day, model, codes, staff, shifts, payment_table, currency_id, daily_mean, seed):
+    """Generate the transactions and items of one store on one day as a FactBatch.
     
-    # Generate transactions
-    transactions = []
-    transaction_items = []
+    The slice draws from its own RNG derived from (seed, store_id, day), so it can
+    be regenerated independently of every other slice. Volume, hours, baskets and
+    quantities follow the DemandModel, and each sale goes to a staff member on
+    shift at its time. shifts are the day's stored Shift rows, see
+    load_store_shifts(), so sales match the shifts whatever seed loaded them.
+    """
+    # fact_store pulls in numpy, which commands like `ingest --help` never need
+    from fact_store import MAX_DAY_TRANSACTIONS, SOURCES, FactBatch, day_number, to_cents
+
+    rng = rng_for(seed, 'transactions', store_id, day)
+    on_duty = OnDutyIndex(shifts, staff)
+    source = 'bakery' if 'BAK' in store_id else 'coffee_shop'
+    month = int(day[5:7])
+    store = codes.store_index[store_id]
+    day_index = day_number(day)
     
-    # Dates for the past month
-    today = datetime.now().date()
-    dates = [(today - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(30)]
+    # Stochastic rounding keeps the expected volume equal to the day's mean
+    mean = daily_mean * model.day_factor(store_id, source, day)
+    num_transactions = int(mean) + (1 if rng.random() < mean - int(mean) else 0)
+    if num_transactions > MAX_DAY_TRANSACTIONS:
+        raise ValueError(f"{store_id} would get {num_transactions} transactions on {day}, more than the "
+                         f"{MAX_DAY_TRANSACTIONS} a transaction_id can number; use a smaller scale factor")
     
-    # Transaction count total to show a progress bar
-    total_transactions = sum(100 if 'BAK' in store[0] else 150 for store in stores)
+    transactions = []
+    transaction_items = []
     
-    with tqdm(total=total_transactions, desc="Generating transactions") as pbar:
-        for store_id, store_name, category_id, *_ in stores:
-            # Each store gets different number of transactions based on type
-            num_transactions = 100 if 'BAK' in store_id else 150
+    for number in range(1, num_transactions + 1):
+        # Nobody sells while nobody is on shift: redraw unstaffed times a few times
+        for _ in range(UNSTAFFED_TIME_RETRIES):
+            hour = model.sample_hour(rng, store_id)
+            minute = rng.randint(0, 59)
+            second = rng.randint(0, 59)
+            if on_duty.covers(hour * 3600 + minute * 60 + second):
+                break
+        seconds = hour * 3600 + minute * 60 + second
+        
+        payment_method_id = payment_table.sample(rng)
+        
+        staff_id = rng.choice(on_duty.staff_at(seconds))
+        
+        total_cents = 0
+        
+        for j, product in enumerate(model.sample_basket(rng, source, month)):
+            product_id, _, _, _, base_price, *_ = product
+            
+            # Convert base_price to float to avoid decimal.Decimal incompatibility
+            base_price = float(base_price)
+            
+            quantity = model.sample_quantity(rng)
             
-            # Products relevant to this store
-            relevant_products = bakery_products if 'BAK' in store_id else coffee_products
+            # Apply discount sometimes
+            discount_percent = 0
+            if rng.random() < 0.1:  # 10% chance of discount
+                discount_percent = rng.choice([5, 10, 15])
             
-            # Staff for this store
-            staff = store_staff.get(store_id, [])
-            if not staff:
-                continue  # Skip if no staff
+            # Calculate item total
+            item_price = base_price * (1 - discount_percent / 100)
+            item_cents = to_cents(round(item_price * quantity, 2))
+            total_cents += item_cents
             
-            for i in range(num_transactions):
-                transaction_id = f"{'B' if 'BAK' in store_id else 'C'}TX{len(transactions) + 1:05d}"
-                transaction_date = random.choice(dates)
-                
-                # Time distribution based on business hours
-                hour_weights = [1] * 24  # Initialize weights
-                # Bakeries are busier in morning, coffee shops throughout day
-                for h in range(24):
-                    if 'BAK' in store_id:
-                        if 6 <= h <= 10:  # Morning rush for bakeries
-                            hour_weights[h] = 10
-                        elif 11 <= h <= 14:  # Lunch
-                            hour_weights[h] = 7
-                        elif h < 6 or h > 19:  # Closed hours
-                            hour_weights[h] = 0
-                    else:  # Coffee shop
-                        if 7 <= h <= 11:  # Morning coffee
-                            hour_weights[h] = 9
-                        elif 12 <= h <= 15:  # Lunch hour
-                            hour_weights[h] = 7
-                        elif 16 <= h <= 18:  # Afternoon
-                            hour_weights[h] = 5
-                        elif h < 6 or h > 20:  # Closed hours
-                            hour_weights[h] = 0
-                
-                # Select hour based on weights
-                hour = random.choices(range(24), weights=hour_weights)[0]
-                minute = random.randint(0, 59)
-                second = random.randint(0, 59)
-                transaction_time = f"{hour:02d}:{minute:02d}:{second:02d}"
-                
-                payment_method_id = random.choices(
-                    list(payment_method_ids.values()),
-                    weights=[0.35, 0.30, 0.25, 0.10]  # Cash more common in bakery/cafe
-                )[0]
-                
-                staff_id = random.choice(staff)
-                
-                # Each transaction has 1-4 items
-                num_items = random.choices([1, 2, 3, 4], weights=[0.4, 0.3, 0.2, 0.1])[0]
-                transaction_products = random.sample(relevant_products, min(num_items, len(relevant_products)))
-                
-                total_amount = 0
-                transaction_items_batch = []
-                
-                for j, product in enumerate(transaction_products):
-                    product_id, _, _, _, base_price, *_ = product
-                    
-                    # Convert base_price to float to avoid decimal.Decimal incompatibility
-                    base_price = float(base_price)
-                    
-                    quantity = random.choices([1, 2, 3], weights=[0.7, 0.2, 0.1])[0]
-                    
-                    # Apply discount sometimes
-                    discount_percent = 0.0
-                    if random.random() < 0.1:  # 10% chance of discount
-                        discount_percent = random.choice([5.0, 10.0, 15.0])
-                    
-                    # Calculate item total
-                    item_price = base_price * (1 - discount_percent / 100)
-                    item_total = round(item_price * quantity, 2)
-                    total_amount += item_total
-                    
-                    sale_id = f"{transaction_id}_{j+1}"
-                    
-                    transaction_items_batch.append((
-                        transaction_id,
-                        product_id,
-                        quantity,
-                        base_price,
-                        discount_percent,
-                        item_total,
-                        sale_id
-                    ))
-                
-                # Add transaction with its total
-                transactions.append((
-                    transaction_id,
-                    store_id,
-                    transaction_date,
-                    transaction_time,
-                    payment_method_id,
-                    staff_id,
-                    round(total_amount, 2),
-                    eur_currency_id,
-                    'bakery' if 'BAK' in store_id else 'coffee_shop'
-                ))
-                
-                # Extend transaction_items list
-                transaction_items.extend(transaction_items_batch)
-                
-                pbar.update(1)
-    
-    # Batch insert transactions
-    print(f"Inserting {len(transactions)} transactions")
-    for transaction in tqdm(transactions, desc="Inserting transactions"):
-        cursor.execute(
-            """INSERT INTO Transaction
-               (transaction_id, store_id, transaction_date, transaction_time, 
-                payment_method_id, staff_id, total_amount, currency_id, data_source)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-               ON CONFLICT (transaction_id) DO NOTHING""",
-            transaction
-        )
-    
-    # Batch insert transaction items
-    print(f"Inserting {len(transaction_items)} transaction items")
-    for item in tqdm(transaction_items, desc="Inserting transaction items"):
-        cursor.execute(
-            """INSERT INTO TransactionItem
-               (transaction_id, product_id, quantity, unit_price, discount_percent, item_total, sale_id)
-               VALUES (%s, %s, %s, %s, %s, %s, %s)
-               ON CONFLICT (sale_id) DO NOTHING""",
-            item
-        )
-    
-    print(f"Populated data for {len(transactions)} transactions with {len(transaction_items)} items")
-    return payment_methods, transactions, transaction_items
+            transaction_items.append((
+                len(transactions),
+                codes.product_index[product_id],
+                quantity,
+                to_cents(base_price),
+                discount_percent,
+                item_cents,
+                j + 1
+            ))
+        
+        transactions.append((
+            store,
+            day_index,
+            number,
+            seconds,
+            payment_method_id,
+            staff_id,
+            total_cents,
+            currency_id,
+            SOURCES.index(source)
+        ))
+    
+    return FactBatch.from_records(codes, transactions, transaction_items)
+
+def generate_transactions(stores, products, store_staff, store_shifts, payment_method_ids, currency_id,
+                          dates, daily_means, seed=None, progress=None):
+    """Generate transactions and their items for every (store, date) slice as one FactBatch.
+    
+    store_shifts maps (store_id, date) to the slice's shifts, see load_store_shifts().
+    daily_means maps a data source ('bakery' or 'coffee_shop') to the mean number
+    of transactions per store and day, see daily_transaction_means(); the demand
+    model then scales it per store, weekday and month.
+    """
+    from fact_store import FactBatch, FactCodes
+
+    # The sampling tables are built once per run and shared by every slice
+    model = DemandModel(stores, products, hour_weights_for, seed=seed)
+    payment_table = model.payment_table(payment_method_ids)
+    codes = FactCodes(stores, products)
+    
+    batches = []
+    
+    for store_id, *_ in stores:
+        source = 'bakery' if 'BAK' in store_id else 'coffee_shop'
+        
+        # Staff for this store
+        staff = store_staff.get(store_id, [])
+        if not staff:
+            continue  # Skip if no staff
+        
+        for day in dates:
+            batches.append(generate_store_day(
+                store_id, day, model, codes, staff, store_shifts.get((store_id, day), []), payment_table,
+                currency_id, daily_means[source], seed
+            ))
+            
+            if progress is not None:
+                progress.update(1)
+    
+    return FactBatch.concat(codes, batches)
+
+def populate_transaction_data(cursor, stores, products, scale_factor=1, seed=None, end_date=None,
+                              params=None, generators=2, writers=2, queue_size=8, bulk=False):
+    """Populate Transaction, TransactionItem and PaymentMethod tables.
+    
+    scale_factor multiplies the number of transactions generated per store, and
+    the history window ends at end_date (default: today). Generation and loading
+    overlap through the pipeline in pipeline.py; its writers connect with params
+    (default: the DB_* environment variables). bulk=True loads through unlogged
+    staging tables with deferred foreign key validation, see bulk_load.py.
+    """
+    # tqdm and the pipeline are only needed here, keep them out of module import time
+    from tqdm import tqdm
+    from db import get_db_params
+    from pipeline import load_transactions_pipelined
+
+    print("Populating transaction data...")
+    
+    payment_method_ids = ensure_payment_methods(cursor)
+    
+    # Get EUR currency ID
+    cursor.execute("SELECT currency_id FROM Currency WHERE currency_code = 'EUR'")
+    eur_currency_id = cursor.fetchone()[0]
+    
+    store_staff = get_store_staff(cursor, stores)
+    
+    # Dates for the past month
+    dates = history_dates(end_date)
+    store_shifts = load_store_shifts(cursor, dates)
+    
+    bulk_tables = None
+    if bulk:
+        from bulk_load import create_bulk_staging
+        bulk_tables = create_bulk_staging(cursor)
+    
+    try:
+        with tqdm(total=len(store_staff) * len(dates), desc="Loading transactions", unit="store-day") as pbar:
+            stats = load_transactions_pipelined(
+                params or get_db_params(), stores, products, store_staff, store_shifts, payment_method_ids, eur_currency_id,
+                dates, daily_transaction_means(scale_factor), seed=seed, generators=generators,
+                writers=writers, queue_size=queue_size, progress=pbar, bulk_tables=bulk_tables
+            )
+        print(stats.report())
+        
+        if bulk:
+            from bulk_load import publish_staging
+            timings = publish_staging(cursor.connection, TRANSACTION_COLUMNS, TRANSACTION_ITEM_COLUMNS)
+            print(f"Bulk load: staged in {stats.elapsed_seconds:.2f}s, inserted in {timings['insert']:.2f}s, "
+                  f"validated foreign keys in {timings['validate']:.2f}s")
+    finally:
+        if bulk:
+            from bulk_load import drop_bulk_staging
+            drop_bulk_staging(cursor)
+    
+    print(f"Populated data for {stats.transactions} transactions with {stats.items} items")
+    return PAYMENT_METHODS, stats.transactions, stats.items
 
 if __name__ == "__main__":
+    import psycopg2
+
     host = os.environ.get('DB_HOST', 'localhost')
     port = int(os.environ.get('DB_PORT', '5432'))
     dbname = os.environ.get('DB_NAME', 'OntoDb')
@@ -205,18 +273,15 @@ if __name__ == "__main__":
     cursor = conn.cursor()
     
     try:
-        cursor.execute("SELECT store_id, store_name, store_category_id, region_id, address, phone, opening_date, data_source FROM Store")
+        mode = detect_schema_mode(cursor)
+        cursor.execute(select_stores_sql(mode))
         stores = cursor.fetchall()
         
         if not stores:
             print("No stores found in database. Please run populate_store_data.py first.")
             sys.exit(1)
             
-        cursor.execute("""
-            SELECT product_id, product_name, type_id, detail, base_price, 
-                   currency_id, is_seasonal, is_active, data_source 
-            FROM Product
-        """)
+        cursor.execute(select_products_sql(mode))
         products = cursor.fetchall()
         
         if not products:
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Declarative reference data of the populate modules.
+
+REFERENCE_DATA lists the desired rows of every small lookup table. Each table
+is synced with a single multi-row upsert whose RETURNING result, combined with
+the rows that already matched, gives the {key: id} map directly, so the
+populate modules no longer insert row by row and re-select.
+
+A hash of the desired rows is kept in DatasetInfo after each sync. When it is
+unchanged the upsert is skipped and the IDs of all such tables are read back in
+one query, so a populate run starts with a constant number of round trips.
+"""
+import hashlib
+import json
+
+class ReferenceTable:
+    """Desired contents of one lookup table, identified by its key columns"""
+
+    def __init__(self, id_column, key, values, rows):
+        self.id_column = id_column
+        self.key = key
+        self.values = values
+        self.rows = rows
+
+    @property
+    def columns(self):
+        return self.key + self.values
+
+    def row_key(self, row):
+        """Return the map key of a row: the key value, or a tuple of them"""
+        key = tuple(row[:len(self.key)])
+        return key[0] if len(key) == 1 else key
+
+    def content_hash(self):
+        document = json.dumps([self.columns, self.rows], default=str, ensure_ascii=False)
+        return hashlib.sha256(document.encode()).hexdigest()
+
+REFERENCE_DATA = {
+    'Currency': ReferenceTable('currency_id', ['currency_code'], ['currency_name', 'symbol'], [
+        ('EUR', 'Euro', '€'),
+        ('USD', 'US Dollar', '$'),
+    ]),
+    'StoreCategory': ReferenceTable('category_id', ['category_name'], ['description'], [
+        ('Bakery', 'Traditional French bakery'),
+        ('Coffee Shop', 'Modern coffee and pastry shop'),
+    ]),
+    'StoreRegion': ReferenceTable('region_id', ['region_name', 'country'], [], [
+        ('Paris', 'France'),
+        ('Lyon', 'France'),
+        ('Marseille', 'France'),
+        ('Toulouse', 'France'),
+        ('Nice', 'France'),
+    ]),
+    'ProductCategory': ReferenceTable('category_id', ['category_name'], ['description'], [
+        ('Pastry', 'Sweet and savory pastry products'),
+        ('Bread', 'Traditional and artisanal breads'),
+        ('Coffee', 'Coffee beverages and espresso-based drinks'),
+        ('Tea', 'Hot and cold tea beverages'),
+        ('Sandwich', 'Fresh made sandwiches'),
+        ('Cake', 'Cakes and desserts'),
+    ]),
+    'StaffRole': ReferenceTable('role_id', ['role_name'], ['hourly_rate'], [
+        ('Cashier', 12.50),
+        ('Barista', 14.00),
+        ('Baker', 15.50),
+        ('Manager', 20.00),
+        ('Assistant Manager', 18.00),
+    ]),
+    'PaymentMethod': ReferenceTable('payment_method_id', ['method_name'], ['description'], [
+        ('Cash', 'Physical currency'),
+        ('Credit Card', 'Visa, MasterCard, Amex, etc.'),
+        ('Debit Card', 'Bank cards that deduct directly from accounts'),
+        ('Mobile Payment', 'Apple Pay, Google Pay, etc.'),
+    ]),
+}
+
+HASH_KEY_PREFIX = 'reference_hash.'
+
+def ensure_key_constraint(cursor, table, spec):
+    """Add the unique constraint on the key columns that the upsert's ON CONFLICT needs, if missing.
+
+    Databases created before init.sql declared UNIQUE (region_name, country)
+    lack it and may hold duplicate regions; those are merged into the lowest
+    id first, re-pointing the rows that reference them.
+    """
+    cursor.execute("""
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = %s::regclass AND i.indisunique AND i.indpred IS NULL
+          AND ARRAY(SELECT a.attname::text FROM pg_attribute a
+                    WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    ORDER BY a.attname) = %s::text[]
+    """, (table.lower(), sorted(spec.key)))
+    if cursor.fetchone():
+        return False
+
+    duplicates = f"""
+        (SELECT {spec.id_column} AS id, MIN({spec.id_column}) OVER (PARTITION BY {', '.join(spec.key)}) AS keep
+         FROM {table}) m
+    """
+    cursor.execute("""
+        SELECT c.conrelid::regclass::text, a.attname
+        FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+        WHERE c.confrelid = %s::regclass AND c.contype = 'f'
+    """, (table.lower(),))
+    for referencing, column in cursor.fetchall():
+        cursor.execute(f"UPDATE {referencing} r SET {column} = m.keep FROM {duplicates} "
+                       f"WHERE r.{column} = m.id AND m.id <> m.keep")
+    cursor.execute(f"DELETE FROM {table} t USING {duplicates} WHERE t.{spec.id_column} = m.id AND m.id <> m.keep")
+    merged = cursor.rowcount
+    cursor.execute(f"ALTER TABLE {table} ADD UNIQUE ({', '.join(spec.key)})")
+    print(f"Added UNIQUE ({', '.join(spec.key)}) to {table}"
+          + (f", merging {merged} duplicate rows" if merged else ""))
+    return True
+
+def upsert_sql(cursor, table, spec):
+    """Return the upsert of the desired rows, selecting (id, key columns...) of every desired row
+
+    Updated and inserted rows come from RETURNING; rows that already matched
+    are read from the table, whose snapshot predates the insert.
+    """
+    columns = ', '.join(spec.columns)
+    key = ', '.join(spec.key)
+    placeholders = '(' + ', '.join(['%s'] * len(spec.columns)) + ')'
+    values = ', '.join(cursor.mogrify(placeholders, row).decode() for row in spec.rows)
+    if spec.values:
+        current = ', '.join(f"{table}.{c}" for c in spec.values)
+        incoming = ', '.join(f"EXCLUDED.{c}" for c in spec.values)
+        conflict = (f"DO UPDATE SET ({', '.join(spec.values)}) = ROW({incoming}) "
+                    f"WHERE ROW({current}) IS DISTINCT FROM ROW({incoming})")
+    else:
+        conflict = "DO NOTHING"
+    return f"""
+        WITH desired ({columns}) AS (VALUES {values}),
+        upserted AS (
+            INSERT INTO {table} ({columns}) SELECT * FROM desired
+            ON CONFLICT ({key}) {conflict}
+            RETURNING {spec.id_column}, {key}
+        )
+        SELECT * FROM upserted
+        UNION
+        SELECT t.{spec.id_column}, {', '.join(f't.{c}' for c in spec.key)}
+        FROM {table} t JOIN desired USING ({key})
+    """
+
+def lookup_sql(table, spec):
+    """Return a query of ('table', id, key text) for the rows of a table, for UNION ALL across tables"""
+    key = ' || chr(31) || '.join(f"{c}::text" for c in spec.key)
+    return f"SELECT '{table}', {spec.id_column}, {key} FROM {table}"
+
+def sync_reference_data(cursor, tables):
+    """Make the given REFERENCE_DATA tables hold their desired rows, returning {table: {key: id}}
+
+    Costs one query for the stored hashes, one to read back unchanged tables,
+    a constraint check and one upsert per changed table and one to record the
+    new hashes.
+    """
+    specs = {table: REFERENCE_DATA[table] for table in tables}
+    hashes = {table: spec.content_hash() for table, spec in specs.items()}
+    cursor.execute("SELECT key, value FROM DatasetInfo WHERE key = ANY(%s)",
+                   ([HASH_KEY_PREFIX + table for table in specs],))
+    stored = {key[len(HASH_KEY_PREFIX):]: value for key, value in cursor.fetchall()}
+
+    ids = {table: {} for table in specs}
+    unchanged = [table for table in specs if stored.get(table) == hashes[table]]
+    if unchanged:
+        cursor.execute(' UNION ALL '.join(lookup_sql(table, specs[table]) for table in unchanged))
+        by_text = {}
+        for table, row_id, key in cursor.fetchall():
+            by_text.setdefault(table, {})[key] = row_id
+        for table in unchanged:
+            spec = specs[table]
+            for row in spec.rows:
+                row_id = by_text.get(table, {}).get(chr(31).join(str(v) for v in row[:len(spec.key)]))
+                if row_id is None:
+                    # Rows removed behind our back: sync the table after all
+                    ids[table] = {}
+                    break
+                ids[table][spec.row_key(row)] = row_id
+
+    changed = [table for table in specs if not ids[table]]
+    for table in changed:
+        ensure_key_constraint(cursor, table, specs[table])
+        cursor.execute(upsert_sql(cursor, table, specs[table]))
+        ids[table] = {specs[table].row_key(row[1:]): row[0] for row in cursor.fetchall()}
+
+    if changed:
+        values = ', '.join(cursor.mogrify("(%s, %s)", (HASH_KEY_PREFIX + table, hashes[table])).decode()
+                           for table in changed)
+        cursor.execute(f"""INSERT INTO DatasetInfo (key, value) VALUES {values}
+                           ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value""")
+        print(f"Synced reference data of {', '.join(changed)}")
+    return ids
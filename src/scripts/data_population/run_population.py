@@ -1,22 +1,17 @@
 #!/usr/bin/env python3
-import psycopg2
 import os
 import sys
 import time
-import random
-from datetime import datetime, timedelta
 import argparse
+from datetime import date
 
 # Import modules with explicit paths to avoid relative import issues
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-# Import modules rather than specific functions
-import populate_store_data
-import populate_staff_data  # Changed to import the whole module
-from populate_product_data import populate_product_data
-from populate_transaction_data import populate_transaction_data
 
 def wait_for_db(host, dbname, user, password, port=5432, max_attempts=10):
     """Wait for database to be available, with improved error handling"""
+    import psycopg2
+
     print(f"Trying to connect to PostgreSQL at {host}:{port}...")
     
     for attempt in range(1, max_attempts + 1):
@@ -44,11 +39,34 @@ def wait_for_db(host, dbname, user, password, port=5432, max_attempts=10):
     print("3. If running locally, ensure PostgreSQL is installed and running")
     return False
 
-def main():
+def record_dataset_info(cursor, **info):
+    """Remember the generation parameters of the loaded data (used to key snapshots)"""
+    for key, value in info.items():
+        cursor.execute(
+            """INSERT INTO DatasetInfo (key, value) VALUES (%s, %s)
+               ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value""",
+            (key, str(value))
+        )
+
+def main(argv=None):
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Populate database tables with sample data')
     parser.add_argument('--tables', nargs='+', choices=['all', 'store', 'product', 'staff', 'transaction'],
                       default=['all'], help='Specify which tables to populate')
+    parser.add_argument('--scale-factor', type=float, default=1.0,
+                      help='Multiplier for the number of generated transactions (default: 1)')
+    parser.add_argument('--seed', type=int, default=42,
+                      help='Random seed for reproducible data (default: 42)')
+    parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                      help='Last day of the generated history, YYYY-MM-DD (default: today)')
+    parser.add_argument('--generators', type=int, default=2,
+                      help='Transaction generator threads (default: 2)')
+    parser.add_argument('--writers', type=int, default=2,
+                      help='Transaction writer threads, each with its own connection (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=8,
+                      help='Maximum number of generated batches waiting to be written (default: 8)')
+    parser.add_argument('--bulk-load', action='store_true',
+                      help='Load transactions through unlogged staging tables with deferred foreign key validation')
     parser.add_argument('--host', default=os.environ.get('DB_HOST', 'localhost'),
                       help='Database host (default: localhost or DB_HOST env var)')
     parser.add_argument('--port', type=int, default=int(os.environ.get('DB_PORT', '5432')),
@@ -60,10 +78,20 @@ def main():
     parser.add_argument('--password', default=os.environ.get('DB_PASSWORD', 'admin'),
                       help='Database password (default: admin or DB_PASSWORD env var)')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
-    # Set seed for reproducibility
-    random.seed(42)
+    # Heavy modules are only imported once we know there is work to do
+    import psycopg2
+    import populate_staff_data
+    from db import bump_data_version
+    from incremental_load import create_staging_tables, refresh_daily_summary
+    from populate_product_data import populate_product_data
+    from populate_transaction_data import populate_transaction_data
+    from schema_mode import detect_schema_mode, select_products_sql, select_stores_sql
+    
+    # Every generation stage derives its own RNG from args.seed (see seeding.py),
+    # so the data is reproducible without a global random.seed()
+    end_date = args.end_date or date.today()
     
     # Connect to the database
     if not wait_for_db(host=args.host, port=args.port, dbname=args.dbname, user=args.user, password=args.password):
@@ -87,6 +115,14 @@ def main():
         password=args.password
     )
     
+    db_params = {
+        'host': args.host,
+        'port': args.port,
+        'dbname': args.dbname,
+        'user': args.user,
+        'password': args.password
+    }
+    
     # Use autocommit to avoid transaction complexities
     conn.autocommit = True
     cursor = conn.cursor()
@@ -102,15 +138,6 @@ def main():
             file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'populate_store_data.py')
             print(f"Running store data module directly as a script: {file_path}")
             
-            # Create a temporary connection for the subprocess to use
-            db_params = {
-                'host': args.host,
-                'port': args.port,
-                'dbname': args.dbname,
-                'user': args.user,
-                'password': args.password
-            }
-            
             # Execute the populate_store_data.py file as a subprocess
             import subprocess
             
@@ -146,32 +173,30 @@ def main():
             cursor.execute("SELECT region_id, region_name FROM StoreRegion")
             regions = cursor.fetchall()
             
-            cursor.execute("SELECT store_id, store_name, store_category_id, region_id, address, phone, opening_date, data_source FROM Store")
+            cursor.execute(select_stores_sql(detect_schema_mode(cursor)))
             stores = cursor.fetchall()
             
             print(f"Retrieved {len(stores)} stores from database after population")
         else:
             # If not populating store data, we still need the stores for other relations
-            cursor.execute("SELECT store_id, store_name, store_category_id, region_id, address, phone, opening_date, data_source FROM Store")
+            cursor.execute(select_stores_sql(detect_schema_mode(cursor)))
             stores = cursor.fetchall()
             
         # Product data
         if populate_all or 'product' in args.tables:
-            currencies, product_categories, db_product_types, products = populate_product_data(cursor)
+            currencies, product_categories, db_product_types, products = populate_product_data(cursor, seed=args.seed)
         else:
             # If not populating product data, we still need products for transactions
-            cursor.execute("""
-                SELECT product_id, product_name, type_id, detail, base_price, 
-                       currency_id, is_seasonal, is_active, data_source 
-                FROM Product
-            """)
+            cursor.execute(select_products_sql(detect_schema_mode(cursor)))
             products = cursor.fetchall()
         
         # Staff data
         if populate_all or 'staff' in args.tables:
             # Apply the same fix for staff module
             if hasattr(populate_staff_data, 'populate_staff_data'):
-                roles, staff_members = populate_staff_data.populate_staff_data(cursor, stores)
+                roles, staff_members = populate_staff_data.populate_staff_data(
+                    cursor, stores, seed=args.seed, end_date=end_date
+                )
             elif hasattr(populate_staff_data, 'populate_staff'):
                 roles, staff_members = populate_staff_data.populate_staff(cursor, stores)
             elif hasattr(populate_staff_data, 'populate_staff_tables'):
@@ -190,7 +215,24 @@ def main():
         
         # Transaction data
         if populate_all or 'transaction' in args.tables:
-            payment_methods, transactions, transaction_items = populate_transaction_data(cursor, stores, products)
+            payment_methods, transaction_count, item_count = populate_transaction_data(
+                cursor, stores, products, scale_factor=args.scale_factor,
+                seed=args.seed, end_date=end_date, params=db_params,
+                generators=args.generators, writers=args.writers, queue_size=args.queue_size,
+                bulk=args.bulk_load
+            )
+            
+            # Rebuild the daily rollup so it matches the freshly loaded facts
+            conn.autocommit = False
+            create_staging_tables(cursor)
+            summary_rows = refresh_daily_summary(cursor, full=True)
+            conn.commit()
+            conn.autocommit = True
+            print(f"Refreshed {summary_rows} daily summary rows")
+        
+        record_dataset_info(cursor, scale_factor=args.scale_factor, seed=args.seed, end_date=end_date)
+        cursor.execute("SELECT DISTINCT to_char(transaction_date, 'YYYY-MM') FROM Transaction")
+        bump_data_version(cursor, [row[0] for row in cursor.fetchall()])
         
         print("Data population complete!")
         
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""Hierarchical seeding for reproducible, randomly accessible data generation.
+
+Every generated slice (the product catalog, the staff of one store, the
+transactions or shifts of one store on one day) draws from its own
+random.Random, seeded from the run seed and the slice's path. Any slice can
+therefore be regenerated on its own, in any order or in parallel, and still
+produce exactly the same rows as a full run.
+"""
+import hashlib
+import random
+
+def derive_seed(seed, *path):
+    """Derive a 64-bit seed for the slice identified by path, e.g. ('transactions', 'BAK001', '2025-03-01')"""
+    key = '/'.join(str(part) for part in (seed,) + path).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+def rng_for(seed, *path):
+    """Return an independent random.Random for a slice; an unseeded one when seed is None"""
+    return random.Random(derive_seed(seed, *path) if seed is not None else None)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Shared PostgreSQL connection helpers for the OntoDb scripts.
+
+psycopg2 is imported inside the helpers rather than at module level so that
+commands which never touch the database (``ontodb --help``) stay fast.
+
+Read-only work (reports, exports, the HTTP API, benchmarks) connects with
+role='read'. When a streaming replica is configured with DB_REPLICA_HOST (and
+DB_REPLICA_PORT), those connections go to the replica as long as it is no more
+than DB_REPLICA_MAX_LAG seconds (default 5) behind, and to the primary
+otherwise.
+"""
+import os
+import sys
+import time
+
+# All OntoDb tables, in dependency order (parents before children)
+ONTODB_TABLES = [
+    'StoreCategory',
+    'StoreRegion',
+    'Store',
+    'ProductCategory',
+    'ProductType',
+    'Currency',
+    'Product',
+    'StaffRole',
+    'Staff',
+    'Shift',
+    'PaymentMethod',
+    'Transaction',
+    'TransactionItem',
+]
+
+
+def get_db_params(host=None, port=None, dbname=None, user=None, password=None):
+    """Return connection parameters, falling back to the DB_* environment variables"""
+    return {
+        'host': host or os.environ.get('DB_HOST', 'localhost'),
+        'port': int(port or os.environ.get('DB_PORT', '5432')),
+        'dbname': dbname or os.environ.get('DB_NAME', 'OntoDb'),
+        'user': user or os.environ.get('DB_USER', 'ontodb'),
+        'password': password or os.environ.get('DB_PASSWORD', 'admin'),
+    }
+
+
+def add_db_arguments(parser):
+    """Add the standard connection options to an argparse parser"""
+    parser.add_argument('--host', default=None,
+                        help='Database host (default: localhost or DB_HOST env var)')
+    parser.add_argument('--port', type=int, default=None,
+                        help='Database port (default: 5432 or DB_PORT env var)')
+    parser.add_argument('--dbname', default=None,
+                        help='Database name (default: OntoDb or DB_NAME env var)')
+    parser.add_argument('--user', default=None,
+                        help='Database user (default: ontodb or DB_USER env var)')
+    parser.add_argument('--password', default=None,
+                        help='Database password (default: admin or DB_PASSWORD env var)')
+
+
+def params_from_args(args):
+    """Build connection parameters from parsed add_db_arguments() options"""
+    return get_db_params(args.host, args.port, args.dbname, args.user, args.password)
+
+
+def connect(params=None, autocommit=True, role='write'):
+    """Open a psycopg2 connection; role='read' prefers an up-to-date replica"""
+    import psycopg2
+
+    params = params or get_db_params()
+    conn = _open_replica(params) if role == 'read' else None
+    if conn is None:
+        conn = psycopg2.connect(**params)
+    conn.autocommit = autocommit
+    return conn
+
+
+# Seconds a replica that could not be used is skipped before it is tried again
+REPLICA_RETRY_SECONDS = 30
+_replica_skipped_until = 0.0
+
+
+def replica_params(params):
+    """Return the connection parameters of the configured replica, or None"""
+    host = os.environ.get('DB_REPLICA_HOST')
+    if not host:
+        return None
+    return dict(params, host=host, port=int(os.environ.get('DB_REPLICA_PORT', '5432')))
+
+
+def replica_lag(cursor):
+    """Return how many seconds a standby is behind, 0 when it has replayed all it received, or None on a primary"""
+    cursor.execute("""
+        SELECT pg_is_in_recovery(),
+               EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'),
+               pg_last_wal_receive_lsn() IS NOT DISTINCT FROM pg_last_wal_replay_lsn(),
+               EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    """)
+    in_recovery, streaming, caught_up, replay_age = cursor.fetchone()
+    if not in_recovery:
+        return None
+    if streaming and caught_up:
+        return 0.0
+    return float(replay_age) if replay_age is not None else float('inf')
+
+
+def _open_replica(params):
+    """Return a connection to the replica if it is configured, reachable and fresh enough, else None"""
+    global _replica_skipped_until
+    import psycopg2
+
+    replica = replica_params(params)
+    if replica is None or time.monotonic() < _replica_skipped_until:
+        return None
+    max_lag = float(os.environ.get('DB_REPLICA_MAX_LAG', '5'))
+    try:
+        conn = psycopg2.connect(connect_timeout=2, **replica)
+        conn.autocommit = True
+        lag = replica_lag(conn.cursor())
+        if lag is not None and lag <= max_lag:
+            return conn
+        conn.close()
+        if lag is None:
+            reason = 'is not a standby'
+        elif lag == float('inf'):
+            reason = 'is not streaming and has no replay time'
+        else:
+            reason = f"is {lag:.1f}s behind (limit {max_lag:g}s)"
+    except psycopg2.OperationalError as e:
+        reason = f"is unreachable ({str(e).strip().splitlines()[0]})"
+    _replica_skipped_until = time.monotonic() + REPLICA_RETRY_SECONDS
+    print(f"Replica {replica['host']}:{replica['port']} {reason}; reading from the primary", file=sys.stderr)
+    return None
+
+
+def read_params(params):
+    """Return the connection parameters read-only work should use: the replica when usable, else params"""
+    conn = _open_replica(params)
+    if conn is None:
+        return params
+    conn.close()
+    return replica_params(params)
+
+
+def wait_for_db(params, max_attempts=5, delay=3):
+    """Wait for database to be available, returning True once a connection succeeds"""
+    import psycopg2
+
+    print(f"Trying to connect to PostgreSQL at {params['host']}:{params['port']}...")
+    for attempt in range(1, max_attempts + 1):
+        try:
+            psycopg2.connect(**params).close()
+            print(f"Successfully connected to database '{params['dbname']}' on {params['host']}:{params['port']}")
+            return True
+        except psycopg2.OperationalError as e:
+            print(f"Waiting for database... attempt {attempt}/{max_attempts}")
+            print(f"Error: {str(e).strip()}")
+            if attempt < max_attempts:
+                time.sleep(delay)
+    return False
+
+
+def resolve_db_params(params, max_attempts=5):
+    """Return reachable connection parameters, trying the Docker host 'postgres' as a fallback"""
+    if wait_for_db(params, max_attempts):
+        return params
+    if params['host'] == 'localhost':
+        print("\nTrying alternate Docker connection settings...")
+        docker_params = dict(params, host='postgres')
+        if wait_for_db(docker_params, max_attempts):
+            return docker_params
+
+    print("\nDatabase connection failed! Please check:")
+    print("1. Is PostgreSQL running? You may need to start Docker containers:")
+    print("   docker-compose -f config/docker-compose.yml up -d")
+    print("2. Are the connection details correct?")
+    print(f"   Host: {params['host']}, Port: {params['port']}, Database: {params['dbname']}, User: {params['user']}")
+    return None
+
+
+def read_dataset_info(cursor):
+    """Return the DatasetInfo key/value pairs (scale_factor, seed, ...), or {} when the table does not exist"""
+    cursor.execute("SELECT to_regclass('datasetinfo') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return {}
+    cursor.execute("SELECT key, value FROM DatasetInfo")
+    return dict(cursor.fetchall())
+
+
+def bump_data_version(cursor, months=()):
+    """Increment the data_version recorded in DatasetInfo, in the caller's transaction.
+
+    The result cache compares it on every lookup: unlike the pg_stat counters it
+    changes exactly when the load commits. data_version.YYYY-MM is bumped as well
+    for each of the given months whose sales were written, which the sales-line
+    export and the offline snapshot use to skip unchanged months.
+    """
+    cursor.execute("""
+        INSERT INTO DatasetInfo (key, value)
+        SELECT key, '1' FROM unnest(%s::text[]) AS key
+        ON CONFLICT (key) DO UPDATE SET value = (DatasetInfo.value::bigint + 1)::text
+    """, (['data_version'] + [f"data_version.{month}" for month in sorted(set(months))],))
+
+
+def _copy_value(value):
+    """Encode one value for COPY text format"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def encode_copy_rows(rows):
+    """Encode an iterable of tuples as a COPY text-format payload"""
+    return ''.join('\t'.join(_copy_value(v) for v in row) + '\n' for row in rows)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Bulk load an iterable of tuples into table with COPY FROM STDIN"""
+    copy_encoded(cursor, table, columns, encode_copy_rows(rows))
+
+
+def copy_encoded(cursor, table, columns, payload):
+    """COPY a payload produced by encode_copy_rows() into table"""
+    import io
+
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", io.StringIO(payload))
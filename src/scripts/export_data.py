@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""Export OntoDb tables to CSV files, or sales lines to a wide partitioned table.
+
+The sales-line export flattens TransactionItem with its transaction, store,
+region, product, type, category, payment method and staff member into one row
+per sale line, written as one Parquet (or CSV) file per month. Months are
+exported in parallel over separate connections. A manifest records a
+fingerprint of every month (its row count and change marker) and of the
+dimension tables, so re-running the export only rewrites the months whose rows
+changed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import ONTODB_TABLES, add_db_arguments, connect, params_from_args, read_dataset_info, resolve_db_params
+from schema_mode import code_column, detect_schema_mode
+
+SALES_LINES_DIR = 'sales_lines'
+# Leading underscore: Parquet dataset readers skip it
+MANIFEST = '_manifest.json'
+
+# Rows fetched per round trip and written per Parquet row group
+FETCH_ROWS = 50000
+
+# Dimension tables of the wide rows; a change in any of them rewrites every month
+DIMENSION_TABLES = ['Store', 'StoreRegion', 'Product', 'ProductType', 'ProductCategory', 'PaymentMethod', 'Staff']
+
+# (column, arrow type) of the wide sales-line rows, in query order
+SALES_LINE_COLUMNS = [
+    ('sale_id', 'string'), ('transaction_id', 'string'), ('transaction_date', 'date32'),
+    ('transaction_time', 'time64'), ('store', 'string'), ('store_name', 'string'), ('region', 'string'),
+    ('product', 'string'), ('product_name', 'string'), ('product_type', 'string'),
+    ('product_category', 'string'), ('payment_method', 'string'), ('staff_id', 'int32'),
+    ('staff_name', 'string'), ('quantity', 'int32'), ('unit_price', 'decimal'),
+    ('discount_percent', 'decimal'), ('item_total', 'decimal'), ('data_source', 'string'),
+]
+
+def export_table(cursor, table_name, output_dir):
+    """Stream one table to a CSV file with COPY, returning the output path"""
+    path = os.path.join(output_dir, f"{table_name}.csv")
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        cursor.copy_expert(f"COPY (SELECT * FROM {table_name}) TO STDOUT WITH CSV HEADER", f)
+    return path
+
+def sales_lines_query(mode):
+    """Return the wide sales-line query for one month, taking %(start)s and %(end)s bounds"""
+    return f"""
+        SELECT i.sale_id, t.{code_column(mode, 'Transaction')} AS transaction_id, t.transaction_date,
+               t.transaction_time, s.{code_column(mode, 'Store')} AS store, s.store_name, r.region_name AS region,
+               p.{code_column(mode, 'Product')} AS product, p.product_name, pt.type_name AS product_type,
+               pc.category_name AS product_category, pm.method_name AS payment_method, st.staff_id,
+               st.first_name || ' ' || st.last_name AS staff_name,
+               i.quantity, i.unit_price, i.discount_percent, i.item_total, t.data_source
+        FROM TransactionItem i
+        JOIN Transaction t ON t.transaction_id = i.transaction_id
+        JOIN Store s ON s.store_id = t.store_id
+        JOIN StoreRegion r ON r.region_id = s.region_id
+        JOIN Product p ON p.product_id = i.product_id
+        JOIN ProductType pt ON pt.type_id = p.type_id
+        JOIN ProductCategory pc ON pc.category_id = pt.category_id
+        LEFT JOIN PaymentMethod pm ON pm.payment_method_id = t.payment_method_id
+        LEFT JOIN Staff st ON st.staff_id = t.staff_id
+        WHERE t.transaction_date >= %(start)s AND t.transaction_date < %(end)s
+        ORDER BY t.transaction_date, t.transaction_time, i.sale_id
+    """
+
+def month_fingerprints(cursor):
+    """Return {'YYYY-MM': fingerprint} of every month with sales
+
+    A fingerprint is the month's transaction count, read from the date index,
+    plus the data_version.YYYY-MM marker that populate, ingest and archive bump
+    when they write the month (see db.bump_data_version()). Neither hashes the
+    rows, so the cost does not grow with the size of the unchanged history; the
+    count catches inserts and deletes made by other means.
+    """
+    cursor.execute("""
+        SELECT to_char(transaction_date, 'YYYY-MM'), COUNT(*)
+        FROM Transaction GROUP BY 1
+    """)
+    counts = cursor.fetchall()
+    versions = read_dataset_info(cursor)
+    return {month: f"{n}:{versions.get('data_version.' + month, 0)}" for month, n in counts}
+
+def table_fingerprints(cursor, tables):
+    """Return {table: fingerprint of its contents}, for small tables"""
+    table_hashes = [f"(SELECT md5(COALESCE(string_agg(x::text, ',' ORDER BY x::text), '')) FROM {table} x)"
+                    for table in tables]
+    cursor.execute(f"SELECT {', '.join(table_hashes)}")
+    return dict(zip(tables, cursor.fetchone()))
+
+def dimensions_fingerprint(cursor):
+    """Return a fingerprint of the contents of the dimension tables"""
+    return hashlib.md5(''.join(table_fingerprints(cursor, DIMENSION_TABLES).values()).encode()).hexdigest()
+
+def month_bounds(month):
+    year, number = int(month[:4]), int(month[5:7])
+    following = f"{year + 1}-01-01" if number == 12 else f"{year}-{number + 1:02d}-01"
+    return {'start': f"{month}-01", 'end': following}
+
+def arrow_schema():
+    import pyarrow as pa
+
+    types = {'string': pa.string(), 'date32': pa.date32(), 'time64': pa.time64('us'),
+             'int32': pa.int32(), 'decimal': pa.decimal128(10, 2)}
+    return pa.schema([(name, types[kind]) for name, kind in SALES_LINE_COLUMNS])
+
+def write_parquet(cursor, path, schema, digest=None):
+    """Stream the rows of an executed cursor to a zstd Parquet file, returning the row count
+
+    When a hashlib digest is given, it is updated with the repr() of every row written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        while True:
+            chunk = cursor.fetchmany(FETCH_ROWS)
+            if not chunk:
+                break
+            if digest is not None:
+                for row in chunk:
+                    digest.update(repr(tuple(row)).encode())
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)],
+                schema=schema))
+            rows += len(chunk)
+    return rows
+
+def export_month(params, mode, month, directory, output_format):
+    """Write the sales lines of one month to directory/month=YYYY-MM, returning the row count"""
+    partition = os.path.join(directory, f"month={month}")
+    tmp = partition + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    conn = connect(params, autocommit=False, role='read')
+    rows = 0
+    try:
+        if output_format == 'csv':
+            cursor = conn.cursor()
+            query = cursor.mogrify(sales_lines_query(mode), month_bounds(month)).decode()
+            with open(os.path.join(tmp, 'part-0.csv'), 'w', encoding='utf-8', newline='') as f:
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+            rows = cursor.rowcount
+        else:
+            # A named cursor streams the month instead of materializing it client-side
+            cursor = conn.cursor(name=f"sales_lines_{month.replace('-', '_')}")
+            cursor.itersize = FETCH_ROWS
+            cursor.execute(sales_lines_query(mode), month_bounds(month))
+            rows = write_parquet(cursor, os.path.join(tmp, 'part-0.parquet'), arrow_schema())
+        cursor.close()
+    finally:
+        conn.close()
+    shutil.rmtree(partition, ignore_errors=True)
+    os.replace(tmp, partition)
+    return rows
+
+def export_sales_lines(params, output_dir, output_format='parquet', workers=4, full=False):
+    """Export the changed months of the wide sales-line table, returning (exported, skipped) months"""
+    directory = os.path.join(output_dir, SALES_LINES_DIR)
+    manifest_path = os.path.join(directory, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path) and not full:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if manifest.get('format') != output_format:
+        manifest = {}
+
+    conn = connect(params, role='read')
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    fingerprints = month_fingerprints(cursor)
+    dimensions = dimensions_fingerprint(cursor)
+    cursor.close()
+    conn.close()
+
+    previous = manifest.get('partitions', {}) if manifest.get('dimensions') == dimensions else {}
+    changed = sorted(m for m, fp in fingerprints.items() if previous.get(m, {}).get('fingerprint') != fp)
+    os.makedirs(directory, exist_ok=True)
+
+    # Months that no longer have sales lose their partition
+    for month in set(manifest.get('partitions', {})) - set(fingerprints):
+        shutil.rmtree(os.path.join(directory, f"month={month}"), ignore_errors=True)
+
+    partitions = {m: previous[m] for m in fingerprints if m not in changed}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {m: pool.submit(export_month, params, mode, m, directory, output_format) for m in changed}
+        for month, future in futures.items():
+            rows = future.result()
+            partitions[month] = {'fingerprint': fingerprints[month], 'rows': rows}
+            print(f"Exported {rows} sales lines of {month}")
+
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'format': output_format, 'dimensions': dimensions,
+                   'partitions': dict(sorted(partitions.items()))}, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return len(changed), len(fingerprints) - len(changed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export OntoDb tables to CSV files')
+    parser.add_argument('--tables', nargs='+', choices=ONTODB_TABLES, default=ONTODB_TABLES,
+                        help='Tables to export (default: all)')
+    parser.add_argument('--output-dir', default=os.path.join('data', 'export'),
+                        help='Directory the CSV files are written to (default: data/export)')
+    parser.add_argument('--sales-lines', action='store_true',
+                        help='Export the denormalized sales-line table, one partition per month, instead of tables')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help='File format of --sales-lines partitions (default: parquet, requires pyarrow)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Months exported in parallel with --sales-lines (default: 4)')
+    parser.add_argument('--full', action='store_true',
+                        help='Re-export every month with --sales-lines, ignoring the manifest')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    params = resolve_db_params(params_from_args(args))
+    if params is None:
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.sales_lines:
+        if args.format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("Parquet export requires pyarrow (pip install pyarrow), or use --format csv")
+                return 1
+        start = time.perf_counter()
+        exported, skipped = export_sales_lines(params, args.output_dir, args.format, args.workers, args.full)
+        print(f"Exported {exported} months, skipped {skipped} unchanged months in "
+              f"{time.perf_counter() - start:.2f}s to {os.path.join(args.output_dir, SALES_LINES_DIR)}")
+        return 0
+
+    conn = connect(params, role='read')
+    cursor = conn.cursor()
+    try:
+        for table in args.tables:
+            start = time.perf_counter()
+            path = export_table(cursor, table, args.output_dir)
+            print(f"Exported {table} to {path} in {time.perf_counter() - start:.2f}s")
+    finally:
+        cursor.close()
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
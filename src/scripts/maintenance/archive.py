@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Cold archive of old sales in compressed Parquet files.
+
+`run` moves the months before a cutoff out of Transaction and
+TransactionItem. Each month is written as one part per table:
+<dir>/<table>/month=YYYY-MM/part-N.parquet, zstd-compressed and ordered by
+key. The part is read back and its row count and SHA-256 checksum (over the
+rows as fetched) are compared. Only then are the month's rows deleted. The
+export, the check and the delete run in one REPEATABLE READ transaction. The
+delete therefore removes exactly the rows that were archived, and a
+concurrent change to any of them aborts the month instead of losing it. Rows
+loaded into an archived month later stay hot until the next run, which adds
+another part.
+
+The manifest records each part as pending before its delete commits and as
+archived after. A part left pending by a crash is settled on the next run:
+if its first transaction is gone, the delete committed; otherwise the part
+is discarded.
+
+query_sales() runs SQL over Transaction and TransactionItem restricted to a
+date range. When the range reaches archived months, it runs in DuckDB over
+the archived parts plus the hot rows of the range. Otherwise it runs on
+PostgreSQL. The SQL must therefore be valid in both dialects, as for the
+offline reports (see offline.py).
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import add_db_arguments, bump_data_version, connect, params_from_args, resolve_db_params
+from export_data import FETCH_ROWS, month_bounds
+from offline import MONTHLY_TABLES, WHOLE_TABLES, column_types, run_sql, select_list, table_schema, write_table_file
+from schema_mode import detect_schema_mode
+
+DEFAULT_ARCHIVE_DIR = os.path.join('data', 'archive')
+MANIFEST = '_manifest.json'
+DEFAULT_KEEP_MONTHS = 12
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'months': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def part_path(directory, table, month, part):
+    return os.path.join(directory, table, f"month={month}", f"part-{part}.parquet")
+
+def file_digest(path):
+    """Return the SHA-256 over the repr() of the rows of a Parquet file, as computed while writing it"""
+    import pyarrow.parquet as pq
+
+    digest = hashlib.sha256()
+    rows = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=FETCH_ROWS):
+        for row in zip(*(column.to_pylist() for column in batch.columns)):
+            digest.update(repr(row).encode())
+        rows += batch.num_rows
+    return rows, digest.hexdigest()
+
+def first_transaction(path):
+    import pyarrow.parquet as pq
+
+    column = pq.read_table(path, columns=['transaction_id']).column(0)
+    return column[0].as_py() if len(column) else None
+
+def remove_part(directory, month, part):
+    for table in MONTHLY_TABLES:
+        path = part_path(directory, table, month, part)
+        if os.path.exists(path):
+            os.remove(path)
+
+def settle_pending(cursor, directory, manifest):
+    """Resolve the parts left pending by an interrupted run, returning how many were settled"""
+    settled = 0
+    for month, parts in manifest['months'].items():
+        for entry in [entry for entry in parts if entry['status'] == 'pending']:
+            path = part_path(directory, 'Transaction', month, entry['part'])
+            transaction_id = first_transaction(path) if os.path.exists(path) else None
+            committed = False
+            if transaction_id is not None:
+                cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM Transaction WHERE transaction_id = %s)",
+                               (transaction_id,))
+                committed = cursor.fetchone()[0]
+            if committed:
+                entry['status'] = 'archived'
+            else:
+                remove_part(directory, month, entry['part'])
+                parts.remove(entry)
+            settled += 1
+    manifest['months'] = {month: parts for month, parts in manifest['months'].items() if parts}
+    if settled:
+        save_manifest(directory, manifest)
+    return settled
+
+def archive_month(conn, directory, manifest, columns, month):
+    """Archive, verify and delete the hot rows of one month within conn's transaction, returning the part entry"""
+    parts = manifest['months'].setdefault(month, [])
+    part = max((entry['part'] for entry in parts), default=-1) + 1
+    entry = {'part': part, 'status': 'pending', 'rows': {}, 'sha256': {}}
+    try:
+        for table, query in MONTHLY_TABLES.items():
+            path = part_path(directory, table, month, part)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            digest = hashlib.sha256()
+            rows = write_table_file(conn, query.format(columns=select_list(columns[table], 'x')) + " ORDER BY 1",
+                                    month_bounds(month), path, table_schema(columns[table]), digest)
+            if file_digest(path) != (rows, digest.hexdigest()):
+                raise RuntimeError(f"{path} does not read back the {rows} rows written")
+            entry['rows'][table] = rows
+            entry['sha256'][table] = digest.hexdigest()
+
+        # Recorded before the delete commits, so an interrupted run can be settled
+        parts.append(entry)
+        save_manifest(directory, manifest)
+        cursor = conn.cursor()
+        bounds = month_bounds(month)
+        cursor.execute("""
+            DELETE FROM TransactionItem i USING Transaction t
+            WHERE t.transaction_id = i.transaction_id
+              AND t.transaction_date >= %(start)s AND t.transaction_date < %(end)s
+        """, bounds)
+        deleted = {'TransactionItem': cursor.rowcount}
+        cursor.execute("DELETE FROM Transaction WHERE transaction_date >= %(start)s AND transaction_date < %(end)s",
+                       bounds)
+        deleted['Transaction'] = cursor.rowcount
+        bump_data_version(cursor, [month])
+        cursor.close()
+        if deleted != entry['rows']:
+            raise RuntimeError(f"Deleted {deleted} rows of {month} but archived {entry['rows']}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if entry in parts:
+            parts.remove(entry)
+        if not parts:
+            del manifest['months'][month]
+        remove_part(directory, month, part)
+        save_manifest(directory, manifest)
+        raise
+    entry['status'] = 'archived'
+    entry['archived_at'] = datetime.now().isoformat(timespec='seconds')
+    save_manifest(directory, manifest)
+    return entry
+
+def archive_before(params, directory, cutoff, dry_run=False):
+    """Archive every month before the month of cutoff, returning the archived {month: part entry}"""
+    conn = connect(params, autocommit=False)
+    conn.set_session(isolation_level='REPEATABLE READ')
+    cursor = conn.cursor()
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    archived = {}
+    try:
+        mode = detect_schema_mode(cursor)
+        columns = {table: column_types(cursor, table) for table in MONTHLY_TABLES}
+        if manifest.get('columns', columns) != columns:
+            raise RuntimeError(f"The archive in {directory} was written with other columns "
+                               f"({manifest.get('mode')} keys); switch back or use another --dir")
+        manifest.update(mode=mode, columns=columns)
+        settled = settle_pending(cursor, directory, manifest)
+        if settled:
+            print(f"Settled {settled} parts left pending by an interrupted run")
+        cursor.execute("""
+            SELECT to_char(transaction_date, 'YYYY-MM'), COUNT(*) FROM Transaction
+            WHERE transaction_date < %s GROUP BY 1 ORDER BY 1
+        """, (cutoff.replace(day=1),))
+        months = cursor.fetchall()
+        conn.commit()
+        for month, transactions in months:
+            if dry_run:
+                print(f"Would archive {transactions} transactions of {month}")
+                continue
+            start = time.perf_counter()
+            entry = archive_month(conn, directory, manifest, columns, month)
+            archived[month] = entry
+            size = sum(os.path.getsize(part_path(directory, table, month, entry['part'])) for table in MONTHLY_TABLES)
+            print(f"Archived {entry['rows']['Transaction']} transactions and {entry['rows']['TransactionItem']} "
+                  f"items of {month} ({size / 2 ** 20:.1f} MB) in {time.perf_counter() - start:.2f}s")
+        if archived:
+            # Reclaims the dead rows for reuse and refreshes the planner statistics
+            conn.autocommit = True
+            for table in MONTHLY_TABLES:
+                cursor.execute(f"VACUUM ANALYZE {table}")
+    finally:
+        cursor.close()
+        conn.close()
+    return archived
+
+def verify_archive(directory):
+    """Re-read every archived part, returning the parts whose rows or checksum differ from the manifest"""
+    manifest = load_manifest(directory)
+    failures = []
+    for month, parts in sorted(manifest['months'].items()):
+        for entry in parts:
+            for table in MONTHLY_TABLES:
+                path = part_path(directory, table, month, entry['part'])
+                expected = (entry['rows'][table], entry['sha256'][table])
+                actual = file_digest(path) if os.path.exists(path) else (0, 'missing')
+                print(f"{'OK  ' if actual == expected else 'FAIL'} {path} ({actual[0]} rows)")
+                if actual != expected:
+                    failures.append(path)
+    return failures
+
+def archived_parts(directory, start, end):
+    """Return {table: [paths]} of the archived parts of the months overlapping [start, end]"""
+    manifest = load_manifest(directory)
+    months = [month for month in manifest['months'] if start.isoformat()[:7] <= month <= end.isoformat()[:7]]
+    return {table: [part_path(directory, table, month, entry['part'])
+                    for month in sorted(months) for entry in manifest['months'][month]
+                    if entry['status'] == 'archived']
+            for table in MONTHLY_TABLES}
+
+def fetch_arrow(cursor, query, query_params, columns):
+    """Return the rows of a query as an Arrow table of the given columns"""
+    import pyarrow as pa
+
+    schema = table_schema(columns)
+    cursor.execute(query, query_params)
+    rows = cursor.fetchall()
+    if not rows:
+        return schema.empty_table()
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)],
+                                schema=schema)
+
+def query_sales(params, sql, start, end, directory=DEFAULT_ARCHIVE_DIR):
+    """Run SQL over the sales of [start, end], hot and archived, returning (columns, rows, engine)
+
+    In the SQL, Transaction and TransactionItem hold only the sales of the
+    range; the other OntoDb tables are complete.
+    """
+    bounds = {'start': start, 'end': end + timedelta(days=1)}
+    parts = archived_parts(directory, start, end)
+    conn = connect(params, autocommit=False)
+    cursor = conn.cursor()
+    try:
+        if not parts['Transaction']:
+            # All hot: temporary views shadow the fact tables for this transaction only.
+            # TransactionItem's view is created first, so it reads the real Transaction table.
+            for table in reversed(list(MONTHLY_TABLES)):
+                cursor.execute(f"CREATE TEMP VIEW {table} AS " + MONTHLY_TABLES[table].format(columns='x.*'), bounds)
+            cursor.execute(sql)
+            return [desc[0] for desc in cursor.description], cursor.fetchall(), 'PostgreSQL'
+
+        import duckdb
+
+        engine = duckdb.connect()
+        for table in WHOLE_TABLES:
+            engine.register(table, fetch_arrow(cursor, f"SELECT {select_list(column_types(cursor, table), 'x')} "
+                                                       f"FROM {table} x", None, column_types(cursor, table)))
+        columns = {table: column_types(cursor, table) for table in MONTHLY_TABLES}
+        for table, query in MONTHLY_TABLES.items():
+            engine.register(f"hot_{table}", fetch_arrow(cursor, query.format(columns=select_list(columns[table], 'x')),
+                                                        bounds, columns[table]))
+        files = {table: '[' + ', '.join("'" + path.replace("'", "''") + "'" for path in paths) + ']'
+                 for table, paths in parts.items()}
+        in_range = f"transaction_date >= DATE '{start.isoformat()}' AND transaction_date <= DATE '{end.isoformat()}'"
+        engine.execute(f"""CREATE VIEW cold_Transaction AS
+                           SELECT * FROM read_parquet({files['Transaction']}, hive_partitioning = false) WHERE {in_range}""")
+        engine.execute(f"""CREATE VIEW cold_TransactionItem AS
+                           SELECT * FROM read_parquet({files['TransactionItem']}, hive_partitioning = false)
+                           WHERE transaction_id IN (SELECT transaction_id FROM cold_Transaction)""")
+        for table in MONTHLY_TABLES:
+            engine.execute(f"""CREATE VIEW "{table}" AS
+                               SELECT * FROM cold_{table} UNION ALL SELECT * FROM hot_{table}""")
+        columns, rows = run_sql(engine, sql)
+        engine.close()
+        return columns, rows, f"DuckDB, {len(parts['Transaction'])} archived parts and the hot rows"
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+def keep_months_cutoff(months):
+    """Return the first day of the month `months` months before the current one"""
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old sales to a compressed Parquet archive and query across both')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    def add_common(sub, database=True):
+        sub.add_argument('--dir', default=DEFAULT_ARCHIVE_DIR, help=f'Archive directory (default: {DEFAULT_ARCHIVE_DIR})')
+        if database:
+            add_db_arguments(sub)
+
+    run = subparsers.add_parser('run', help='Archive and delete the sales of the months before a cutoff')
+    cutoff = run.add_mutually_exclusive_group()
+    cutoff.add_argument('--before', type=date.fromisoformat,
+                        help='Archive the months before the month of this day, YYYY-MM-DD')
+    cutoff.add_argument('--keep-months', type=int, default=DEFAULT_KEEP_MONTHS,
+                        help=f'Keep this many months before the current one hot (default: {DEFAULT_KEEP_MONTHS})')
+    run.add_argument('--dry-run', action='store_true', help='Only list the months that would be archived')
+    add_common(run)
+
+    verify = subparsers.add_parser('verify', help='Check the row counts and checksums of every archived part')
+    add_common(verify, database=False)
+
+    query = subparsers.add_parser('query', help='Run SQL over the hot and archived sales of a date range')
+    query.add_argument('sql', help='SQL over Transaction, TransactionItem and the other OntoDb tables')
+    query.add_argument('--start', type=date.fromisoformat, required=True, help='First day, YYYY-MM-DD')
+    query.add_argument('--end', type=date.fromisoformat, required=True, help='Last day, YYYY-MM-DD')
+    add_common(query)
+
+    args = parser.parse_args(argv)
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("The archive requires pyarrow (pip install pyarrow)")
+        return 1
+
+    if args.action == 'verify':
+        failures = verify_archive(args.dir)
+        if failures:
+            print(f"{len(failures)} archived files do not match the manifest")
+            return 1
+        print("Every archived file matches its row count and checksum")
+        return 0
+
+    params = resolve_db_params(params_from_args(args))
+    if params is None:
+        return 1
+    start = time.perf_counter()
+    try:
+        if args.action == 'run':
+            cutoff = args.before or keep_months_cutoff(args.keep_months)
+            archived = archive_before(params, args.dir, cutoff, args.dry_run)
+            if not args.dry_run:
+                print(f"Archived {len(archived)} months before {cutoff.replace(day=1)} "
+                      f"in {time.perf_counter() - start:.2f}s to {args.dir}")
+        else:
+            from tabulate import tabulate
+
+            columns, rows, engine = query_sales(params, args.sql, args.start, args.end, args.dir)
+            print(tabulate(rows, headers=columns, tablefmt="pretty") if rows else "No results found.")
+            print(f"Ran in {(time.perf_counter() - start) * 1000:.1f} ms on {engine}")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Physical layout maintenance of the fact tables.
+
+Transactions are loaded store by store, so the rows of one day are spread over
+the whole heap and a date-range scan touches pages all over the table. This
+command rewrites the fact tables in (transaction_date, store_id) order:
+
+- Transaction is CLUSTERed on idx_transaction_date_store,
+- TransactionItem has no date column, so it is rewritten sorted by the date
+  and store of its transaction,
+
+then maintains BRIN indexes on the date columns (tiny, and effective once the
+heap is date-ordered) and runs VACUUM ANALYZE. The buffers touched by a
+standard date-range query are measured with EXPLAIN (ANALYZE, BUFFERS) before
+and after.
+
+CLUSTER and the rewrite take ACCESS EXCLUSIVE locks: run it in a maintenance
+window, e.g. after a bulk load.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_population.bulk_load import foreign_keys
+from db import add_db_arguments, connect, params_from_args
+
+# (index name, table, date column) of the BRIN indexes
+BRIN_INDEXES = [
+    ('idx_transaction_date_brin', 'Transaction', 'transaction_date'),
+    ('idx_shift_date_brin', 'Shift', 'shift_date'),
+]
+BRIN_PAGES_PER_RANGE = 32
+
+DEFAULT_WINDOW_DAYS = 7
+
+# Standard date-range queries whose buffer usage is compared
+PROBE_QUERIES = {
+    'transactions': """
+        SELECT COUNT(*), SUM(total_amount) FROM Transaction
+        WHERE transaction_date BETWEEN %(start)s AND %(end)s
+    """,
+    'sale lines': """
+        SELECT COUNT(*), SUM(i.item_total)
+        FROM Transaction t JOIN TransactionItem i ON i.transaction_id = t.transaction_id
+        WHERE t.transaction_date BETWEEN %(start)s AND %(end)s
+    """,
+}
+
+def probe_window(cursor, days):
+    """Return the bounds of the last `days` loaded days"""
+    cursor.execute("SELECT MAX(transaction_date) FROM Transaction")
+    end = cursor.fetchone()[0]
+    if end is None:
+        return None
+    return {'start': end - timedelta(days=days - 1), 'end': end}
+
+def buffer_usage(cursor, window):
+    """Return {probe: (shared buffers touched, execution ms)} for the probe queries"""
+    usage = {}
+    for name, query in PROBE_QUERIES.items():
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, window)
+        plan = cursor.fetchone()[0][0]
+        top = plan['Plan']
+        usage[name] = (top['Shared Hit Blocks'] + top['Shared Read Blocks'], plan['Execution Time'])
+    return usage
+
+def date_correlation(cursor):
+    """Return the planner's heap-order correlation of transaction_date (1.0 is perfectly sorted)"""
+    cursor.execute("""
+        SELECT correlation FROM pg_stats
+        WHERE tablename = 'transaction' AND attname = 'transaction_date'
+    """)
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def ensure_brin_indexes(cursor):
+    for name, table, column in BRIN_INDEXES:
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {name} ON {table} USING BRIN ({column})
+            WITH (pages_per_range = {BRIN_PAGES_PER_RANGE}, autosummarize = on)
+        """)
+
+def secondary_indexes(cursor, table):
+    """Return [(name, definition)] of the indexes of a table that do not back a constraint"""
+    cursor.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+        ORDER BY c.relname
+    """, (table,))
+    return cursor.fetchall()
+
+def sort_transaction_items(conn):
+    """Rewrite TransactionItem ordered by the date and store of its transaction"""
+    cursor = conn.cursor()
+    conn.autocommit = False
+    try:
+        cursor.execute("LOCK TABLE TransactionItem IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("""
+            CREATE TEMP TABLE sorted_items ON COMMIT DROP AS
+            SELECT i.* FROM TransactionItem i
+            LEFT JOIN Transaction t ON t.transaction_id = i.transaction_id
+            ORDER BY t.transaction_date, t.store_id, i.transaction_id, i.item_id
+        """)
+        # Checking the foreign keys and building the secondary indexes once after
+        # the insert is much cheaper than doing it row by row; the primary key
+        # and unique indexes are kept
+        keys = foreign_keys(cursor, 'TransactionItem')
+        indexes = secondary_indexes(cursor, 'transactionitem')
+        for name, _ in keys:
+            cursor.execute(f"ALTER TABLE TransactionItem DROP CONSTRAINT {name}")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+        cursor.execute("TRUNCATE TransactionItem")
+        # OVERRIDING SYSTEM VALUE keeps item_id also when it is an identity column
+        cursor.execute("INSERT INTO TransactionItem OVERRIDING SYSTEM VALUE SELECT * FROM sorted_items")
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in keys:
+            cursor.execute(f"ALTER TABLE TransactionItem ADD CONSTRAINT {name} {definition}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+        cursor.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Order the fact tables by date and store, maintain BRIN indexes and VACUUM ANALYZE')
+    parser.add_argument('--window-days', type=int, default=DEFAULT_WINDOW_DAYS,
+                        help=f'Days of the date-range probe query (default: {DEFAULT_WINDOW_DAYS})')
+    parser.add_argument('--skip-sort', action='store_true',
+                        help='Only maintain the BRIN indexes and VACUUM ANALYZE, without rewriting the tables')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        conn = connect(params_from_args(args))
+        cursor = conn.cursor()
+        window = probe_window(cursor, args.window_days)
+        if window is None:
+            print("No transactions loaded; nothing to do")
+            return 0
+
+        cursor.execute("ANALYZE Transaction, TransactionItem")
+        before = buffer_usage(cursor, window)
+        correlation_before = date_correlation(cursor)
+
+        if not args.skip_sort:
+            start = time.perf_counter()
+            cursor.execute("CLUSTER Transaction USING idx_transaction_date_store")
+            print(f"Clustered Transaction on (transaction_date, store_id) in {time.perf_counter() - start:.2f}s")
+            start = time.perf_counter()
+            sort_transaction_items(conn)
+            print(f"Rewrote TransactionItem in transaction date order in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        ensure_brin_indexes(cursor)
+        for name, _, _ in BRIN_INDEXES:
+            cursor.execute("SELECT brin_summarize_new_values(%s::regclass)", (name,))
+        cursor.execute("VACUUM ANALYZE Transaction")
+        cursor.execute("VACUUM ANALYZE TransactionItem")
+        cursor.execute("VACUUM ANALYZE Shift")
+        print(f"Maintained BRIN indexes and ran VACUUM ANALYZE in {time.perf_counter() - start:.2f}s")
+
+        after = buffer_usage(cursor, window)
+        correlation_after = date_correlation(cursor)
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+    print(f"\nBuffers touched by date-range queries over {window['start']} .. {window['end']}:")
+    for name in PROBE_QUERIES:
+        (blocks_before, ms_before), (blocks_after, ms_after) = before[name], after[name]
+        print(f"- {name}: {blocks_before} -> {blocks_after} buffers, {ms_before:.1f} -> {ms_after:.1f} ms")
+    if correlation_before is not None and correlation_after is not None:
+        print(f"transaction_date heap correlation: {correlation_before:.3f} -> {correlation_after:.3f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
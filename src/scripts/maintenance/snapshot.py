@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Snapshot and restore of populated OntoDb databases.
+
+Snapshots are keyed by the scale factor and seed recorded in DatasetInfo by
+run_population.py, and come in two flavours:
+
+- dump: a directory-format pg_dump archive, written and restored with
+  parallel jobs. Portable between servers.
+- template: a copy of the database kept on the same server, restored with
+  CREATE DATABASE ... TEMPLATE, which is a file-level copy and the fastest
+  way to get a fresh populated environment.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Import modules with explicit paths to avoid relative import issues
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ONTODB_TABLES, add_db_arguments, connect, params_from_args, read_dataset_info
+
+DEFAULT_SNAPSHOT_DIR = 'snapshots'
+TEMPLATE_PREFIX = 'ontodb_snapshot_'
+
+def snapshot_key(scale_factor, seed):
+    """Return the snapshot key for a scale factor and seed, e.g. 'sf1_seed42'"""
+    return f"sf{float(scale_factor):g}_seed{seed}"
+
+def table_counts(cursor):
+    """Return {table: row count} for the OntoDb tables"""
+    counts = {}
+    for table in ONTODB_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cursor.fetchone()[0]
+    return counts
+
+def pg_tool(name, bin_dir=None):
+    """Locate a PostgreSQL client binary such as pg_dump"""
+    path = os.path.join(bin_dir, name) if bin_dir else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"{name} not found; install the PostgreSQL client tools or pass --pg-bin-dir")
+    return path
+
+def run_pg_tool(command, params):
+    """Run a PostgreSQL client tool with the connection password in the environment"""
+    env = dict(os.environ, PGPASSWORD=params['password'])
+    result = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(command[0])} failed: {result.stderr.strip()}")
+
+def connection_options(params, dbname):
+    return ['-h', params['host'], '-p', str(params['port']), '-U', params['user'], '-d', dbname]
+
+def admin_connection(params):
+    """Connect to the 'postgres' maintenance database, used to create and drop databases"""
+    return connect(dict(params, dbname='postgres'))
+
+def recreate_database(admin_cursor, name, template=None):
+    """Drop (terminating its sessions) and re-create a database, optionally from a template"""
+    from psycopg2 import sql
+
+    admin_cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(name)))
+    if template:
+        admin_cursor.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+            sql.Identifier(name), sql.Identifier(template)))
+    else:
+        admin_cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+
+def save_dump(params, key, manifest, snapshot_dir, jobs, bin_dir=None):
+    """Write a parallel directory-format pg_dump archive of the database"""
+    path = os.path.join(snapshot_dir, key)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    run_pg_tool([pg_tool('pg_dump', bin_dir), '--format=directory', f'--jobs={jobs}', f'--file={path}',
+                 *connection_options(params, params['dbname'])], params)
+    with open(path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+def save_template(params, key, manifest):
+    """Copy the database into a template database on the same server"""
+    from psycopg2 import sql
+
+    name = TEMPLATE_PREFIX + key
+    conn = admin_connection(params)
+    cursor = conn.cursor()
+    try:
+        # CREATE DATABASE ... TEMPLATE needs the source database to have no other sessions
+        cursor.execute("""
+            SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+            WHERE datname = %s AND pid <> pg_backend_pid()
+        """, (params['dbname'],))
+        recreate_database(cursor, name, template=params['dbname'])
+        cursor.execute(sql.SQL("COMMENT ON DATABASE {} IS {}").format(
+            sql.Identifier(name), sql.Literal(json.dumps(manifest))))
+    finally:
+        cursor.close()
+        conn.close()
+    return name
+
+def restore_dump(params, key, snapshot_dir, jobs, bin_dir=None):
+    """Re-create the target database and restore a pg_dump archive into it with parallel jobs"""
+    path = os.path.join(snapshot_dir, key)
+    if not os.path.isdir(path):
+        raise RuntimeError(f"No dump snapshot found at {path}")
+    conn = admin_connection(params)
+    try:
+        recreate_database(conn.cursor(), params['dbname'])
+    finally:
+        conn.close()
+    run_pg_tool([pg_tool('pg_restore', bin_dir), f'--jobs={jobs}', '--no-owner',
+                 *connection_options(params, params['dbname']), path], params)
+
+    # pg_restore does not carry planner statistics over
+    conn = connect(params)
+    try:
+        conn.cursor().execute("ANALYZE")
+    finally:
+        conn.close()
+    with open(path + '.json', encoding='utf-8') as f:
+        return json.load(f)
+
+def restore_template(params, key):
+    """Re-create the target database as a copy of a template snapshot"""
+    name = TEMPLATE_PREFIX + key
+    conn = admin_connection(params)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = %s", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            raise RuntimeError(f"No template snapshot database named {name}")
+        recreate_database(cursor, params['dbname'], template=name)
+    finally:
+        cursor.close()
+        conn.close()
+    return json.loads(row[0]) if row[0] else {}
+
+def list_snapshots(params, snapshot_dir):
+    """Return (method, key, manifest) for every dump and template snapshot"""
+    snapshots = []
+    if os.path.isdir(snapshot_dir):
+        for name in sorted(os.listdir(snapshot_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(snapshot_dir, name), encoding='utf-8') as f:
+                    snapshots.append(('dump', name[:-len('.json')], json.load(f)))
+    conn = admin_connection(params)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT datname, shobj_description(oid, 'pg_database') FROM pg_database
+            WHERE datname LIKE %s ORDER BY datname
+        """, (TEMPLATE_PREFIX + '%',))
+        for name, comment in cursor.fetchall():
+            snapshots.append(('template', name[len(TEMPLATE_PREFIX):], json.loads(comment) if comment else {}))
+    finally:
+        cursor.close()
+        conn.close()
+    return snapshots
+
+def verify_restore(params, manifest):
+    """Compare restored row counts with the ones recorded at snapshot time"""
+    expected = manifest.get('row_counts', {})
+    conn = connect(params)
+    cursor = conn.cursor()
+    try:
+        actual = table_counts(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    mismatches = {t: (expected[t], actual.get(t)) for t in expected if expected[t] != actual.get(t)}
+    for table, (want, got) in mismatches.items():
+        print(f"Row count mismatch for {table}: expected {want}, found {got}")
+    return not mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Save and restore populated database snapshots')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    def add_common(sub):
+        sub.add_argument('--method', choices=['dump', 'template'], default='dump',
+                         help='pg_dump directory archive or server-side template database (default: dump)')
+        sub.add_argument('--snapshot-dir', default=DEFAULT_SNAPSHOT_DIR,
+                         help=f'Directory holding dump snapshots (default: {DEFAULT_SNAPSHOT_DIR})')
+        sub.add_argument('--jobs', type=int, default=os.cpu_count() or 4,
+                         help='Parallel pg_dump/pg_restore jobs (default: number of CPUs)')
+        sub.add_argument('--pg-bin-dir', default=os.environ.get('PG_BIN_DIR'),
+                         help='Directory containing pg_dump/pg_restore (default: PATH or PG_BIN_DIR env var)')
+        add_db_arguments(sub)
+
+    save = subparsers.add_parser('save', help='Snapshot the current database')
+    save.add_argument('--scale-factor', type=float, help='Override the scale factor recorded in DatasetInfo')
+    save.add_argument('--seed', type=int, help='Override the seed recorded in DatasetInfo')
+    add_common(save)
+
+    restore = subparsers.add_parser('restore', help='Replace the database with a snapshot')
+    restore.add_argument('--scale-factor', type=float, default=1.0, help='Scale factor of the snapshot (default: 1)')
+    restore.add_argument('--seed', type=int, default=42, help='Seed of the snapshot (default: 42)')
+    restore.add_argument('--yes', action='store_true', help='Do not ask for confirmation before replacing the database')
+    add_common(restore)
+
+    listing = subparsers.add_parser('list', help='List available snapshots')
+    add_common(listing)
+
+    args = parser.parse_args(argv)
+    params = params_from_args(args)
+    start = time.perf_counter()
+
+    try:
+        if args.action == 'list':
+            snapshots = list_snapshots(params, args.snapshot_dir)
+            if not snapshots:
+                print("No snapshots found.")
+            for method, key, manifest in snapshots:
+                rows = manifest.get('row_counts', {})
+                print(f"{method:<9} {key:<20} created {manifest.get('created_at', '?')}, "
+                      f"{rows.get('Transaction', '?')} transactions, {rows.get('TransactionItem', '?')} items")
+            return 0
+
+        if args.action == 'save':
+            conn = connect(params)
+            cursor = conn.cursor()
+            try:
+                info = read_dataset_info(cursor)
+                manifest = {
+                    'scale_factor': args.scale_factor if args.scale_factor is not None else float(info.get('scale_factor', 1)),
+                    'seed': args.seed if args.seed is not None else int(info.get('seed', 42)),
+                    'source_database': params['dbname'],
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'row_counts': table_counts(cursor),
+                }
+            finally:
+                cursor.close()
+                conn.close()
+            key = snapshot_key(manifest['scale_factor'], manifest['seed'])
+            if args.method == 'dump':
+                location = save_dump(params, key, manifest, args.snapshot_dir, args.jobs, args.pg_bin_dir)
+            else:
+                location = save_template(params, key, manifest)
+            print(f"Saved {args.method} snapshot {key} to {location} in {time.perf_counter() - start:.1f}s")
+            return 0
+
+        key = snapshot_key(args.scale_factor, args.seed)
+        if not args.yes:
+            response = input(f"This will replace database '{params['dbname']}' with snapshot {key}. Continue? (y/N): ")
+            if response.lower() != 'y':
+                print("Operation cancelled.")
+                return 1
+        if args.method == 'dump':
+            manifest = restore_dump(params, key, args.snapshot_dir, args.jobs, args.pg_bin_dir)
+        else:
+            manifest = restore_template(params, key)
+        print(f"Restored {args.method} snapshot {key} into '{params['dbname']}' in {time.perf_counter() - start:.1f}s")
+        return 0 if verify_restore(params, manifest) else 1
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
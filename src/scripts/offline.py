@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Offline copy of the OntoDb tables, queried with DuckDB.
+
+`refresh` writes every OntoDb table to a local Parquet snapshot. Small tables
+are stored as one file each. Transaction and TransactionItem get one file per
+month of the transaction date. A manifest keeps a fingerprint of every small
+table and every month (see export_data.py), so a refresh only rewrites what
+changed since the last one. The whole refresh reads a single REPEATABLE READ
+snapshot, which keeps the files and their fingerprints consistent while
+sales are loaded.
+
+The report queries and ad-hoc SQL then run in DuckDB over views named after
+the tables, without touching the database. `parity` refreshes, then runs the
+reports and the table counts on both engines within that same database
+snapshot, and fails unless every result is identical.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import ONTODB_TABLES, add_db_arguments, connect, params_from_args, resolve_db_params
+from export_data import FETCH_ROWS, month_bounds, month_fingerprints, table_fingerprints, write_parquet
+from reports import REPORTS
+from schema_mode import detect_schema_mode
+
+DEFAULT_OFFLINE_DIR = os.path.join('data', 'offline')
+MANIFEST = '_manifest.json'
+# Holds the schema of a monthly table, so its view exists even without months
+EMPTY_PARTITION = '_empty.parquet'
+
+# Monthly table (aliased x) -> query of the {columns} of one month, taking %(start)s and %(end)s bounds
+MONTHLY_TABLES = {
+    'Transaction': """
+        SELECT {columns} FROM Transaction x
+        WHERE x.transaction_date >= %(start)s AND x.transaction_date < %(end)s
+    """,
+    'TransactionItem': """
+        SELECT {columns} FROM TransactionItem x
+        JOIN Transaction t ON t.transaction_id = x.transaction_id
+        WHERE t.transaction_date >= %(start)s AND t.transaction_date < %(end)s
+    """,
+}
+WHOLE_TABLES = [table for table in ONTODB_TABLES if table not in MONTHLY_TABLES]
+
+def column_types(cursor, table):
+    """Return [(column, PostgreSQL type, precision, scale)] of the stored columns of a table, in column order"""
+    # Generated columns (Shift.shift_period, a tsrange) are derived data without a Parquet type
+    cursor.execute("""
+        SELECT column_name, data_type, numeric_precision, numeric_scale
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (table.lower(),))
+    return [list(row) for row in cursor.fetchall()]
+
+def arrow_type(data_type, precision, scale):
+    import pyarrow as pa
+
+    types = {
+        'character varying': pa.string(), 'character': pa.string(), 'text': pa.string(),
+        'smallint': pa.int16(), 'integer': pa.int32(), 'bigint': pa.int64(),
+        'real': pa.float32(), 'double precision': pa.float64(), 'boolean': pa.bool_(),
+        'date': pa.date32(), 'time without time zone': pa.time64('us'),
+        'timestamp without time zone': pa.timestamp('us'), 'timestamp with time zone': pa.timestamp('us', tz='UTC'),
+        'bytea': pa.binary(),
+    }
+    if data_type == 'numeric':
+        return pa.decimal128(precision or 38, scale if precision else 10)
+    if data_type not in types:
+        raise ValueError(f"No Parquet type for PostgreSQL type {data_type}")
+    return types[data_type]
+
+def table_schema(columns):
+    import pyarrow as pa
+
+    return pa.schema([(name, arrow_type(data_type, precision, scale)) for name, data_type, precision, scale in columns])
+
+def select_list(columns, alias):
+    return ', '.join(f"{alias}.{column[0]}" for column in columns)
+
+def write_table_file(conn, query, query_params, path, schema, digest=None):
+    """Write the rows of a query to a Parquet file, replacing it atomically, returning the row count"""
+    # Named cursors stream the rows and share the transaction of conn
+    cursor = conn.cursor(name='offline_snapshot')
+    cursor.itersize = FETCH_ROWS
+    cursor.execute(query, query_params)
+    rows = write_parquet(cursor, path + '.tmp', schema, digest)
+    cursor.close()
+    os.replace(path + '.tmp', path)
+    return rows
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def refresh_snapshot(conn, directory, full=False):
+    """Bring the snapshot up to date within the current transaction of conn, returning (written, skipped) tables and months"""
+    manifest = {} if full else read_manifest(directory)
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    columns = {table: column_types(cursor, table) for table in ONTODB_TABLES}
+    fingerprints = table_fingerprints(cursor, WHOLE_TABLES)
+    months = month_fingerprints(cursor)
+    cursor.close()
+    if manifest.get('mode') != mode:
+        manifest = {}
+    previous_columns = manifest.get('columns', {})
+    written = skipped = 0
+    os.makedirs(directory, exist_ok=True)
+
+    tables = {}
+    for table in WHOLE_TABLES:
+        entry = manifest.get('tables', {}).get(table, {})
+        path = os.path.join(directory, f"{table}.parquet")
+        if (entry.get('fingerprint') == fingerprints[table] and previous_columns.get(table) == columns[table]
+                and os.path.exists(path)):
+            tables[table] = entry
+            skipped += 1
+            continue
+        rows = write_table_file(conn, f"SELECT {select_list(columns[table], 'x')} FROM {table} x", None,
+                                path, table_schema(columns[table]))
+        tables[table] = {'fingerprint': fingerprints[table], 'rows': rows}
+        written += 1
+        print(f"Snapshotted {rows} rows of {table}")
+
+    # A change of the fact tables' columns invalidates every month
+    same_columns = all(previous_columns.get(table) == columns[table] for table in MONTHLY_TABLES)
+    previous = manifest.get('months', {}) if same_columns else {}
+    partitions = {}
+    for table in MONTHLY_TABLES:
+        table_dir = os.path.join(directory, table)
+        if not same_columns:
+            shutil.rmtree(table_dir, ignore_errors=True)
+        os.makedirs(table_dir, exist_ok=True)
+        write_table_file(conn, f"SELECT {select_list(columns[table], 'x')} FROM {table} x WHERE false", None,
+                         os.path.join(table_dir, EMPTY_PARTITION), table_schema(columns[table]))
+        # Months that no longer have sales lose their partition
+        for month in set(previous) - set(months):
+            path = os.path.join(table_dir, f"month={month}.parquet")
+            if os.path.exists(path):
+                os.remove(path)
+    for month, fingerprint in sorted(months.items()):
+        entry = previous.get(month, {})
+        paths = [os.path.join(directory, table, f"month={month}.parquet") for table in MONTHLY_TABLES]
+        if entry.get('fingerprint') == fingerprint and all(os.path.exists(path) for path in paths):
+            partitions[month] = entry
+            skipped += 1
+            continue
+        rows = {table: write_table_file(conn, query.format(columns=select_list(columns[table], 'x')),
+                                        month_bounds(month), path, table_schema(columns[table]))
+                for (table, query), path in zip(MONTHLY_TABLES.items(), paths)}
+        partitions[month] = {'fingerprint': fingerprint, 'rows': rows}
+        written += 1
+        print(f"Snapshotted {', '.join(f'{n} {table} rows' for table, n in rows.items())} of {month}")
+
+    manifest_path = os.path.join(directory, MANIFEST)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'mode': mode, 'columns': columns, 'tables': tables, 'months': partitions}, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return written, skipped
+
+def open_snapshot(directory):
+    """Return (DuckDB connection with one view per OntoDb table, schema mode) of a snapshot"""
+    import duckdb
+
+    manifest = read_manifest(directory)
+    if not manifest:
+        raise RuntimeError(f"No offline snapshot in {directory}; run `ontodb offline refresh` first")
+    engine = duckdb.connect()
+    for table in ONTODB_TABLES:
+        if table in MONTHLY_TABLES:
+            files = os.path.join(directory, table, '*.parquet')
+        else:
+            files = os.path.join(directory, f"{table}.parquet")
+        engine.execute(f"""CREATE VIEW "{table}" AS
+                           SELECT * FROM read_parquet('{files.replace("'", "''")}', hive_partitioning = false)""")
+    return engine, manifest['mode']
+
+def run_sql(engine, sql):
+    """Return (columns, rows) of a query run by DuckDB"""
+    result = engine.execute(sql)
+    return [desc[0] for desc in result.description], result.fetchall()
+
+def offline_reports(directory):
+    """Yield (title, columns, rows) of the analytical reports run on the snapshot"""
+    engine, mode = open_snapshot(directory)
+    try:
+        for title, build_query, _ in REPORTS.values():
+            yield (title,) + run_sql(engine, build_query(mode))
+    finally:
+        engine.close()
+
+def parity_queries(mode, extra=()):
+    """Return [(label, SQL)] compared by `parity`: the reports, table counts and extra queries"""
+    queries = [(f"report {name}", build_query(mode)) for name, (_, build_query, _) in REPORTS.items()]
+    queries += [(f"count {table}", f"SELECT COUNT(*) FROM {table}") for table in ONTODB_TABLES]
+    queries += [(f"query {i + 1}", sql) for i, sql in enumerate(extra)]
+    return queries
+
+def check_parity(conn, directory, extra=()):
+    """Run the parity queries on PostgreSQL (within conn's transaction) and on the snapshot, returning mismatches"""
+    engine, mode = open_snapshot(directory)
+    cursor = conn.cursor()
+    mismatches = []
+    try:
+        for label, sql in parity_queries(mode, extra):
+            cursor.execute(sql)
+            expected = ([desc[0] for desc in cursor.description], cursor.fetchall())
+            actual = run_sql(engine, sql)
+            # Names of unaliased expressions differ between the engines, so only the rows are compared
+            same = expected[1] == actual[1]
+            print(f"{'OK  ' if same else 'DIFF'} {label} ({len(expected[1])} rows)")
+            if not same:
+                mismatches.append((label, expected, actual))
+    finally:
+        cursor.close()
+        engine.close()
+    return mismatches
+
+def snapshot_connection(params):
+    """Open a read-only REPEATABLE READ transaction, so a refresh and a parity check see one database state"""
+    conn = connect(params, autocommit=False, role='read')
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    return conn
+
+def print_rows(columns, rows):
+    from tabulate import tabulate
+
+    print(tabulate(rows, headers=columns, tablefmt="pretty") if rows else "No results found.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the reports and ad-hoc SQL in DuckDB over a local Parquet snapshot')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    def add_common(sub, database=True):
+        sub.add_argument('--dir', default=DEFAULT_OFFLINE_DIR,
+                         help=f'Snapshot directory (default: {DEFAULT_OFFLINE_DIR})')
+        if database:
+            add_db_arguments(sub)
+
+    refresh = subparsers.add_parser('refresh', help='Copy the tables and months changed since the last refresh')
+    refresh.add_argument('--full', action='store_true', help='Rewrite the whole snapshot, ignoring the manifest')
+    add_common(refresh)
+
+    query = subparsers.add_parser('query', help='Run SQL on the snapshot, or the analytical reports without SQL')
+    query.add_argument('sql', nargs='?', help='SQL over the OntoDb table names (default: run the reports)')
+    add_common(query, database=False)
+
+    parity = subparsers.add_parser('parity', help='Refresh, then check the reports give identical results on both engines')
+    parity.add_argument('--sql', action='append', default=[], help='Additional query to compare (repeatable)')
+    add_common(parity)
+
+    args = parser.parse_args(argv)
+
+    try:
+        import duckdb  # noqa: F401
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("The offline engine requires duckdb and pyarrow (pip install duckdb pyarrow)")
+        return 1
+
+    if args.action == 'query':
+        try:
+            start = time.perf_counter()
+            if args.sql is None:
+                for title, columns, rows in offline_reports(args.dir):
+                    print(f"\n{title} [offline]")
+                    print_rows(columns, rows)
+            else:
+                engine, _ = open_snapshot(args.dir)
+                columns, rows = run_sql(engine, args.sql)
+                engine.close()
+                print_rows(columns, rows)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            return 1
+        print(f"\nRan in {(time.perf_counter() - start) * 1000:.1f} ms on the snapshot in {args.dir}")
+        return 0
+
+    params = resolve_db_params(params_from_args(args))
+    if params is None:
+        return 1
+    conn = snapshot_connection(params)
+    try:
+        start = time.perf_counter()
+        written, skipped = refresh_snapshot(conn, args.dir, full=getattr(args, 'full', False))
+        print(f"Refreshed {written} tables and months, kept {skipped} unchanged in "
+              f"{time.perf_counter() - start:.2f}s in {args.dir}")
+        if args.action == 'parity':
+            mismatches = check_parity(conn, args.dir, args.sql)
+            for label, (expected_columns, expected), (columns, rows) in mismatches:
+                print(f"\n{label}: PostgreSQL")
+                print_rows(expected_columns, expected)
+                print(f"{label}: DuckDB")
+                print_rows(columns, rows)
+            if mismatches:
+                print(f"\n{len(mismatches)} results differ between PostgreSQL and the offline snapshot")
+                return 1
+            print("All results are identical on PostgreSQL and the offline snapshot")
+    finally:
+        conn.rollback()
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
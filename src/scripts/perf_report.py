@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Server-side performance report for the OntoDb database.
+
+Collects:
+
+- the top statements by total and mean execution time from pg_stat_statements
+  (the extension must be in shared_preload_libraries, see docker-compose.yml),
+- indexes on the OntoDb tables that have never been scanned,
+- heap and index buffer cache hit ratios of the OntoDb tables, and
+- plans of the report queries that run longer than a threshold, logged by
+  auto_explain and captured as client notices. Without auto_explain the slow
+  queries are explained with EXPLAIN ANALYZE instead.
+
+The report is printed as tables and can also be written as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import ONTODB_TABLES, add_db_arguments, connect, params_from_args
+from reports import REPORTS
+from schema_mode import detect_schema_mode
+
+# Tables with a hit ratio below this are reported as poorly cached
+DEFAULT_MIN_HIT_RATIO = 0.99
+# Tables with fewer block accesses are too cold for their ratio to mean anything
+MIN_BLOCKS_FOR_RATIO = 1000
+
+def rows_as_dicts(cursor):
+    columns = [desc[0] for desc in cursor.description]
+    return [{c: float(v) if isinstance(v, Decimal) else v for c, v in zip(columns, row)}
+            for row in cursor.fetchall()]
+
+def enable_pg_stat_statements(cursor):
+    """Create the extension if possible; return an explanation when it cannot be read, else None"""
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_stat_statements'")
+    if not cursor.fetchone():
+        return "pg_stat_statements is not installed on the server"
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+    cursor.execute("SELECT 'pg_stat_statements' = ANY(string_to_array(current_setting('shared_preload_libraries'), ','))")
+    if not cursor.fetchone()[0]:
+        return "pg_stat_statements is not in shared_preload_libraries"
+    return None
+
+def top_statements(cursor, order_by, limit):
+    """Return the top statements of the current database ordered by total_time or mean_time"""
+    cursor.execute("SHOW server_version_num")
+    # The timing columns were renamed in PostgreSQL 13
+    prefix = 'exec_' if int(cursor.fetchone()[0]) >= 130000 else ''
+    cursor.execute(f"""
+        SELECT left(regexp_replace(query, '\\s+', ' ', 'g'), 80) AS query,
+               calls,
+               round(total_{prefix}time::numeric, 1) AS total_ms,
+               round(mean_{prefix}time::numeric, 2) AS mean_ms,
+               rows,
+               round(100.0 * shared_blks_hit / NULLIF(shared_blks_hit + shared_blks_read, 0), 2) AS hit_pct
+        FROM pg_stat_statements
+        WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+        ORDER BY {order_by.replace('_time', f'_{prefix}time')} DESC
+        LIMIT %s
+    """, (limit,))
+    return rows_as_dicts(cursor)
+
+def unused_indexes(cursor):
+    """Return non-constraint indexes on the OntoDb tables that have never been scanned"""
+    cursor.execute("""
+        SELECT s.relname AS table, s.indexrelname AS index, s.idx_scan AS scans,
+               pg_size_pretty(pg_relation_size(s.indexrelid)) AS size
+        FROM pg_stat_user_indexes s
+        JOIN pg_index i ON i.indexrelid = s.indexrelid
+        WHERE s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary
+          AND s.relname = ANY(%s)
+        ORDER BY pg_relation_size(s.indexrelid) DESC
+    """, ([t.lower() for t in ONTODB_TABLES],))
+    return rows_as_dicts(cursor)
+
+def cache_hit_ratios(cursor):
+    """Return heap and index buffer hit ratios of the OntoDb tables, worst first"""
+    cursor.execute("""
+        SELECT relname AS table,
+               heap_blks_hit + heap_blks_read AS heap_blocks,
+               round(heap_blks_hit::numeric / NULLIF(heap_blks_hit + heap_blks_read, 0), 4) AS heap_hit_ratio,
+               COALESCE(idx_blks_hit, 0) + COALESCE(idx_blks_read, 0) AS index_blocks,
+               round(idx_blks_hit::numeric / NULLIF(idx_blks_hit + idx_blks_read, 0), 4) AS index_hit_ratio
+        FROM pg_statio_user_tables
+        WHERE relname = ANY(%s)
+        ORDER BY LEAST(heap_blks_hit::numeric / NULLIF(heap_blks_hit + heap_blks_read, 0),
+                       idx_blks_hit::numeric / NULLIF(idx_blks_hit + idx_blks_read, 0)) NULLS LAST
+    """, ([t.lower() for t in ONTODB_TABLES],))
+    return rows_as_dicts(cursor)
+
+def parse_auto_explain(notice):
+    """Return (duration_ms, plan) from an auto_explain JSON log notice, or None for other notices"""
+    head, sep, body = notice.partition('plan:')
+    if not sep or 'duration:' not in head:
+        return None
+    duration = float(head.split('duration:')[1].split('ms')[0])
+    return duration, json.loads(body)
+
+def explain_slow_reports(conn, min_duration_ms):
+    """Run the report queries and return the plans of those slower than min_duration_ms"""
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    try:
+        cursor.execute("LOAD 'auto_explain'")
+        cursor.execute("SET auto_explain.log_min_duration = %s", (min_duration_ms,))
+        cursor.execute("SET auto_explain.log_analyze = on")
+        cursor.execute("SET auto_explain.log_buffers = on")
+        cursor.execute("SET auto_explain.log_format = 'json'")
+        cursor.execute("SET client_min_messages = log")
+        source = 'auto_explain'
+    except Exception as e:
+        print(f"auto_explain is not available ({str(e).strip()}); using EXPLAIN ANALYZE", file=sys.stderr)
+        source = 'explain'
+
+    plans = []
+    for name, (_, build_query, _) in REPORTS.items():
+        query = build_query(mode)
+        del conn.notices[:]
+        start = time.perf_counter()
+        cursor.execute(query)
+        cursor.fetchall()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if source == 'auto_explain':
+            for notice in conn.notices:
+                parsed = parse_auto_explain(notice)
+                if parsed:
+                    plans.append({'report': name, 'duration_ms': round(parsed[0], 2), 'plan': parsed[1]})
+        elif elapsed_ms >= min_duration_ms:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query)
+            plans.append({'report': name, 'duration_ms': round(elapsed_ms, 2), 'plan': cursor.fetchone()[0][0]})
+    cursor.execute("RESET client_min_messages")
+    cursor.close()
+    return source, plans
+
+def print_section(title, rows):
+    from tabulate import tabulate
+
+    print(f"\n{title}")
+    if rows:
+        print(tabulate([list(r.values()) for r in rows], headers=list(rows[0]), tablefmt="pretty"))
+    else:
+        print("None.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report statement timings, unused indexes, cache hit ratios and slow query plans')
+    parser.add_argument('--top', type=int, default=10, help='Statements to list per ordering (default: 10)')
+    parser.add_argument('--min-hit-ratio', type=float, default=DEFAULT_MIN_HIT_RATIO,
+                        help=f'Flag tables with a lower buffer hit ratio (default: {DEFAULT_MIN_HIT_RATIO})')
+    parser.add_argument('--explain-ms', type=int, default=50,
+                        help='Capture plans of report queries slower than this many ms (default: 50, 0 for all)')
+    parser.add_argument('--json', metavar='PATH', help="Also write the report as JSON ('-' for stdout only)")
+    parser.add_argument('--reset', action='store_true', help='Reset pg_stat_statements after reading it')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        conn = connect(params_from_args(args))
+        cursor = conn.cursor()
+        report = {'generated_at': datetime.now().isoformat(timespec='seconds')}
+
+        unavailable = enable_pg_stat_statements(cursor)
+        if unavailable:
+            report['statements'] = {'unavailable': unavailable}
+        else:
+            report['statements'] = {
+                'by_total_time': top_statements(cursor, 'total_time', args.top),
+                'by_mean_time': top_statements(cursor, 'mean_time', args.top),
+            }
+            if args.reset:
+                cursor.execute("SELECT pg_stat_statements_reset()")
+
+        report['unused_indexes'] = unused_indexes(cursor)
+        ratios = cache_hit_ratios(cursor)
+        report['cache_hit_ratios'] = ratios
+        report['poorly_cached'] = [
+            r['table'] for r in ratios
+            if any(r[k] is not None and r[blocks] >= MIN_BLOCKS_FOR_RATIO and r[k] < args.min_hit_ratio
+                   for k, blocks in (('heap_hit_ratio', 'heap_blocks'), ('index_hit_ratio', 'index_blocks')))
+        ]
+        report['plan_source'], report['slow_plans'] = explain_slow_reports(conn, args.explain_ms)
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+    if args.json == '-':
+        print(json.dumps(report, indent=2, default=str))
+        return 0
+
+    if unavailable:
+        print(f"\nStatement statistics: {unavailable}")
+    else:
+        print_section(f"Top {args.top} statements by total time", report['statements']['by_total_time'])
+        print_section(f"Top {args.top} statements by mean time", report['statements']['by_mean_time'])
+    print_section("Indexes never scanned", report['unused_indexes'])
+    print_section("Buffer cache hit ratios", ratios)
+    if report['poorly_cached']:
+        print(f"Below {args.min_hit_ratio}: {', '.join(report['poorly_cached'])}")
+    print(f"\nReport queries slower than {args.explain_ms} ms ({report['plan_source']}): {len(report['slow_plans'])}")
+    for entry in report['slow_plans']:
+        plan = entry['plan']['Plan']
+        print(f"- {entry['report']}: {entry['duration_ms']} ms, top node {plan['Node Type']}, "
+              f"{plan.get('Actual Rows')} rows")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nWrote {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Concurrent point-of-sale write simulator.
+
+Each client thread plays one till: it holds its own connection and inserts a
+Transaction with its TransactionItem rows in one database transaction, paced
+to a target rate. Baskets, payment methods and the staff member on duty come
+from the same demand and shift models as the populate scripts. A sampler
+thread watches pg_stat_activity and pg_locks for sessions waiting on locks.
+
+The report gives the achieved TPS, transaction and commit latency
+percentiles and lock waits, i.e. how many tills one PostgreSQL instance
+running this schema can serve.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_population'))
+
+from db import add_db_arguments, connect, params_from_args, read_dataset_info
+
+# Transaction codes of simulated sales start with this prefix, so they can be cleaned up
+POS_PREFIX = 'PTX-'
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+class Till(threading.Thread):
+    """One simulated till inserting sales for one store"""
+
+    def __init__(self, number, store_id, context, run_id, rate, deadline, hot_row):
+        super().__init__(daemon=True)
+        self.number = number
+        self.store_id = store_id
+        self.context = context
+        self.run_id = run_id
+        self.interval = 1.0 / rate if rate else 0.0
+        self.deadline = deadline
+        self.hot_row = hot_row
+        self.latencies = []
+        self.commit_latencies = []
+        self.errors = 0
+        self.error_messages = set()
+
+    def run(self):
+        from psycopg2.extras import execute_values
+        from populate_staff_data import OnDutyIndex, generate_shifts
+        from seeding import rng_for
+
+        ctx = self.context
+        rng = rng_for(ctx['seed'], 'pos', self.run_id, self.number)
+        today = ctx['day']
+        staff = ctx['store_staff'][self.store_id]
+        # Today's stored shifts, else the ones populate would generate for today
+        shifts = ctx['store_shifts'].get((self.store_id, today)) or generate_shifts(self.store_id, today, staff, ctx['seed'])
+        on_duty = OnDutyIndex(shifts, staff)
+        source = 'bakery' if 'BAK' in self.store_id else 'coffee_shop'
+        store_key = ctx['store_keys'][self.store_id]
+
+        conn = connect(ctx['params'], autocommit=False)
+        cursor = conn.cursor()
+        next_at = time.perf_counter()
+        number = 0
+        try:
+            while time.perf_counter() < self.deadline:
+                # Open-loop pacing: a slow commit does not lower the offered rate
+                if self.interval:
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_at += self.interval
+                number += 1
+                code = f"{POS_PREFIX}{self.store_id}-{self.run_id}-{self.number:03d}-{number:06d}"
+                now = datetime.now()
+                seconds = now.hour * 3600 + now.minute * 60 + now.second
+
+                items = []
+                total = 0.0
+                for j, product in enumerate(ctx['model'].sample_basket(rng, source, now.month)):
+                    quantity = ctx['model'].sample_quantity(rng)
+                    price = float(product[4])
+                    item_total = round(price * quantity, 2)
+                    total += item_total
+                    items.append((ctx['product_keys'][product[0]], quantity, price, 0.0, item_total, f"{code}_{j + 1}"))
+
+                start = time.perf_counter()
+                try:
+                    cursor.execute(ctx['insert_transaction'], (
+                        code, store_key, today, now.strftime('%H:%M:%S'), ctx['payment_table'].sample(rng),
+                        rng.choice(on_duty.staff_at(seconds)), round(total, 2), ctx['currency_id'], source
+                    ))
+                    transaction_id = cursor.fetchone()[0]
+                    execute_values(cursor, """
+                        INSERT INTO TransactionItem
+                            (transaction_id, product_id, quantity, unit_price, discount_percent, item_total, sale_id)
+                        VALUES %s
+                    """, [(transaction_id,) + item for item in items])
+                    if self.hot_row:
+                        # A running daily total per store: every till of the store updates the same row
+                        cursor.execute("""
+                            INSERT INTO DailySalesSummary
+                                (store_id, sales_date, transaction_count, item_count, units_sold, total_sales)
+                            VALUES (%s, %s, 1, %s, %s, %s)
+                            ON CONFLICT (store_id, sales_date) DO UPDATE SET
+                                transaction_count = DailySalesSummary.transaction_count + 1,
+                                item_count = DailySalesSummary.item_count + EXCLUDED.item_count,
+                                units_sold = DailySalesSummary.units_sold + EXCLUDED.units_sold,
+                                total_sales = DailySalesSummary.total_sales + EXCLUDED.total_sales
+                        """, (store_key, today, len(items), sum(i[1] for i in items), round(total, 2)))
+                    commit_start = time.perf_counter()
+                    conn.commit()
+                    end = time.perf_counter()
+                    self.latencies.append(end - start)
+                    self.commit_latencies.append(end - commit_start)
+                except Exception as e:
+                    conn.rollback()
+                    self.errors += 1
+                    self.error_messages.add(str(e).splitlines()[0])
+        finally:
+            cursor.close()
+            conn.close()
+
+def sample_lock_waits(params, stop, samples, interval=0.1):
+    """Record (sessions waiting on a lock, ungranted locks) until stop is set"""
+    conn = connect(params)
+    cursor = conn.cursor()
+    try:
+        while not stop.is_set():
+            cursor.execute("""
+                SELECT (SELECT COUNT(*) FROM pg_stat_activity
+                        WHERE datname = current_database() AND wait_event_type = 'Lock'),
+                       (SELECT COUNT(*) FROM pg_locks WHERE NOT granted)
+            """)
+            samples.append(cursor.fetchone())
+            stop.wait(interval)
+    finally:
+        cursor.close()
+        conn.close()
+
+def load_context(cursor, params, seed):
+    """Read the store, product, staff and payment data the tills need"""
+    from demand_model import DemandModel
+    from populate_staff_data import load_store_shifts
+    from populate_transaction_data import ensure_payment_methods, get_store_staff, hour_weights_for
+    from schema_mode import code_column, detect_schema_mode, select_products_sql, select_stores_sql
+
+    mode = detect_schema_mode(cursor)
+    cursor.execute(select_stores_sql(mode))
+    stores = cursor.fetchall()
+    cursor.execute(select_products_sql(mode))
+    products = cursor.fetchall()
+    store_staff = get_store_staff(cursor, stores)
+    if not stores or not products or not store_staff:
+        raise RuntimeError("No stores, products or staff found. Please run the population scripts first.")
+
+    cursor.execute(f"SELECT {code_column(mode, 'Store')}, store_id FROM Store")
+    store_keys = dict(cursor.fetchall())
+    cursor.execute(f"SELECT {code_column(mode, 'Product')}, product_id FROM Product")
+    product_keys = dict(cursor.fetchall())
+    cursor.execute("SELECT currency_id FROM Currency WHERE currency_code = 'EUR'")
+    currency_id = cursor.fetchone()[0]
+
+    model = DemandModel(stores, products, hour_weights_for, seed=seed)
+    today = date.today().strftime('%Y-%m-%d')
+    return {
+        'params': params,
+        'seed': seed,
+        'day': today,
+        'stores': [s[0] for s in stores if s[0] in store_staff],
+        'store_staff': store_staff,
+        'store_shifts': load_store_shifts(cursor, [today]),
+        'store_keys': store_keys,
+        'product_keys': product_keys,
+        'currency_id': currency_id,
+        'model': model,
+        'payment_table': model.payment_table(ensure_payment_methods(cursor)),
+        'insert_transaction': f"""
+            INSERT INTO Transaction ({code_column(mode, 'Transaction')}, store_id, transaction_date, transaction_time,
+                                     payment_method_id, staff_id, total_amount, currency_id, data_source)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING transaction_id
+        """,
+        'mode': mode,
+    }
+
+def cleanup(cursor, context, run_id, hot_row):
+    """Delete the simulated sales of a run and rebuild the daily summary rows they touched"""
+    from incremental_load import create_staging_tables, refresh_daily_summary
+    from schema_mode import code_column
+
+    code = code_column(context['mode'], 'Transaction')
+    pattern = f"{POS_PREFIX}%-{run_id}-%"
+    cursor.execute(f"""
+        DELETE FROM TransactionItem i USING Transaction t
+        WHERE i.transaction_id = t.transaction_id AND t.{code} LIKE %s
+    """, (pattern,))
+    cursor.execute(f"DELETE FROM Transaction WHERE {code} LIKE %s", (pattern,))
+    deleted = cursor.rowcount
+    if hot_row:
+        store_keys = [context['store_keys'][s] for s in context['stores']]
+        cursor.execute("DELETE FROM DailySalesSummary WHERE sales_date = %s AND store_id = ANY(%s)",
+                       (context['day'], store_keys))
+        create_staging_tables(cursor)
+        cursor.execute("""
+            INSERT INTO affected_days (store_id, sales_date)
+            SELECT DISTINCT store_id, transaction_date FROM Transaction
+            WHERE transaction_date = %s AND store_id = ANY(%s)
+        """, (context['day'], store_keys))
+        refresh_daily_summary(cursor)
+    return deleted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ontodb bench pos', description='Concurrent point-of-sale write simulator')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Concurrent tills, spread round-robin over the stores (default: 8)')
+    parser.add_argument('--rate', type=float, default=50.0,
+                        help='Target sales per second over all tills, 0 for as fast as possible (default: 50)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Run time in seconds (default: 10)')
+    parser.add_argument('--hot-row', action='store_true',
+                        help="Also keep a running per-store daily total in DailySalesSummary (contended row)")
+    parser.add_argument('--keep', action='store_true', help='Keep the simulated sales instead of deleting them')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the tills (default: the seed recorded by populate, else 42)')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    params = params_from_args(args)
+    run_id = int(time.time())
+    try:
+        conn = connect(params, autocommit=False)
+        cursor = conn.cursor()
+        seed = args.seed if args.seed is not None else int(read_dataset_info(cursor).get('seed', 42))
+        context = load_context(cursor, params, seed)
+        conn.commit()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+    deadline = time.perf_counter() + args.duration
+    per_till_rate = args.rate / args.clients if args.rate else 0.0
+    tills = [Till(n, context['stores'][n % len(context['stores'])], context, run_id, per_till_rate,
+                  deadline, args.hot_row)
+             for n in range(args.clients)]
+    stop = threading.Event()
+    lock_samples = []
+    sampler = threading.Thread(target=sample_lock_waits, args=(params, stop, lock_samples), daemon=True)
+
+    print(f"Running {args.clients} tills over {len(set(t.store_id for t in tills))} stores for "
+          f"{args.duration:g}s at {'max' if not args.rate else f'{args.rate:g}/s'}...")
+    start = time.perf_counter()
+    sampler.start()
+    for till in tills:
+        till.start()
+    for till in tills:
+        till.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    latencies = [l for t in tills for l in t.latencies]
+    commit_latencies = [l for t in tills for l in t.commit_latencies]
+    errors = sum(t.errors for t in tills)
+    waiting = [w for w, _ in lock_samples]
+
+    print(f"\nCommitted {len(latencies)} sales in {elapsed:.1f}s: {len(latencies) / elapsed:.1f} TPS "
+          f"(target {args.rate:g}), {errors} errors")
+    print(f"{'latency ms':<14} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, values in (('transaction', latencies), ('commit', commit_latencies)):
+        print(f"{label:<14} " + ' '.join(f"{percentile(values, q) * 1000:>8.2f}" for q in (0.5, 0.95, 0.99, 1.0)))
+    if lock_samples:
+        print(f"Lock waits: {sum(1 for w in waiting if w)}/{len(lock_samples)} samples with waiting sessions, "
+              f"mean {statistics.mean(waiting):.2f}, max {max(waiting)} waiting, "
+              f"max {max(u for _, u in lock_samples)} ungranted locks")
+    for message in sorted({m for t in tills for m in t.error_messages})[:5]:
+        print(f"Error: {message}")
+
+    if not args.keep:
+        deleted = cleanup(cursor, context, run_id, args.hot_row)
+        conn.commit()
+        print(f"Deleted {deleted} simulated sales (use --keep to keep them)")
+    cursor.close()
+    conn.close()
+    return 1 if errors and not latencies else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""Fuzzy product lookup by partial names, for point-of-sale clients.
+
+Names and details are folded into a search key: lower case, accents
+removed, every run of other characters turned into one space ("Éclair au
+café" -> "eclair au cafe"). The key is a generated column of Product. A
+pg_trgm GIN index on it serves both the word-prefix regexes ("pain choc"
+matches "pain au chocolat") and the word-similarity operator that catches
+typos ("croisant").
+
+ProductIndex is the same lookup held in process for the hot catalog.
+Products are numbered in rank order (shorter keys first), and every word has
+a sorted posting list. A query takes the token with the fewest postings and
+walks the posting lists of the words it prefixes in rank order. It keeps the
+products whose words also start with the other tokens, and stops at the
+limit. A token that starts no word of the catalog is replaced by its closest
+spellings, found in a trigram index of the vocabulary scored with NumPy.
+CatalogCache keeps an index fresh by checking the Product table's version at
+most every few seconds.
+"""
+import argparse
+import heapq
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from bisect import bisect_left
+from itertools import product
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import add_db_arguments, connect, params_from_args
+from schema_mode import code_column, detect_schema_mode
+
+# Characters folded to their base letter, in both SQL (translate) and Python (str.translate)
+FOLD_FROM = 'àáâãäåāçćčèéêëēėęìíîïīñńòóôõöōùúûüūýÿžźżšÀÁÂÃÄÅĀÇĆČÈÉÊËĒĖĘÌÍÎÏĪÑŃÒÓÔÕÖŌÙÚÛÜŪÝŸŽŹŻŠ'
+FOLD_TO = 'aaaaaaaccceeeeeeeiiiiinnoooooouuuuuyyzzzsAAAAAAACCCEEEEEEEIIIIINNOOOOOOUUUUUYYZZZS'
+LIGATURES = [('œ', 'oe'), ('Œ', 'OE'), ('æ', 'ae'), ('Æ', 'AE'), ('ß', 'ss')]
+FOLD_TABLE = str.maketrans(FOLD_FROM, FOLD_TO)
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+# Trigram similarity from which a catalog word is taken as a spelling of a token that prefixes no word
+FUZZY_THRESHOLD = 0.5
+# Closest catalog words tried for such a token
+CORRECTIONS = 3
+# Candidates filtered at once before the next, eight times larger, chunk
+FIRST_CHUNK = 1024
+# Matches of up to this many words are checked by binary search in their posting lists
+SEARCHSORTED_WORDS = 8
+DEFAULT_LIMIT = 10
+# Seconds between checks of the Product table's version by CatalogCache
+DEFAULT_MAX_AGE = 5.0
+
+def fold(text):
+    """Return the search key of a text: lower case, unaccented words separated by single spaces"""
+    text = text.translate(FOLD_TABLE)
+    for ligature, letters in LIGATURES:
+        text = text.replace(ligature, letters)
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+def fold_sql(expression):
+    """Return the SQL computing fold() of an expression (immutable, so usable in a generated column)"""
+    for ligature, letters in LIGATURES:
+        expression = f"replace({expression}, '{ligature}', '{letters}')"
+    return f"btrim(regexp_replace(lower(translate({expression}, '{FOLD_FROM}', '{FOLD_TO}')), '[^a-z0-9]+', ' ', 'g'))"
+
+def has_trigram_index(cursor):
+    cursor.execute("SELECT to_regclass('idx_product_search_key_trgm') IS NOT NULL")
+    return cursor.fetchone()[0]
+
+def ensure_search_key(cursor):
+    """Add the search_key column and its trigram index to Product if missing; return whether pg_trgm is used"""
+    cursor.execute(f"""
+        ALTER TABLE Product ADD COLUMN IF NOT EXISTS search_key TEXT
+        GENERATED ALWAYS AS ({fold_sql("product_name || ' ' || COALESCE(detail, '')")}) STORED
+    """)
+    if has_trigram_index(cursor):
+        return True
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if not cursor.fetchone():
+        print("pg_trgm is not available; searching Product without a trigram index")
+        return False
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cursor.execute("CREATE INDEX idx_product_search_key_trgm ON Product USING GIN (search_key gin_trgm_ops)")
+    cursor.execute("ANALYZE Product")
+    return True
+
+def search_sql(mode, trigram):
+    """Return the ranked search query, taking %(words)s prefix regexes, %(query)s and %(limit)s"""
+    code = code_column(mode, 'Product')
+    if not trigram:
+        return f"""
+            SELECT {code}, product_name, 1.0 AS score FROM Product
+            WHERE is_active AND search_key ~ ALL(%(words)s)
+            ORDER BY length(search_key), {code} LIMIT %(limit)s
+        """
+    # Word-prefix matches first, then typo matches by word similarity
+    return f"""
+        SELECT {code}, product_name,
+               CASE WHEN search_key ~ ALL(%(words)s) THEN 1.0
+                    ELSE word_similarity(%(query)s, search_key) END AS score
+        FROM Product
+        WHERE is_active AND (search_key ~ ALL(%(words)s) OR %(query)s <%% search_key)
+        ORDER BY score DESC, length(search_key), {code} LIMIT %(limit)s
+    """
+
+def search_products(cursor, text, limit=DEFAULT_LIMIT, mode=None, trigram=None):
+    """Search Product in the database, returning [(code, name, score)] best first"""
+    query = fold(text)
+    if not query:
+        return []
+    if mode is None:
+        mode = detect_schema_mode(cursor)
+    if trigram is None:
+        trigram = has_trigram_index(cursor)
+    words = [r'\m' + token for token in query.split()]
+    cursor.execute(search_sql(mode, trigram), {'words': words, 'query': query, 'limit': limit})
+    return [(code, name, float(score)) for code, name, score in cursor.fetchall()]
+
+def trigrams(key):
+    """Return the set of pg_trgm-style trigrams of a search key (words padded with two spaces before, one after)"""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class ProductIndex:
+    """In-process prefix and trigram index of a product catalog"""
+
+    def __init__(self, products):
+        import numpy as np
+
+        # Rank order: shorter keys first, so the first matches found are the closest ones.
+        # Products whose key folds to nothing cannot be found and are left out.
+        entries = sorted(((key, code, name) for key, code, name in
+                          ((fold(f"{name} {detail or ''}"), code, name) for code, name, detail in products) if key),
+                         key=lambda entry: (len(entry[0]), entry[1]))
+        self.codes = [code for _, code, _ in entries]
+        self.names = [name for _, _, name in entries]
+
+        words = [sorted(set(key.split())) for key, _, _ in entries]
+        self.vocabulary = sorted({word for product_words in words for word in product_words})
+        word_index = {word: i for i, word in enumerate(self.vocabulary)}
+        # Words of each product as vocabulary indices, in CSR layout
+        self.word_ids = np.array([word_index[word] for product_words in words for word in product_words], dtype=np.int32)
+        self.word_indptr = np.zeros(len(entries) + 1, dtype=np.int64)
+        np.cumsum([len(product_words) for product_words in words], out=self.word_indptr[1:])
+        # Products of each word (sorted, so in rank order)
+        order = np.argsort(self.word_ids, kind='stable')
+        products = np.repeat(np.arange(len(entries), dtype=np.int32), np.diff(self.word_indptr))[order]
+        bounds = np.searchsorted(self.word_ids[order], np.arange(len(self.vocabulary) + 1))
+        self.postings = [products[bounds[i]:bounds[i + 1]] for i in range(len(self.vocabulary))]
+        self.posting_offsets = bounds
+
+        # Trigrams of the vocabulary, to correct misspelt tokens
+        grams = {}
+        self.word_gram_counts = np.zeros(len(self.vocabulary))
+        for i, word in enumerate(self.vocabulary):
+            word_grams = trigrams(word)
+            self.word_gram_counts[i] = len(word_grams)
+            for gram in word_grams:
+                grams.setdefault(gram, []).append(i)
+        self.grams = {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def word_range(self, token):
+        """Return the [lo, hi) range of vocabulary words starting with token"""
+        # Keys only hold [a-z0-9 ], which all sort before '{'
+        return bisect_left(self.vocabulary, token), bisect_left(self.vocabulary, token + '{')
+
+    def corrections(self, token):
+        """Return (vocabulary indices, similarities) of the words closest to a token that prefixes none"""
+        import numpy as np
+
+        token_grams = trigrams(token)
+        postings = [self.grams[gram] for gram in token_grams if gram in self.grams]
+        if not postings:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.vocabulary))
+        # pg_trgm similarity: shared trigrams over the trigrams of either word
+        similarity = shared / (len(token_grams) + self.word_gram_counts - shared)
+        best = np.argsort(-similarity, kind='stable')[:CORRECTIONS]
+        best = best[similarity[best] >= FUZZY_THRESHOLD]
+        return best, similarity[best]
+
+    def product_words(self, products):
+        """Return the vocabulary indices of the words of the given products, and where each product's words start"""
+        import numpy as np
+
+        starts = self.word_indptr[products]
+        lengths = self.word_indptr[products + 1] - starts
+        segments = np.cumsum(lengths) - lengths
+        return self.word_ids[np.arange(lengths.sum()) - np.repeat(segments - starts, lengths)], segments
+
+    def filter_products(self, products, matches):
+        """Return the products having one of the words of every match"""
+        import numpy as np
+
+        for words in matches:
+            if not len(products):
+                break
+            if len(words) <= SEARCHSORTED_WORDS:
+                # Few words: look the products up in their sorted posting lists
+                keep = np.zeros(len(products), dtype=bool)
+                for word in words:
+                    posting = self.postings[word]
+                    at = np.minimum(np.searchsorted(posting, products), len(posting) - 1)
+                    keep |= posting[at] == products
+                products = products[keep]
+                continue
+            ids, segments = self.product_words(products)
+            member = np.zeros(len(self.vocabulary), dtype=bool)
+            member[words] = True
+            products = products[np.logical_or.reduceat(member[ids], segments)]
+        return products
+
+    def first_matches(self, matches, limit):
+        """Return the first products in rank order having one of the words of every match, up to limit"""
+        import numpy as np
+
+        matches = sorted(matches, key=lambda words: self.posting_size(words))
+        if len(matches) == 1:
+            # Merge the posting lists lazily, in rank order, up to the limit
+            found = []
+            for product in heapq.merge(*(self.postings[word] for word in matches[0])):
+                if not found or found[-1] != product:
+                    found.append(product)
+                    if len(found) == limit:
+                        break
+            return found
+        # Candidates from the most selective token, filtered by the others in growing chunks
+        words = matches[0]
+        candidates = (self.postings[words[0]] if len(words) == 1
+                      else np.unique(np.concatenate([self.postings[word] for word in words])))
+        found, start, size = [], 0, FIRST_CHUNK
+        while start < len(candidates) and len(found) < limit:
+            found.extend(self.filter_products(candidates[start:start + size], matches[1:])[:limit - len(found)])
+            start, size = start + size, size * 8
+        return found
+
+    def posting_size(self, words):
+        if len(words) and words[-1] - words[0] == len(words) - 1:
+            return self.posting_offsets[words[-1] + 1] - self.posting_offsets[words[0]]
+        return sum(len(self.postings[word]) for word in words)
+
+    def search(self, text, limit=DEFAULT_LIMIT):
+        """Return [(code, name, score)] of the products with a word starting with every token, best first
+
+        A token that starts no word of the catalog stands for its closest
+        spellings. The score is the mean over the tokens of 1 for a prefix and
+        of the similarity of the spelling, and products are returned by score
+        then rank.
+        """
+        import numpy as np
+
+        tokens = fold(text).split()
+        if not tokens:
+            return []
+        prefixes, corrected = [], []
+        for token in tokens:
+            lo, hi = self.word_range(token)
+            if lo < hi:
+                prefixes.append(np.arange(lo, hi))
+                continue
+            words, similarity = self.corrections(token)
+            if not len(words):
+                return []
+            corrected.append(list(zip(words.tolist(), similarity.tolist())))
+
+        # Each choice of spellings is searched like exact words, best combined score first
+        choices = sorted((((sum(similarity for _, similarity in choice) + len(prefixes)) / len(tokens),
+                           [np.array([word]) for word, _ in choice])
+                          for choice in product(*corrected)), key=lambda choice: -choice[0])
+        found, seen = [], set()
+        for score, spellings in choices:
+            for match in self.first_matches(prefixes + spellings, limit + len(seen)):
+                if match not in seen:
+                    seen.add(match)
+                    found.append((self.codes[match], self.names[match], score))
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+def load_catalog(cursor, mode=None):
+    """Return (code, name, detail) of the active products"""
+    if mode is None:
+        mode = detect_schema_mode(cursor)
+    cursor.execute(f"SELECT {code_column(mode, 'Product')}, product_name, detail FROM Product WHERE is_active")
+    return cursor.fetchall()
+
+class CatalogCache:
+    """ProductIndex of the Product table, rebuilt when the table changes"""
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self.index = None
+        self.version = None
+        self.checked = 0.0
+
+    def get(self, cursor):
+        from query_cache import table_versions
+
+        now = time.monotonic()
+        if self.index is not None and now - self.checked < self.max_age:
+            return self.index
+        version = table_versions(cursor, ['Product'])
+        if self.index is None or version != self.version:
+            self.index = ProductIndex(load_catalog(cursor))
+            self.version = version
+        self.checked = now
+        return self.index
+
+    def search(self, cursor, text, limit=DEFAULT_LIMIT):
+        return self.get(cursor).search(text, limit)
+
+def print_matches(matches):
+    from tabulate import tabulate
+
+    print(tabulate([(code, name, f"{score:.2f}") for code, name, score in matches],
+                   headers=['product', 'name', 'score'], tablefmt="pretty") if matches else "No matching product.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find products by partial or misspelt names')
+    parser.add_argument('query', help='Partial product name, e.g. "pain choc" or "croiss"')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help=f'Matches shown (default: {DEFAULT_LIMIT})')
+    parser.add_argument('--engine', choices=['cache', 'database'], default='cache',
+                        help='Search the in-process index of the catalog or query PostgreSQL (default: cache)')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        conn = connect(params_from_args(args))
+        cursor = conn.cursor()
+        mode = detect_schema_mode(cursor)
+        if args.engine == 'database':
+            trigram = ensure_search_key(cursor)
+            start = time.perf_counter()
+            matches = search_products(cursor, args.query, args.limit, mode, trigram)
+        else:
+            start = time.perf_counter()
+            index = ProductIndex(load_catalog(cursor, mode))
+            print(f"Indexed {len(index)} products in {(time.perf_counter() - start) * 1000:.1f} ms")
+            start = time.perf_counter()
+            matches = index.search(args.query, args.limit)
+        elapsed = time.perf_counter() - start
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+    print_matches(matches)
+    print(f"Searched in {elapsed * 1e6:,.0f} µs ({args.engine})")
+    return 0
+
+# Base products of the synthetic catalog, spelt the way tills and the raw bakery file write them
+BASE_PRODUCTS = [
+    'Pain au chocolat', 'Croissant', 'Galette des rois frangipane', 'Pain aux raisins', 'Éclair au café',
+    'Crème brûlée', 'Baguette tradition', 'Chausson aux pommes', 'Café crème', 'Thé vert', 'Tarte citron meringuée',
+    'Mille-feuille', 'Brioche', 'Kouign-amann', 'Financier', 'Madeleine', 'Opéra', 'Paris-Brest', 'Flan pâtissier',
+    'Quiche lorraine', 'Sandwich jambon beurre', 'Cappuccino', 'Latte macchiato', 'Espresso', 'Cookie chocolat',
+    'Pain de campagne', 'Fougasse olives', 'Religieuse', 'Tartelette fraises', 'Cœur de bœuf',
+]
+MODIFIERS = ['pur beurre', 'bio', 'maison', 'mini', 'grand', 'x4', 'x6', 'sans gluten', 'vegan', 'édition été',
+             'noisette', 'amande', 'framboise', 'caramel', 'vanille', 'pistache', 'à emporter', 'surgelé']
+
+def synthetic_catalog(size, seed):
+    """Return [(code, name, detail)] of a synthetic catalog of distinct SKUs"""
+    rng = random.Random(seed)
+    catalog = []
+    for sku in range(size):
+        base = BASE_PRODUCTS[sku % len(BASE_PRODUCTS)]
+        modifiers = ' '.join(rng.sample(MODIFIERS, rng.randint(0, 2)))
+        name = f"{base} {modifiers} {sku // len(BASE_PRODUCTS)}".replace('  ', ' ')
+        catalog.append((f"SKU{sku:07d}", name, f"{base} {rng.choice(['250g', '500g', '1kg', 'pièce', 'lot'])}"))
+    return catalog
+
+BENCH_QUERIES = ['pain choc', 'croiss', 'gal frangipane', 'creme brulee', 'eclair cafe', 'kouign',
+                 'croisant', 'pain au chocolat pur beurre 12', 'mille feuille vanille', 'zzz']
+
+def latencies(search, queries, rounds):
+    """Return {query: [seconds]} of repeated searches"""
+    timings = {query: [] for query in queries}
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            timings[query].append(time.perf_counter() - start)
+    return timings
+
+def print_latencies(label, timings, results):
+    print(f"\n{label}")
+    print(f"{'query':<32} {'p50 µs':>9} {'p99 µs':>9} {'matches':>8}  best match")
+    for query, samples in timings.items():
+        samples = sorted(samples)
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        best = results[query][0][1] if results[query] else '-'
+        print(f"{query:<32} {statistics.median(samples) * 1e6:>9,.1f} {p99 * 1e6:>9,.1f} "
+              f"{len(results[query]):>8}  {best}")
+
+def bench(argv=None):
+    """Measure lookup latency of the in-process index, and of PostgreSQL, on a synthetic catalog"""
+    parser = argparse.ArgumentParser(prog='ontodb bench search', description='Product search latency on a synthetic catalog')
+    parser.add_argument('--skus', type=int, default=300000, help='Products in the synthetic catalog (default: 300000)')
+    parser.add_argument('--rounds', type=int, default=200, help='Times each query is run (default: 200)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic catalog (default: 42)')
+    parser.add_argument('--database', action='store_true',
+                        help='Also time the SQL search over the catalog loaded into a temporary Product table')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    catalog = synthetic_catalog(args.skus, args.seed)
+    start = time.perf_counter()
+    index = ProductIndex(catalog)
+    print(f"Indexed {len(index):,} synthetic products in {time.perf_counter() - start:.2f}s")
+    results = {query: index.search(query) for query in BENCH_QUERIES}
+    print_latencies("In-process index", latencies(index.search, BENCH_QUERIES, args.rounds), results)
+
+    if not args.database:
+        return 0
+    from db import copy_rows
+
+    conn = connect(params_from_args(args), autocommit=False)
+    cursor = conn.cursor()
+    try:
+        mode = detect_schema_mode(cursor)
+        trigram = ensure_search_key(cursor)
+        # Shadows Product for this transaction, with the generated key and the trigram index
+        cursor.execute("CREATE TEMP TABLE Product (LIKE Product INCLUDING ALL) ON COMMIT DROP")
+        cursor.execute("SELECT type_id, currency_id FROM ProductType, Currency LIMIT 1")
+        type_id, currency_id = cursor.fetchone()
+        copy_rows(cursor, 'Product',
+                  [code_column(mode, 'Product'), 'product_name', 'type_id', 'detail', 'base_price', 'currency_id',
+                   'data_source'],
+                  [(code, name, type_id, detail, 1, currency_id, 'bakery') for code, name, detail in catalog])
+        cursor.execute("ANALYZE Product")
+        database_results = {query: search_products(cursor, query, mode=mode, trigram=trigram) for query in BENCH_QUERIES}
+        timings = latencies(lambda query: search_products(cursor, query, mode=mode, trigram=trigram),
+                            BENCH_QUERIES, max(1, args.rounds // 20))
+        print_latencies(f"PostgreSQL ({'pg_trgm GIN index' if trigram else 'no pg_trgm, sequential scan'})",
+                        timings, database_results)
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Result cache for read-only report queries.
+
+Results are keyed by the sha256 of the whitespace-normalized SQL, its
+parameters and the database, and stored either in an in-memory LRU or as
+compressed files. Each entry records the version of the tables the query
+reads: their insert/update/delete counters from pg_stat_user_tables plus their
+relfilenode, which changes on TRUNCATE, CLUSTER and VACUUM FULL. A cached
+result is served only while every table still has the same version. WAL
+replay does not maintain the counters, so on a streaming replica the replay
+position is part of the version as well: anything replayed invalidates the
+replica's cached results.
+
+The statistics are flushed by other sessions after their transactions commit
+(up to about a second late), so the counters alone could serve a result that
+misses a just-committed load. The loaders (populate, ingest, archive) therefore
+also bump data_version in DatasetInfo in the transaction that writes the rows,
+and that marker is part of every version. Writes made outside those commands,
+such as the POS simulator or ad-hoc SQL, are only seen through the counters.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import zlib
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join('data', 'cache', 'queries')
+
+def normalize_sql(sql):
+    """Collapse whitespace and drop the trailing semicolon, so formatting does not change the key"""
+    return re.sub(r'\s+', ' ', sql).strip().rstrip(';').strip()
+
+def cache_key(sql, params=None, database=None):
+    """Return the hex sha256 identifying a query result"""
+    payload = json.dumps([normalize_sql(sql), params, database], default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def data_version(cursor):
+    """Return the data_version recorded in DatasetInfo by the loaders, or None"""
+    cursor.execute("SELECT to_regclass('datasetinfo') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return None
+    cursor.execute("SELECT value FROM DatasetInfo WHERE key = 'data_version'")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def table_versions(cursor, tables):
+    """Return {table: (inserts, updates, deletes, relfilenode, replay position on a standby, data_version)}"""
+    # Statistics are snapshotted per transaction; make sure we see the latest counters
+    cursor.execute("SELECT pg_stat_clear_snapshot()")
+    cursor.execute("""
+        SELECT s.relname, s.n_tup_ins, s.n_tup_upd, s.n_tup_del, pg_relation_filenode(s.relid),
+               CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()::text END
+        FROM pg_stat_user_tables s
+        WHERE s.relname = ANY(%s)
+    """, ([t.lower() for t in tables],))
+    rows = cursor.fetchall()
+    marker = data_version(cursor)
+    return {name: list(version) + [marker] for name, *version in rows}
+
+class MemoryCache:
+    """In-process LRU store"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class FileCache:
+    """One zlib-compressed pickle per entry in a directory, pruned to the most recently used entries"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pkl.z')
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                entry = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(self.path(key))
+        return entry
+
+    def put(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path(key) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, self.path(key))
+        self.prune()
+
+    def prune(self):
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.pkl.z')]
+        if len(files) > self.max_entries:
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self.max_entries]:
+                os.remove(path)
+
+def cached_query(cursor, sql, tables, store, params=None):
+    """Run a read-only query through the cache.
+
+    Returns (column names, rows, hit). With store=None the query always runs.
+    """
+    if store is None:
+        cursor.execute(sql, params)
+        return [d[0] for d in cursor.description], cursor.fetchall(), False
+
+    key = cache_key(sql, params, cursor.connection.dsn)
+    versions = table_versions(cursor, tables)
+    entry = store.get(key)
+    if entry is not None and entry['versions'] == versions:
+        return entry['columns'], entry['rows'], True
+
+    cursor.execute(sql, params)
+    columns, rows = [d[0] for d in cursor.description], cursor.fetchall()
+    store.put(key, {'versions': versions, 'columns': columns, 'rows': rows})
+    return columns, rows, False
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Typed parser for the raw bakery sales CSV (data/raw/Bakery_sales.csv).
+
+The raw file stores prices as French-formatted text ("1,20 €"), quantities and
+ticket numbers as floats ("1.0", "150040.0") and dates and times as text.
+Each column is parsed with one precompiled regular expression in a single
+pass, which both validates the value and extracts its parts:
+
+- unit_price becomes exact integer cents (no float round trip),
+- date is validated as a calendar date and kept as YYYY-MM-DD,
+- time is validated and normalized to HH:MM:SS,
+- ticket_number and Quantity become integers.
+
+Rows with any malformed value are written to a reject file together with
+their line number and the offending columns, instead of aborting the run.
+"""
+import argparse
+import csv
+import os
+import random
+import re
+import sys
+import time
+from datetime import date
+
+RAW_COLUMNS = ['date', 'time', 'ticket_number', 'article', 'Quantity', 'unit_price']
+TYPED_COLUMNS = ['date', 'time', 'ticket_number', 'article', 'quantity', 'unit_price_cents']
+
+DEFAULT_INPUT = os.path.join('data', 'raw', 'Bakery_sales.csv')
+DEFAULT_OUTPUT = os.path.join('data', 'cleaned', 'Bakery_sales_typed.csv')
+
+# Rows parsed per chunk; columns are parsed a chunk at a time
+CHUNK_ROWS = 100000
+
+# "1,20 €", "0.9", "12 €", '"1,20 €"', "-0,50 €" (returns)
+PRICE_RE = re.compile(r'\s*"?\s*(-?)(\d{1,7})(?:[.,](\d{1,2}))?\s*(?:€|EUR)?\s*"?\s*', re.IGNORECASE)
+DATE_RE = re.compile(r'\s*(\d{4})-(\d{2})-(\d{2})\s*')
+TIME_RE = re.compile(r'\s*(\d{1,2}):(\d{2})(?::(\d{2}))?\s*')
+# "150040", "150040.0", "-1.0"
+INTEGER_RE = re.compile(r'\s*(-?\d{1,12})(?:\.0*)?\s*')
+
+def parse_price(value):
+    """Return the price in integer cents, or None"""
+    match = PRICE_RE.fullmatch(value)
+    if match is None:
+        return None
+    sign, units, fraction = match.groups()
+    cents = int(units) * 100 + (int(fraction.ljust(2, '0')) if fraction else 0)
+    return -cents if sign else cents
+
+def parse_date(value):
+    """Return the date as YYYY-MM-DD, or None for malformed or impossible dates"""
+    match = DATE_RE.fullmatch(value)
+    if match is None:
+        return None
+    try:
+        return date(*map(int, match.groups())).isoformat()
+    except ValueError:
+        return None
+
+def parse_time(value):
+    """Return the time as HH:MM:SS, or None"""
+    match = TIME_RE.fullmatch(value)
+    if match is None:
+        return None
+    hour, minute, second = int(match[1]), int(match[2]), int(match[3] or 0)
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}:{second:02d}"
+
+def parse_integer(value):
+    match = INTEGER_RE.fullmatch(value)
+    return int(match[1]) if match else None
+
+def parse_article(value):
+    value = value.strip()
+    return value or None
+
+# Raw column -> parser returning the typed value or None when malformed
+PARSERS = {
+    'date': parse_date,
+    'time': parse_time,
+    'ticket_number': parse_integer,
+    'article': parse_article,
+    'Quantity': parse_integer,
+    'unit_price': parse_price,
+}
+
+def parse_columns(columns):
+    """Parse {raw column: [text, ...]} column by column, returning {raw column: [value or None, ...]}
+
+    Raw columns repeat a small set of values (a few hundred dates, prices and
+    articles), so each distinct value is parsed once and the rest are lookups.
+    """
+    parsed = {}
+    for name, values in columns.items():
+        parser = PARSERS[name]
+        distinct = {value: parser(value) for value in set(values)}
+        parsed[name] = list(map(distinct.__getitem__, values))
+    return parsed
+
+def parse_file(input_path, output_path, reject_path, chunk_rows=CHUNK_ROWS):
+    """Parse a raw bakery CSV into a typed CSV, returning (accepted, rejected) row counts"""
+    accepted = rejected = 0
+    with open(input_path, newline='', encoding='utf-8') as src, \
+            open(output_path, 'w', newline='', encoding='utf-8') as out, \
+            open(reject_path, 'w', newline='', encoding='utf-8') as rej:
+        reader = csv.reader(src)
+        header = next(reader)
+        missing = [c for c in RAW_COLUMNS if c not in header]
+        if missing:
+            raise ValueError(f"{input_path} lacks the columns {', '.join(missing)}")
+        positions = [header.index(c) for c in RAW_COLUMNS]
+        writer = csv.writer(out)
+        writer.writerow(TYPED_COLUMNS)
+        rejects = csv.writer(rej)
+        rejects.writerow(['line', 'bad_columns'] + header)
+
+        line = 1  # header
+        while True:
+            rows = [row for _, row in zip(range(chunk_rows), reader)]
+            if not rows:
+                break
+            # Values missing from short rows parse as empty, and are rejected as such
+            parsed = parse_columns({name: [row[p] if p < len(row) else '' for row in rows]
+                                    for name, p in zip(RAW_COLUMNS, positions)})
+            for i, values in enumerate(zip(*(parsed[name] for name in RAW_COLUMNS))):
+                if None in values:
+                    bad = [name for name, value in zip(RAW_COLUMNS, values) if value is None]
+                    rejects.writerow([line + i + 1, ' '.join(bad)] + rows[i])
+                    rejected += 1
+                else:
+                    writer.writerow(values)
+                    accepted += 1
+            line += len(rows)
+    return accepted, rejected
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse the raw bakery sales CSV into typed values, rejecting malformed rows')
+    parser.add_argument('--input', default=DEFAULT_INPUT, help=f'Raw CSV (default: {DEFAULT_INPUT})')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'Typed CSV (default: {DEFAULT_OUTPUT})')
+    parser.add_argument('--rejects', default=None,
+                        help='CSV of rejected rows with line numbers and reasons (default: <output>.rejects.csv)')
+    args = parser.parse_args(argv)
+
+    reject_path = args.rejects or os.path.splitext(args.output)[0] + '.rejects.csv'
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    start = time.perf_counter()
+    try:
+        accepted, rejected = parse_file(args.input, args.output, reject_path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}")
+        return 1
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {accepted + rejected} rows in {elapsed:.2f}s "
+          f"({(accepted + rejected) / elapsed:,.0f} rows/s): {accepted} accepted, {rejected} rejected")
+    if rejected:
+        print(f"Rejected rows written to {reject_path}")
+    return 0
+
+def synthetic_columns(rows, bad_rate, seed):
+    """Return raw columns shaped like the bakery file, with a fraction of malformed values"""
+    rng = random.Random(seed)
+    articles = ['BAGUETTE', 'PAIN AU CHOCOLAT', 'CROISSANT', 'TRADITIONAL BAGUETTE', 'COUPE']
+    bad = {'date': '2021-02-30', 'time': '25:10', 'ticket_number': 'n/a',
+           'article': ' ', 'Quantity': '1.5', 'unit_price': '1,2,0 €'}
+    columns = {
+        'date': [f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(rows)],
+        'time': [f"{rng.randint(7, 19):02d}:{rng.randint(0, 59):02d}" for _ in range(rows)],
+        'ticket_number': [f"{rng.randint(150040, 288913)}.0" for _ in range(rows)],
+        'article': [rng.choice(articles) for _ in range(rows)],
+        'Quantity': [f"{rng.choice([1, 1, 1, 2, 3, -1])}.0" for _ in range(rows)],
+        'unit_price': [f"{rng.randint(0, 9)},{rng.randint(0, 99):02d} €" for _ in range(rows)],
+    }
+    for name, values in columns.items():
+        for i in rng.sample(range(rows), int(rows * bad_rate)):
+            values[i] = bad[name]
+    return columns
+
+def pandas_price_chain(values):
+    """The notebook's price cleaning, for comparison; malformed values raise"""
+    import pandas as pd
+
+    return (pd.Series(values).str.replace("€", "", regex=False).str.replace(",", ".", regex=False)
+            .str.replace(" ", "", regex=False).str.replace('"', "", regex=False).str.strip().astype(float))
+
+def bench(argv=None):
+    """Measure per-column parse throughput on a synthetic multi-million-row input"""
+    parser = argparse.ArgumentParser(prog='ontodb bench parse', description='Per-column throughput of the raw bakery parser')
+    parser.add_argument('--rows', type=int, default=2000000, help='Synthetic rows (default: 2000000)')
+    parser.add_argument('--bad-rate', type=float, default=0.001, help='Fraction of malformed values per column (default: 0.001)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic input (default: 42)')
+    args = parser.parse_args(argv)
+
+    print(f"Generating {args.rows:,} synthetic rows...")
+    columns = synthetic_columns(args.rows, args.bad_rate, args.seed)
+    print(f"{'column':<14} {'seconds':>8} {'rows/s':>14} {'rejected':>9}")
+    for name, values in columns.items():
+        start = time.perf_counter()
+        parsed = parse_columns({name: values})[name]
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14} {elapsed:>8.2f} {args.rows / elapsed:>14,.0f} {parsed.count(None):>9}")
+
+    # The notebook's chain cannot skip bad values, so it is compared on well-formed prices only
+    prices = [v for v in columns['unit_price'] if parse_price(v) is not None]
+    try:
+        start = time.perf_counter()
+        pandas_price_chain(prices)
+    except ImportError:
+        print("pandas is not installed; skipping the notebook comparison")
+        return 0
+    elapsed = time.perf_counter() - start
+    print(f"{'pandas chain':<14} {elapsed:>8.2f} {len(prices) / elapsed:>14,.0f} {'-':>9}  (notebook unit_price cleaning, floats)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Registry of the analytical report queries.
+
+Each report declares the tables it reads, so cached results can be
+invalidated when one of them changes (see query_cache.py). Reports are fully
+ordered, so the offline engine returns the same rows in the same order (see
+offline.py). SAMPLED_REPORTS are the fact-table reports that can be estimated
+from a TABLESAMPLE (see approximate.py).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from schema_mode import code_column
+
+def stores_query(mode):
+    return f"""
+        SELECT s.{code_column(mode, 'Store')}, s.store_name, c.category_name, r.region_name, s.data_source
+        FROM Store s
+        JOIN StoreCategory c ON s.store_category_id = c.category_id
+        JOIN StoreRegion r ON s.region_id = r.region_id
+        ORDER BY 1
+        LIMIT 10;
+    """
+
+def products_query(mode):
+    return f"""
+        SELECT p.{code_column(mode, 'Product')}, p.product_name, pt.type_name, pc.category_name,
+               p.base_price, c.currency_code, p.data_source
+        FROM Product p
+        JOIN ProductType pt ON p.type_id = pt.type_id
+        JOIN ProductCategory pc ON pt.category_id = pc.category_id
+        JOIN Currency c ON p.currency_id = c.currency_id
+        ORDER BY 1
+        LIMIT 10;
+    """
+
+def sales_by_source_query(mode):
+    return """
+        SELECT data_source, COUNT(*) AS transaction_count,
+               SUM(total_amount) AS total_sales
+        FROM Transaction
+        GROUP BY data_source
+        ORDER BY data_source;
+    """
+
+# Report name -> (title, query builder taking the schema mode, tables read)
+REPORTS = {
+    'stores': ("Stores with Categories and Regions", stores_query,
+               ['Store', 'StoreCategory', 'StoreRegion']),
+    'products': ("Products with Categories and Types", products_query,
+                 ['Product', 'ProductType', 'ProductCategory', 'Currency']),
+    'sales_by_source': ("Transaction Summary by Data Source", sales_by_source_query,
+                        ['Transaction']),
+}
+
+def sales_by_source_sample(mode):
+    return ("Transaction t {sample}", 't', 't.data_source', 't.total_amount',
+            ['transaction_count', 'total_sales', 'avg_ticket'])
+
+def sales_by_store_sample(mode):
+    return (f"""TransactionItem i {{sample}}
+                JOIN Transaction t ON t.transaction_id = i.transaction_id
+                JOIN Store s ON s.store_id = t.store_id""",
+            'i', f"s.{code_column(mode, 'Store')}", 'i.item_total',
+            ['sale_lines', 'revenue', 'avg_line_total'])
+
+# Report name -> (title, builder taking the schema mode and returning
+# (FROM clause with a {sample} placeholder after the sampled table, its alias,
+#  group expression, summed value, [count, sum, average labels]))
+SAMPLED_REPORTS = {
+    'sales_by_source': ("Transaction Summary by Data Source", sales_by_source_sample),
+    'sales_by_store': ("Sales Lines by Store", sales_by_store_sample),
+}
@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 import psycopg2
 from tabulate import tabulate
+import argparse
 import os
 import sys
 import time
 
+from approximate import SAMPLING_METHODS, distinct_counts, refresh_sketches, run_sampled_report
+from db import add_db_arguments, connect, params_from_args
+from offline import DEFAULT_OFFLINE_DIR, offline_reports
+from query_cache import DEFAULT_CACHE_DIR, FileCache, MemoryCache, cached_query
+from reports import REPORTS, SAMPLED_REPORTS
+from schema_mode import detect_schema_mode
+
 def wait_for_db(host, dbname, user, password, port=5432, max_attempts=5):
     """Wait for database to be available, with improved error handling"""
     print(f"Trying to connect to PostgreSQL at {host}:{port}...")
@@ -34,19 +42,80 @@ def wait_for_db(host, dbname, user, password, port=5432, max_attempts=5):
     print("3. If running locally, ensure PostgreSQL is installed and running")
     return False
 
+def print_result(title, columns, rows):
+    print(f"\n{title}")
+    if rows:
+        print(tabulate(rows, headers=columns, tablefmt="pretty"))
+        print(f"Total rows: {len(rows)}")
+    else:
+        print("No results found.")
+
 def run_query(cursor, query, title):
     """Run a query and print results in a formatted table"""
     try:
         cursor.execute(query)
         rows = cursor.fetchall()
-        if rows:
-            column_names = [desc[0] for desc in cursor.description]
+        print_result(title, [desc[0] for desc in cursor.description], rows)
+    except Exception as e:
+        print(f"\n{title}")
+        print(f"Error executing query: {str(e)}")
+
+def cache_store(args):
+    """Return the result cache selected on the command line, or None"""
+    if args.cache == 'file':
+        return FileCache(args.cache_dir)
+    if args.cache == 'memory':
+        return MemoryCache()
+    return None
+
+def run_reports(cursor, store, skip=()):
+    """Run the analytical reports through the result cache"""
+    # Business codes are the keys in natural mode and separate columns in surrogate mode
+    mode = detect_schema_mode(cursor)
+    for name, (title, build_query, tables) in REPORTS.items():
+        if name in skip:
+            continue
+        try:
+            start = time.perf_counter()
+            columns, rows, hit = cached_query(cursor, build_query(mode), tables, store)
+            elapsed = time.perf_counter() - start
+            print_result(title, columns, rows)
+            if store is not None:
+                print(f"{'Cache hit' if hit else 'Cache miss'} in {elapsed * 1000:.1f} ms")
+        except Exception as e:
             print(f"\n{title}")
-            print(tabulate(rows, headers=column_names, tablefmt="pretty"))
-            print(f"Total rows: {len(rows)}")
-        else:
+            print(f"Error executing query: {str(e)}")
+
+def run_approximate_reports(conn, args, params):
+    """Estimate the fact-table reports from a sample and distinct counts from the daily sketches"""
+    cursor = conn.cursor()
+    mode = detect_schema_mode(cursor)
+    print(f"Values marked ~ are ESTIMATES from a {args.sample_percent:g}% {args.sampling.upper()} sample "
+          f"(95% confidence intervals) or from HyperLogLog sketches")
+    for title, build in SAMPLED_REPORTS.values():
+        try:
+            start = time.perf_counter()
+            columns, rows = run_sampled_report(cursor, build, mode, args.sampling, args.sample_percent, args.sample_seed)
+            print_result(f"{title} [ESTIMATE]", columns, rows)
+            print(f"Estimated in {(time.perf_counter() - start) * 1000:.1f} ms")
+        except Exception as e:
+            conn.rollback()
             print(f"\n{title}")
-            print("No results found.")
+            print(f"Error executing query: {str(e)}")
+
+    cursor.close()
+
+    # Sketches are maintained, so they are read from the primary
+    title = "Distinct Tickets and Products by Store [ESTIMATE]"
+    try:
+        start = time.perf_counter()
+        primary = connect(params)
+        cursor = primary.cursor()
+        sketched = refresh_sketches(cursor, mode, full=args.refresh_sketches)
+        columns, rows = distinct_counts(cursor)
+        primary.close()
+        print_result(title, columns, rows)
+        print(f"Sketched {sketched} store-days, estimated in {(time.perf_counter() - start) * 1000:.1f} ms")
     except Exception as e:
         print(f"\n{title}")
         print(f"Error executing query: {str(e)}")
@@ -72,12 +141,44 @@ def show_table_data(cursor, table_name):
     except Exception as e:
         print(f"\nError querying table {table_name}: {str(e)}")
 
-def main():
-    host = os.environ.get('DB_HOST', 'localhost')
-    port = int(os.environ.get('DB_PORT', '5432'))
-    dbname = os.environ.get('DB_NAME', 'OntoDb')
-    user = os.environ.get('DB_USER', 'ontodb')
-    password = os.environ.get('DB_PASSWORD', 'admin')
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify database contents and run analytical queries')
+    parser.add_argument('--reports-only', action='store_true',
+                        help='Skip the table overview and contents and only run the analytical queries')
+    parser.add_argument('--cache', choices=['file', 'memory', 'off'], default='file',
+                        help='Result cache for the analytical queries (default: file)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Directory of the file cache (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Estimate the fact-table reports from a table sample and distinct counts from sketches')
+    parser.add_argument('--sample-percent', type=float, default=1.0,
+                        help='Percentage of the fact table sampled with --approximate (default: 1)')
+    parser.add_argument('--sampling', choices=SAMPLING_METHODS, default='system',
+                        help='TABLESAMPLE method: system reads whole pages, bernoulli single rows (default: system)')
+    parser.add_argument('--sample-seed', type=int, default=None,
+                        help='Make the sample repeatable with this seed (default: a new sample each run)')
+    parser.add_argument('--refresh-sketches', action='store_true',
+                        help='Rebuild the distinct-count sketches of every day, e.g. after history was replaced')
+    parser.add_argument('--offline', nargs='?', const=DEFAULT_OFFLINE_DIR, default=None, metavar='DIR',
+                        help=f'Run the analytical queries in DuckDB over the snapshot of `ontodb offline refresh`, '
+                             f'without connecting to the database (default DIR: {DEFAULT_OFFLINE_DIR})')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+    if not 0 < args.sample_percent <= 100:
+        parser.error('--sample-percent must be in (0, 100]')
+
+    if args.offline:
+        print("\n\n====== Analytical Queries (offline snapshot) ======\n")
+        try:
+            for title, columns, rows in offline_reports(args.offline):
+                print_result(f"{title} [offline]", columns, rows)
+        except Exception as e:
+            print(f"Error: {e}")
+        return
+    
+    params = params_from_args(args)
+    host, port, dbname = params['host'], params['port'], params['dbname']
+    user, password = params['user'], params['password']
     
     # First try with provided/default settings
     if not wait_for_db(host=host, port=port, dbname=dbname, user=user, password=password):
@@ -92,80 +193,54 @@ def main():
                 host = 'postgres'
     
     try:
-        conn = psycopg2.connect(
-            host=host,
-            port=port,
-            database=dbname,
-            user=user,
-            password=password
-        )
+        # Reports only read, so they run on the replica when one is configured
+        params = dict(params, host=host)
+        conn = connect(params, autocommit=False, role='read')
         cursor = conn.cursor()
         
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("====== OntoDb Database Content Verification ======\n")
+        if not args.reports_only:
+            os.system('cls' if os.name == 'nt' else 'clear')
+            print("====== OntoDb Database Content Verification ======\n")
         
-        # Define all tables to query based on init.sql
-        tables = [
-            'StoreCategory',
-            'StoreRegion',
-            'Store',
-            'ProductCategory',
-            'ProductType',
-            'Currency',
-            'Product',
-            'StaffRole',
-            'Staff',
-            'PaymentMethod',
-            'Transaction',
-            'TransactionItem',
-            'Shift'  # Added Shift table that was missing
-        ]
+            # Define all tables to query based on init.sql
+            tables = [
+                'StoreCategory',
+                'StoreRegion',
+                'Store',
+                'ProductCategory',
+                'ProductType',
+                'Currency',
+                'Product',
+                'StaffRole',
+                'Staff',
+                'PaymentMethod',
+                'Transaction',
+                'TransactionItem',
+                'Shift'  # Added Shift table that was missing
+            ]
         
-        # Show table counts first for a quick overview
-        print("Database Tables Overview:")
-        for table in tables:
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
-                print(f"- {table}: {count} rows")
-            except Exception as e:
-                print(f"- {table}: Error - {str(e)}")
+            # Show table counts first for a quick overview
+            print("Database Tables Overview:")
+            for table in tables:
+                try:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    count = cursor.fetchone()[0]
+                    print(f"- {table}: {count} rows")
+                except Exception as e:
+                    print(f"- {table}: Error - {str(e)}")
         
-        print("\n====== Detailed Table Contents ======")
-        # Show data from each table
-        for table in tables:
-            show_table_data(cursor, table)
+            print("\n====== Detailed Table Contents ======")
+            # Show data from each table
+            for table in tables:
+                show_table_data(cursor, table)
         
         # Also run the original analytical queries
         print("\n\n====== Analytical Queries ======\n")
-        
-        # Store related queries
-        run_query(cursor, """
-            SELECT s.store_id, s.store_name, c.category_name, r.region_name, s.data_source 
-            FROM Store s
-            JOIN StoreCategory c ON s.store_category_id = c.category_id
-            JOIN StoreRegion r ON s.region_id = r.region_id
-            LIMIT 10;
-        """, "Stores with Categories and Regions")
-        
-        # Product related queries
-        run_query(cursor, """
-            SELECT p.product_id, p.product_name, pt.type_name, pc.category_name, 
-                   p.base_price, c.currency_code, p.data_source
-            FROM Product p
-            JOIN ProductType pt ON p.type_id = pt.type_id
-            JOIN ProductCategory pc ON pt.category_id = pc.category_id
-            JOIN Currency c ON p.currency_id = c.currency_id
-            LIMIT 10;
-        """, "Products with Categories and Types")
-        
-        # Transaction summary
-        run_query(cursor, """
-            SELECT data_source, COUNT(*) AS transaction_count, 
-                   SUM(total_amount) AS total_sales
-            FROM Transaction
-            GROUP BY data_source;
-        """, "Transaction Summary by Data Source")
+        if args.approximate:
+            run_reports(cursor, cache_store(args), skip=SAMPLED_REPORTS)
+            run_approximate_reports(conn, args, params)
+        else:
+            run_reports(cursor, cache_store(args))
 
         cursor.close()
         conn.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Key schema modes of the OntoDb database.
+
+natural   - init.sql as is: Store, Product and Transaction are keyed by their
+            VARCHAR business codes ('BAK001', 'B001', 'BTX-BAK001-...').
+surrogate - config/surrogate_keys.sql applied: store_id, product_id and
+            transaction_id are INT/BIGINT keys, the business codes live in
+            store_code, product_code and transaction_code.
+
+Generators always work with business codes. The loaders stage rows with codes
+and map them to keys with the SQL built here, so they work in both modes, and
+queries join on store_id/product_id/transaction_id in both.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import add_db_arguments, connect, params_from_args
+
+NATURAL = 'natural'
+SURROGATE = 'surrogate'
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SURROGATE_SQL = os.path.join(ROOT_DIR, 'config', 'surrogate_keys.sql')
+
+# Business code column of each coded table in surrogate mode
+CODE_COLUMNS = {'Store': 'store_code', 'Product': 'product_code', 'Transaction': 'transaction_code'}
+KEY_COLUMNS = {'Store': 'store_id', 'Product': 'product_id', 'Transaction': 'transaction_id'}
+
+# Staging tables hold business codes whatever the mode (item_id is accepted and ignored)
+STAGING_TRANSACTION_DDL = """
+    transaction_id VARCHAR(50), store_id VARCHAR(50), transaction_date DATE, transaction_time TIME,
+    payment_method_id INT, staff_id INT, total_amount DECIMAL(10,2), currency_id INT, data_source VARCHAR(50)
+"""
+STAGING_TRANSACTION_ITEM_DDL = """
+    item_id BIGINT, transaction_id VARCHAR(50), product_id VARCHAR(50), quantity INT, unit_price DECIMAL(10,2),
+    discount_percent DECIMAL(5,2), item_total DECIMAL(10,2), sale_id VARCHAR(50)
+"""
+
+def detect_schema_mode(cursor):
+    """Return NATURAL or SURROGATE depending on how the Store table is keyed"""
+    cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'store' AND column_name = 'store_code')
+    """)
+    return SURROGATE if cursor.fetchone()[0] else NATURAL
+
+def code_column(mode, table):
+    """Column holding the business code of a Store, Product or Transaction row"""
+    return CODE_COLUMNS[table] if mode == SURROGATE else KEY_COLUMNS[table]
+
+def key_for_code(mode, table, code_sql):
+    """SQL expression giving the key of the row with business code code_sql (e.g. '%s')"""
+    if mode == NATURAL:
+        return code_sql
+    return f"(SELECT {KEY_COLUMNS[table]} FROM {table} WHERE {CODE_COLUMNS[table]} = {code_sql})"
+
+def select_stores_sql(mode):
+    """Query returning the Store tuples used by the generators, with the business code first"""
+    return (f"SELECT {code_column(mode, 'Store')}, store_name, store_category_id, region_id, address, phone, "
+            f"opening_date, data_source FROM Store ORDER BY {code_column(mode, 'Store')}")
+
+def select_products_sql(mode):
+    """Query returning the Product tuples used by the generators, with the business code first"""
+    return f"""
+        SELECT {code_column(mode, 'Product')}, product_name, type_id, detail, base_price,
+               currency_id, is_seasonal, is_active, data_source
+        FROM Product
+        ORDER BY {code_column(mode, 'Product')}
+    """
+
+def create_fact_staging(cursor, transaction_table, item_table, kind='TEMP', on_commit=''):
+    """Create staging tables for coded Transaction/TransactionItem rows.
+
+    kind is 'TEMP' or 'UNLOGGED'; on_commit is e.g. 'ON COMMIT DROP' for temp tables.
+    """
+    cursor.execute(f"CREATE {kind} TABLE {transaction_table} ({STAGING_TRANSACTION_DDL}) {on_commit}")
+    cursor.execute(f"CREATE {kind} TABLE {item_table} ({STAGING_TRANSACTION_ITEM_DDL}) {on_commit}")
+
+def insert_staged_transactions_sql(mode, staging, transaction_columns, returning=''):
+    """INSERT moving staged transactions into Transaction, skipping already loaded codes"""
+    rest = [c for c in transaction_columns if c not in ('transaction_id', 'store_id')]
+    code = code_column(mode, 'Transaction')
+    if mode == NATURAL:
+        store_join, store_key = '', 's.store_id'
+    else:
+        store_join, store_key = 'JOIN Store st ON st.store_code = s.store_id', 'st.store_id'
+    return f"""
+        INSERT INTO Transaction ({code}, store_id, {', '.join(rest)})
+        SELECT DISTINCT ON (s.transaction_id) s.transaction_id, {store_key}, {', '.join('s.' + c for c in rest)}
+        FROM {staging} s
+        {store_join}
+        WHERE s.transaction_id IS NOT NULL
+        ORDER BY s.transaction_id
+        ON CONFLICT ({code}) DO NOTHING
+        {returning}
+    """
+
+def insert_staged_items_sql(mode, staging, item_columns, returning=''):
+    """INSERT moving staged items of loaded transactions into TransactionItem, skipping loaded sale_ids"""
+    rest = [c for c in item_columns if c not in ('transaction_id', 'product_id')]
+    if mode == NATURAL:
+        product_join, product_key = '', 's.product_id'
+    else:
+        product_join, product_key = 'JOIN Product p ON p.product_code = s.product_id', 'p.product_id'
+    return f"""
+        INSERT INTO TransactionItem (transaction_id, product_id, {', '.join(rest)})
+        SELECT DISTINCT ON (s.sale_id) t.transaction_id, {product_key}, {', '.join('s.' + c for c in rest)}
+        FROM {staging} s
+        JOIN Transaction t ON t.{code_column(mode, 'Transaction')} = s.transaction_id
+        {product_join}
+        WHERE s.sale_id IS NOT NULL
+        ORDER BY s.sale_id
+        ON CONFLICT (sale_id) DO NOTHING
+        {returning}
+    """
+
+def relation_sizes(cursor):
+    """Return [(relation, table bytes, index bytes)] for the tables with surrogate-mode keys"""
+    cursor.execute("""
+        SELECT c.relname, pg_table_size(c.oid), pg_indexes_size(c.oid)
+        FROM pg_class c
+        WHERE c.relname IN ('store', 'product', 'transaction', 'transactionitem', 'staff', 'shift', 'dailysalessummary')
+        ORDER BY pg_total_relation_size(c.oid) DESC
+    """)
+    return cursor.fetchall()
+
+def print_sizes(sizes):
+    print(f"{'table':<20} {'table MB':>10} {'indexes MB':>11}")
+    for name, table_bytes, index_bytes in sizes:
+        print(f"{name:<20} {table_bytes / 2**20:>10.2f} {index_bytes / 2**20:>11.2f}")
+
+def convert_to_surrogate(conn):
+    """Apply surrogate_keys.sql in one transaction, then compact and re-analyze the rewritten tables"""
+    with open(SURROGATE_SQL, encoding='utf-8') as f:
+        script = f.read()
+    cursor = conn.cursor()
+    conn.autocommit = False
+    try:
+        cursor.execute(script)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+    # The key rewrites leave a dead copy of every row behind
+    cursor.execute("VACUUM FULL ANALYZE Store, Product, Staff, Shift, Transaction, TransactionItem, "
+                   "DailySalesSummary, ProductSupplier")
+    cursor.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show or switch the key schema mode of the database')
+    parser.add_argument('action', choices=['show', 'surrogate'],
+                        help="'show' the current mode and table sizes, or convert to 'surrogate' integer keys")
+    parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation before converting')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    params = params_from_args(args)
+    try:
+        conn = connect(params)
+        cursor = conn.cursor()
+        mode = detect_schema_mode(cursor)
+        print(f"Schema mode of '{params['dbname']}': {mode}")
+        sizes = relation_sizes(cursor)
+        print_sizes(sizes)
+        if args.action == 'show':
+            return 0
+
+        if mode == SURROGATE:
+            print("Already using surrogate keys.")
+            return 0
+        if not args.yes:
+            response = input("This rewrites the Store, Product and fact tables. Continue? (y/N): ")
+            if response.lower() != 'y':
+                print("Operation cancelled.")
+                return 1
+        start = time.perf_counter()
+        convert_to_surrogate(conn)
+        print(f"\nConverted to surrogate keys in {time.perf_counter() - start:.1f}s")
+        after = relation_sizes(cursor)
+        print_sizes(after)
+        before_total = sum(t + i for _, t, i in sizes)
+        after_total = sum(t + i for _, t, i in after)
+        print(f"Total size {before_total / 2**20:.2f} MB -> {after_total / 2**20:.2f} MB")
+        cursor.close()
+        conn.close()
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Sales per staff-hour, computed with an index-backed interval join.
+
+Each sale is matched to the shift of its staff member that contains the sale's
+timestamp. Shift.shift_period stores the shift as a tsrange, and the GiST
+index on (staff_id, shift_period) turns the match into one index probe per
+sale instead of a comparison against every shift.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import add_db_arguments, connect, params_from_args
+from schema_mode import code_column, detect_schema_mode
+
+def ensure_shift_periods(cursor):
+    """Add the shift_period range column and its GiST index to databases created before they existed.
+
+    Without the btree_gist extension the index covers shift_period only.
+    """
+    cursor.execute("""
+        ALTER TABLE Shift ADD COLUMN IF NOT EXISTS shift_period TSRANGE
+        GENERATED ALWAYS AS (tsrange(shift_date + start_time, shift_date + end_time)) STORED
+    """)
+    cursor.execute("SELECT to_regclass('idx_shift_staff_period') IS NOT NULL OR to_regclass('idx_shift_period') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+    if cursor.fetchone():
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        cursor.execute("CREATE INDEX idx_shift_staff_period ON Shift USING GIST (staff_id, shift_period)")
+    else:
+        print("btree_gist is not available; indexing shift_period only")
+        cursor.execute("CREATE INDEX idx_shift_period ON Shift USING GIST (shift_period)")
+    cursor.execute("ANALYZE Shift")
+
+def productivity_query(mode, by='staff'):
+    """Return the sales-per-staff-hour query grouped by staff member or by store"""
+    if by == 'store':
+        group_columns = f"s.{code_column(mode, 'Store')} AS store, s.store_name"
+        group_by = f"s.{code_column(mode, 'Store')}, s.store_name"
+    else:
+        group_columns = (f"s.{code_column(mode, 'Store')} AS store, st.staff_id, "
+                         "st.first_name || ' ' || st.last_name AS staff, r.role_name")
+        group_by = f"s.{code_column(mode, 'Store')}, st.staff_id, st.first_name, st.last_name, r.role_name"
+    return f"""
+        WITH shift_sales AS (
+            SELECT sh.shift_id, COUNT(*) AS transactions, SUM(t.total_amount) AS sales
+            FROM Transaction t
+            JOIN Shift sh ON sh.staff_id = t.staff_id
+             AND sh.shift_period @> (t.transaction_date + t.transaction_time)
+            WHERE t.transaction_date BETWEEN %(start)s AND %(end)s
+            GROUP BY sh.shift_id
+        )
+        SELECT {group_columns},
+               COUNT(*) AS shifts,
+               ROUND(SUM(EXTRACT(EPOCH FROM upper(sh.shift_period) - lower(sh.shift_period)) / 3600), 1) AS staff_hours,
+               COALESCE(SUM(ss.transactions), 0) AS transactions,
+               COALESCE(SUM(ss.sales), 0) AS sales,
+               ROUND(COALESCE(SUM(ss.sales), 0)
+                     / NULLIF(SUM(EXTRACT(EPOCH FROM upper(sh.shift_period) - lower(sh.shift_period)) / 3600), 0), 2)
+                   AS sales_per_staff_hour
+        FROM Shift sh
+        JOIN Staff st ON st.staff_id = sh.staff_id
+        JOIN StaffRole r ON r.role_id = st.role_id
+        JOIN Store s ON s.store_id = sh.store_id
+        LEFT JOIN shift_sales ss ON ss.shift_id = sh.shift_id
+        WHERE sh.shift_date BETWEEN %(start)s AND %(end)s
+        GROUP BY {group_by}
+        ORDER BY sales_per_staff_hour DESC NULLS LAST
+    """
+
+OFF_SHIFT_QUERY = """
+    SELECT COUNT(*) FROM Transaction t
+    WHERE t.transaction_date BETWEEN %(start)s AND %(end)s
+      AND NOT EXISTS (SELECT 1 FROM Shift sh
+                      WHERE sh.staff_id = t.staff_id
+                        AND sh.shift_period @> (t.transaction_date + t.transaction_time))
+"""
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sales per staff-hour from shifts and transactions')
+    parser.add_argument('--start', type=date.fromisoformat, default=date.min,
+                        help='First day, YYYY-MM-DD (default: all history)')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.max,
+                        help='Last day, YYYY-MM-DD (default: all history)')
+    parser.add_argument('--by', choices=['staff', 'store'], default='staff',
+                        help='Group by staff member or by store (default: staff)')
+    parser.add_argument('--limit', type=int, default=20, help='Rows to show (default: 20, 0 for all)')
+    parser.add_argument('--explain', action='store_true', help='Show the query plan instead of the report')
+    add_db_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from tabulate import tabulate
+
+    try:
+        conn = connect(params_from_args(args))
+        cursor = conn.cursor()
+        ensure_shift_periods(cursor)
+        query = productivity_query(detect_schema_mode(cursor), args.by)
+        bounds = {'start': args.start, 'end': args.end}
+
+        if args.explain:
+            cursor.execute("EXPLAIN (ANALYZE, COSTS OFF) " + query, bounds)
+            print('\n'.join(row[0] for row in cursor.fetchall()))
+            return 0
+
+        start = time.perf_counter()
+        cursor.execute(query, bounds)
+        rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+        headers = [desc[0] for desc in cursor.description]
+        print(tabulate(rows[:args.limit] if args.limit else rows, headers=headers, tablefmt="pretty"))
+        print(f"{len(rows)} rows in {elapsed * 1000:.0f} ms")
+
+        cursor.execute(OFF_SHIFT_QUERY, bounds)
+        off_shift = cursor.fetchone()[0]
+        if off_shift:
+            print(f"{off_shift} transactions are not covered by a shift of their staff member")
+        cursor.close()
+        conn.close()
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
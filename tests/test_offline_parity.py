@@ -0,0 +1,57 @@
+"""Parity of the offline DuckDB engine with PostgreSQL.
+
+Builds a Parquet snapshot of the database configured by the DB_* environment
+variables into a temporary directory and checks that the reports, the table
+counts and a few ad-hoc queries give identical rows on both engines. Skipped
+when duckdb/pyarrow are not installed or PostgreSQL is not reachable.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'scripts'))
+
+pytest.importorskip('duckdb')
+pytest.importorskip('pyarrow')
+psycopg2 = pytest.importorskip('psycopg2')
+
+from db import get_db_params
+from offline import check_parity, refresh_snapshot, snapshot_connection
+
+EXTRA_QUERIES = [
+    "SELECT transaction_date, COUNT(*), SUM(total_amount) FROM Transaction GROUP BY 1 ORDER BY 1",
+    "SELECT product_id, SUM(quantity) FROM TransactionItem GROUP BY 1 ORDER BY 1",
+]
+
+@pytest.fixture
+def conn():
+    params = get_db_params()
+    try:
+        conn = snapshot_connection(params)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not available: {str(e).strip()}")
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('transactionitem') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        conn.close()
+        pytest.skip("The OntoDb schema is not set up")
+    cursor.close()
+    yield conn
+    conn.rollback()
+    conn.close()
+
+def test_snapshot_matches_postgres(conn, tmp_path):
+    directory = str(tmp_path / 'offline')
+    written, skipped = refresh_snapshot(conn, directory)
+    assert written > 0 and skipped == 0
+
+    assert check_parity(conn, directory, EXTRA_QUERIES) == []
+
+def test_refresh_keeps_unchanged_snapshot(conn, tmp_path):
+    directory = str(tmp_path / 'offline')
+    refresh_snapshot(conn, directory)
+    written, _ = refresh_snapshot(conn, directory)
+    assert written == 0
+
+    assert check_parity(conn, directory) == []